@@ -0,0 +1,164 @@
+"""Compare parsing synthetic Legistar calendar grids with selectors for every cell
+against the single-pass LegistarSpider parser
+
+Usage: python -m benchmarks.legistar [row_count ...]
+"""
+import gc
+import sys
+from collections import defaultdict
+from timeit import default_timer
+
+from scrapy.http import HtmlResponse
+
+from city_scrapers_core.spiders import LegistarSpider
+
+REPEAT = 5
+
+URL = "https://cityscrapers.legistar.com/Calendar.aspx"
+
+HEADERS = [
+    "Name",
+    "Meeting Date",
+    '<img alt="iCalendar" src="/Images/ics.gif" />',
+    "Meeting Time",
+    "Meeting Location",
+    "Meeting Details",
+    "Agenda",
+    "Minutes",
+    "Video",
+]
+
+
+def make_row(idx):
+    guid = f"{idx:08X}-0000-4000-8000-{idx:012X}"
+    video = (
+        f"<a onclick=\"window.open('Video.aspx?Mode=Granicus&amp;ID1={idx}','video');"
+        f'return false;" href="#">Video</a>'
+        if idx % 3 == 0
+        else "Not&nbsp;available"
+    )
+    cells = [
+        f'<a href="DepartmentDetail.aspx?ID={idx % 40}&amp;GUID={guid}">'
+        f'<font color="#0000ff">Committee on Finance</font></a>',
+        f"<font>{idx % 12 + 1}/{idx % 28 + 1}/2021</font>",
+        f'<a href="View.ashx?M=IC&amp;ID={idx}&amp;GUID={guid}">'
+        f'<img alt="Export" src="/Images/ics.gif" /></a>',
+        "<font>10:00 AM</font>",
+        "<font>Council Chambers, City Hall<br />121 N LaSalle St</font>",
+        f'<a href="MeetingDetail.aspx?ID={idx}&amp;GUID={guid}">'
+        f"<font>Meeting&nbsp;details</font></a>",
+        f'<a href="View.ashx?M=A&amp;ID={idx}&amp;GUID={guid}">'
+        f"<font>Agenda</font></a>",
+        f'<a href="View.ashx?M=M&amp;ID={idx}&amp;GUID={guid}">'
+        f"<font>Minutes</font></a>",
+        video,
+    ]
+    row_class = "rgRow" if idx % 2 == 0 else "rgAltRow"
+    return f'<tr class="{row_class}">' + "".join(f"<td>{c}</td>" for c in cells)
+
+
+def make_response(count):
+    headers = "".join(f'<th class="rgHeader">{header}</th>' for header in HEADERS)
+    rows = "".join(make_row(idx) for idx in range(count))
+    body = (
+        '<html><body><table class="rgMasterTable">'
+        f"<thead><tr>{headers}</tr></thead><tbody>{rows}</tbody></table></body></html>"
+    )
+    return HtmlResponse(URL, body=body.encode("utf-8"), encoding="utf-8")
+
+
+def parse_events_selectors(spider, response):
+    """Previous LegistarSpider._parse_legistar_events, which queries each cell with
+    CSS selectors"""
+    events_table = response.css("table.rgMasterTable")[0]
+
+    headers = []
+    for header in events_table.css("th[class^='rgHeader']"):
+        header_text = (
+            " ".join(header.css("*::text").extract()).replace("&nbsp;", " ").strip()
+        )
+        header_inputs = header.css("input")
+        if header_text:
+            headers.append(header_text)
+        elif len(header_inputs) > 0:
+            headers.append(header_inputs[0].attrib["value"])
+        else:
+            headers.append(header.css("img")[0].attrib["alt"])
+
+    events = []
+    for row in events_table.css("tr.rgRow, tr.rgAltRow"):
+        try:
+            data = defaultdict(lambda: None)
+            for header, field in zip(headers, row.css("td")):
+                field_text = (
+                    " ".join(field.css("*::text").extract())
+                    .replace("&nbsp;", " ")
+                    .strip()
+                )
+                url = None
+                if len(field.css("a")) > 0:
+                    link_el = field.css("a")[0]
+                    if "onclick" in link_el.attrib and link_el.attrib[
+                        "onclick"
+                    ].startswith(("radopen('", "window.open", "OpenTelerikWindow")):
+                        url = response.urljoin(link_el.attrib["onclick"].split("'")[1])
+                    elif "href" in link_el.attrib:
+                        url = response.urljoin(link_el.attrib["href"])
+                if url:
+                    if header in ["", "ics"] and "View.ashx?M=IC" in url:
+                        header = "iCalendar"
+                        value = {"url": url}
+                    else:
+                        value = {"label": field_text, "url": url}
+                else:
+                    value = field_text
+
+                data[header] = value
+
+            ical_url = data.get("iCalendar", {}).get("url")
+            if ical_url is None or ical_url in spider._scraped_urls:
+                continue
+            else:
+                spider._scraped_urls.add(ical_url)
+            events.append(dict(data))
+        except Exception:
+            pass
+
+    return events
+
+
+def run(parse, count):
+    """Parse a new response with a new spider so that no events are deduplicated"""
+    response = make_response(count)
+    spider = LegistarSpider(name="benchmark", start_urls=[URL])
+    gc.collect()
+    start = default_timer()
+    events = parse(spider, response)
+    return events, default_timer() - start
+
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [100, 1000]
+    parsers = {
+        "Selectors": parse_events_selectors,
+        "Single pass": lambda spider, response: spider._parse_legistar_events(response),
+    }
+    for count in counts:
+        best = {}
+        outputs = {}
+        # Alternate parsers and keep the fastest run of each to reduce noise
+        for _ in range(REPEAT):
+            for label, parse in parsers.items():
+                outputs[label], elapsed = run(parse, count)
+                best[label] = min(best.get(label, elapsed), elapsed)
+        selectors_events, single_pass_events = outputs.values()
+        assert len(single_pass_events) == count
+        assert selectors_events == single_pass_events
+        print(f"{count} rows:")
+        for label, elapsed in best.items():
+            print(f"  {label}: {count / elapsed:,.0f} rows/sec, {elapsed * 1e3:.1f} ms")
+        print(f"  Speedup: {best['Selectors'] / best['Single pass']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Compare per-item overhead of the separate core pipelines against CorePipeline
+
+Usage: python -m benchmarks.pipelines [item_count]
+"""
+import gc
+import sys
+from datetime import datetime, timedelta
+from timeit import default_timer
+
+from twisted.internet.defer import succeed
+
+from city_scrapers_core.clock import RunClock
+from city_scrapers_core.items import Meeting
+from city_scrapers_core.pipelines import (
+    CorePipeline,
+    DefaultValuesPipeline,
+    MeetingPipeline,
+    OpenCivicDataPipeline,
+)
+from city_scrapers_core.spiders import CityScrapersSpider
+
+REPEAT = 10
+
+
+def make_items(count):
+    start = datetime(2020, 1, 1, 12)
+    return [
+        Meeting(
+            id=f"test/{idx}",
+            title="Board of Directors",
+            start=start + timedelta(days=idx),
+            location={"name": "City Hall", "address": "121 N LaSalle St"},
+            source="https://example.com",
+        )
+        for idx in range(count)
+    ]
+
+
+def run(pipelines, items, spider):
+    """Chain each pipeline stage with a Deferred callback like Scrapy does"""
+    results = []
+    gc.collect()
+    start = default_timer()
+    for item in items:
+        d = succeed(item)
+        for pipeline in pipelines:
+            d.addCallback(pipeline.process_item, spider)
+        d.addCallback(results.append)
+    return results, (default_timer() - start) / len(items)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    spider = CityScrapersSpider(name="benchmark", agency="Benchmark Agency")
+    # Spiders run by a crawler share the crawler's clock
+    spider.clock = RunClock()
+    configs = {
+        "Separate pipelines": [
+            DefaultValuesPipeline(),
+            MeetingPipeline(),
+            OpenCivicDataPipeline(),
+        ],
+        "CorePipeline": [CorePipeline()],
+    }
+    best = {}
+    outputs = {}
+    # Alternate configurations and keep the fastest run of each to reduce noise
+    for _ in range(REPEAT):
+        for label, pipelines in configs.items():
+            outputs[label], per_item = run(pipelines, make_items(count), spider)
+            best[label] = min(best.get(label, per_item), per_item)
+    for label, per_item in best.items():
+        print(f"{label}: {1 / per_item:,.0f} items/sec, {per_item * 1e6:.1f} µs/item")
+    saved = best["Separate pipelines"] - best["CorePipeline"]
+    print(
+        f"Overhead saved: {saved * 1e6:.1f} µs/item "
+        f"({saved / best['Separate pipelines']:.0%})"
+    )
+    for separate_item, core_item in zip(*outputs.values()):
+        for key in ["_id", "updated_at"]:
+            separate_item.pop(key)
+            core_item.pop(key)
+        assert separate_item == core_item
+    assert saved > 0, "CorePipeline is slower than the separate pipelines"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Compare ValidationPipeline throughput against building a Draft7Validator per item
+
+Usage: python -m benchmarks.validation [item_count]
+"""
+import sys
+from datetime import datetime, timedelta
+from timeit import default_timer
+
+from jsonschema.validators import Draft7Validator
+
+from city_scrapers_core.items import Meeting
+from city_scrapers_core.pipelines import ValidationPipeline
+
+
+def make_items(count):
+    start = datetime(2020, 1, 1, 12)
+    return [
+        Meeting(
+            id=f"test/{idx}",
+            title="Board of Directors",
+            description="",
+            classification="Board",
+            status="tentative",
+            start=start + timedelta(days=idx),
+            end=start + timedelta(days=idx, hours=2),
+            all_day=False,
+            time_notes="",
+            location={"name": "City Hall", "address": "121 N LaSalle St"},
+            links=[{"href": "https://example.com/agenda.pdf", "title": "Agenda"}],
+            # Include some invalid values so error handling is measured as well
+            source="https://example.com" if idx % 10 else None,
+        )
+        for idx in range(count)
+    ]
+
+
+def draft7_process_item(pipeline, item):
+    """Previous implementation of ValidationPipeline.process_item"""
+    item_dict = dict(item)
+    item_dict["start"] = item_dict["start"].isoformat()[:19]
+    item_dict["end"] = item_dict["end"].isoformat()[:19]
+    validator = Draft7Validator(item.jsonschema)
+    props = list(item.jsonschema["properties"].keys())
+    errors = list(validator.iter_errors(item_dict))
+    error_props = [error.path[0] for error in errors if len(error.path) > 0]
+    for prop in props:
+        pipeline.error_count[prop] += 1 if prop in error_props else 0
+    pipeline.item_count += 1
+    return item
+
+
+def run(label, process_item, items):
+    pipeline = ValidationPipeline()
+    pipeline.open_spider(None)
+    start = default_timer()
+    for item in items:
+        process_item(pipeline, item)
+    elapsed = default_timer() - start
+    print(f"{label}: {len(items) / elapsed:,.0f} items/sec")
+    return dict(pipeline.error_count)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    items = make_items(count)
+    draft7_errors = run("Draft7Validator per item", draft7_process_item, items)
+    compiled_errors = run(
+        "Compiled SchemaChecker",
+        lambda pipeline, item: pipeline.process_item(item, None),
+        items,
+    )
+    assert draft7_errors == compiled_errors
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+from collections import OrderedDict
+from datetime import datetime, tzinfo
+from typing import Dict, Optional, Tuple
+
+import pytz
+from scrapy import Spider
+from scrapy.crawler import Crawler
+
+# Maximum number of UTC offsets cached by each clock
+OFFSET_CACHE_SIZE = 4096
+
+
+class RunClock:
+    """Clock for a single run with a cache of timezones and UTC offsets. The current
+    time is read once, so every spider, pipeline and extension using the same clock
+    compares items against the same cutoff, and localizing datetimes only calls pytz
+    once for each timezone and minute.
+
+    :param now: Naive local datetime to use as the current time, defaults to now
+    """
+
+    def __init__(self, now: Optional[datetime] = None):
+        self.now = now or datetime.now()
+        self.now_str = self.now.isoformat()[:19]
+        self.timezones: Dict[str, tzinfo] = {}
+        self.offsets: "OrderedDict[Tuple[str, datetime], str]" = OrderedDict()
+
+    @classmethod
+    def from_crawler(cls, crawler: Crawler) -> "RunClock":
+        """Get the clock attached to a crawler, creating it the first time
+
+        :param crawler: Current scrapy crawler
+        :return: Clock shared by everything using the crawler
+        """
+        clock = getattr(crawler, "city_scrapers_clock", None)
+        if not isinstance(clock, cls):
+            clock = cls()
+            crawler.city_scrapers_clock = clock
+        return clock
+
+    @classmethod
+    def from_spider(cls, spider: Spider) -> "RunClock":
+        """Get the clock of a spider's run, or a clock for the current time if the
+        spider isn't being run by a crawler, like in tests
+
+        :param spider: Spider object
+        :return: Clock for the spider
+        """
+        clock = getattr(spider, "clock", None)
+        if isinstance(clock, cls):
+            return clock
+        return cls()
+
+    def timezone(self, tz_name: str) -> tzinfo:
+        """Get a pytz timezone, only looking it up once
+
+        :param tz_name: Name of the timezone
+        :return: pytz timezone
+        """
+        tz = self.timezones.get(tz_name)
+        if tz is None:
+            tz = pytz.timezone(tz_name)
+            self.timezones[tz_name] = tz
+        return tz
+
+    def localized_now(self, tz_name: str) -> datetime:
+        """Get the current time of the run localized to a timezone
+
+        :param tz_name: Name of the timezone
+        :return: Timezone-aware current datetime
+        """
+        return self.timezone(tz_name).localize(self.now)
+
+    def isoformat(self, tz_name: str, dt: datetime) -> str:
+        """Localize a naive datetime to a timezone and format it as an ISO 8601 string
+        with second precision. This matches
+        ``tz.localize(dt).isoformat(timespec="seconds")``, but the UTC offset is only
+        calculated once for each minute. Offsets of the ``OFFSET_CACHE_SIZE`` most
+        recently used minutes are cached, so long runs don't grow the cache.
+
+        :param tz_name: Name of the timezone
+        :param dt: Naive datetime to localize
+        :return: ISO 8601 datetime string with a UTC offset
+        """
+        if dt.tzinfo is not None:
+            return self.timezone(tz_name).localize(dt).isoformat(timespec="seconds")
+        key = (tz_name, dt.replace(second=0, microsecond=0))
+        offset = self.offsets.get(key)
+        if offset is None:
+            offset = self.timezone(tz_name).localize(key[1]).isoformat()[19:]
+            self.offsets[key] = offset
+            if len(self.offsets) > OFFSET_CACHE_SIZE:
+                self.offsets.popitem(last=False)
+        else:
+            self.offsets.move_to_end(key)
+        return dt.isoformat(timespec="seconds") + offset
+
+    def now_isoformat(self, tz_name: str) -> str:
+        """Format the current time of the run as an ISO 8601 string in a timezone
+
+        :param tz_name: Name of the timezone
+        :return: ISO 8601 datetime string with a UTC offset
+        """
+        return self.isoformat(tz_name, self.now)
@@ -1,11 +1,23 @@
+import heapq
 import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from hashlib import sha1
 from operator import itemgetter
+from tempfile import TemporaryDirectory
 from urllib.parse import quote, urlparse
 
 from scrapy.commands import ScrapyCommand
 from scrapy.exceptions import UsageError
 
+from ..extensions.feed_index import MAX_DAYS_PREVIOUS, get_index_key, is_recent_index
+from ..pipelines.diff import get_delta_key
+from ..pipelines.ocd import get_output_format
+
+logger = logging.getLogger(__name__)
+
 
 class Command(ScrapyCommand):
     requires_project = True
@@ -42,32 +54,46 @@ class Command(ScrapyCommand):
             aws_secret_access_key=self.settings.get("AWS_SECRET_ACCESS_KEY"),
         )
 
-        max_days_previous = 3
-        days_previous = 0
-        prefix_objects = []
-        while days_previous <= max_days_previous:
-            prefix_objects = client.list_objects(
-                Bucket=bucket,
-                Prefix=(datetime.now() - timedelta(days=days_previous)).strftime(
-                    feed_prefix
-                ),
-            ).get("Contents", [])
-            if len(prefix_objects) > 0:
-                break
-            days_previous += 1
-
-        spider_keys = self.get_spider_paths([obj["Key"] for obj in prefix_objects])
-        meetings = []
-        for key in spider_keys:
+        def read_object(key):
+            try:
+                return (
+                    client.get_object(Bucket=bucket, Key=key)
+                    .get("Body")
+                    .read()
+                    .decode("utf-8")
+                )
+            except client.exceptions.NoSuchKey:
+                return None
+
+        def write_object(key, text):
+            client.put_object(Body=text.encode(), Bucket=bucket, Key=key)
+
+        if self.index_prefix:
+            spider_keys, fingerprints = self.get_index_paths(read_object)
+        else:
+            days_previous = 0
+            prefix_objects = []
+            while days_previous <= MAX_DAYS_PREVIOUS:
+                prefix_objects = client.list_objects(
+                    Bucket=bucket,
+                    Prefix=(datetime.now() - timedelta(days=days_previous)).strftime(
+                        feed_prefix
+                    ),
+                ).get("Contents", [])
+                if len(prefix_objects) > 0:
+                    break
+                days_previous += 1
+
+            spider_keys = self.get_spider_paths([obj["Key"] for obj in prefix_objects])
+            fingerprints = {obj["Key"]: obj.get("ETag") for obj in prefix_objects}
+
+        def fetch_feed(key):
             feed_text = (
                 client.get_object(Bucket=bucket, Key=key)
                 .get("Body")
                 .read()
                 .decode("utf-8")
             )
-            meetings.extend(
-                [json.loads(line) for line in feed_text.split("\n") if line.strip()]
-            )
             # Copy latest results for each spider
             spider_key = key.split("/")[-1]
             client.copy_object(
@@ -75,6 +101,24 @@ class Command(ScrapyCommand):
                 Key=spider_key,
                 CopySource={"Bucket": bucket, "Key": key},
             )
+            return self.parse_feed(feed_text)
+
+        fetch_feed = self.load_manifest(fetch_feed, fingerprints, read_object)
+        if self.streaming:
+
+            def upload_file(key, file):
+                client.upload_fileobj(
+                    file, bucket, key, ExtraArgs={"CacheControl": "no-cache"}
+                )
+
+            feed_lines, latest_hash = self.merge_feeds(
+                spider_keys, fetch_feed, upload_file
+            )
+            self.save_manifest(write_object, feed_lines, latest_hash)
+            self.combine_deltas(read_object, write_object)
+            return
+
+        meetings = self.fetch_feeds(spider_keys, fetch_feed)
         meetings = sorted(meetings, key=itemgetter(self.start_key))
         yesterday_iso = (datetime.now() - timedelta(days=1)).isoformat()[:19]
         upcoming = [
@@ -83,8 +127,9 @@ class Command(ScrapyCommand):
             if meeting[self.start_key][:19] > yesterday_iso
         ]
 
+        latest_body = "\n".join([json.dumps(meeting) for meeting in meetings]).encode()
         client.put_object(
-            Body=("\n".join([json.dumps(meeting) for meeting in meetings])).encode(),
+            Body=latest_body,
             Bucket=bucket,
             CacheControl="no-cache",
             Key="latest.json",
@@ -95,8 +140,15 @@ class Command(ScrapyCommand):
             CacheControl="no-cache",
             Key="upcoming.json",
         )
+        self.save_manifest(
+            write_object,
+            self.get_manifest_lines(meetings),
+            sha1(latest_body).hexdigest(),
+        )
+        self.combine_deltas(read_object, write_object)
 
     def combine_azure(self):
+        from azure.core.exceptions import ResourceNotFoundError
         from azure.storage.blob import ContainerClient, ContentSettings
 
         feed_uri = self.settings.get("FEED_URI")
@@ -109,30 +161,52 @@ class Command(ScrapyCommand):
             credential=account_key,
         )
 
-        max_days_previous = 3
-        days_previous = 0
-        prefix_blobs = []
-        while days_previous <= max_days_previous:
-            prefix_blobs = [
-                blob
-                for blob in container_client.list_blobs(
-                    name_starts_with=(
-                        datetime.now() - timedelta(days=days_previous)
-                    ).strftime(feed_prefix)
+        def read_object(blob_name):
+            try:
+                return (
+                    container_client.get_blob_client(blob_name)
+                    .download_blob()
+                    .content_as_text()
                 )
-            ]
-            if len(prefix_blobs) > 0:
-                break
-            days_previous += 1
+            except ResourceNotFoundError:
+                return None
 
-        spider_blob_names = self.get_spider_paths([blob.name for blob in prefix_blobs])
-        meetings = []
-        for blob_name in spider_blob_names:
+        def write_object(blob_name, text):
+            container_client.upload_blob(blob_name, text, overwrite=True)
+
+        if self.index_prefix:
+            spider_blob_names, fingerprints = self.get_index_paths(read_object)
+        else:
+            days_previous = 0
+            prefix_blobs = []
+            while days_previous <= MAX_DAYS_PREVIOUS:
+                prefix_blobs = [
+                    blob
+                    for blob in container_client.list_blobs(
+                        name_starts_with=(
+                            datetime.now() - timedelta(days=days_previous)
+                        ).strftime(feed_prefix)
+                    )
+                ]
+                if len(prefix_blobs) > 0:
+                    break
+                days_previous += 1
+
+            spider_blob_names = self.get_spider_paths(
+                [blob.name for blob in prefix_blobs]
+            )
+            fingerprints = {
+                blob.name: (
+                    bytes(blob.content_settings.content_md5).hex()
+                    if blob.content_settings.content_md5
+                    else blob.etag
+                )
+                for blob in prefix_blobs
+            }
+
+        def fetch_feed(blob_name):
             feed_blob = container_client.get_blob_client(blob_name)
             feed_text = feed_blob.download_blob().content_as_text()
-            meetings.extend(
-                [json.loads(line) for line in feed_text.split("\n") if line]
-            )
             # Copy latest results for each spider
             spider_blob_name = blob_name.split("/")[-1]
             spider_blob = container_client.get_blob_client(spider_blob_name)
@@ -140,6 +214,27 @@ class Command(ScrapyCommand):
                 f"https://{account_name}.blob.core.windows.net"
                 f"/{quote(container)}/{blob_name}"
             )
+            return self.parse_feed(feed_text)
+
+        fetch_feed = self.load_manifest(fetch_feed, fingerprints, read_object)
+        if self.streaming:
+
+            def upload_file(blob_name, file):
+                container_client.upload_blob(
+                    blob_name,
+                    file,
+                    content_settings=ContentSettings(cache_control="no-cache"),
+                    overwrite=True,
+                )
+
+            feed_lines, latest_hash = self.merge_feeds(
+                spider_blob_names, fetch_feed, upload_file
+            )
+            self.save_manifest(write_object, feed_lines, latest_hash)
+            self.combine_deltas(read_object, write_object)
+            return
+
+        meetings = self.fetch_feeds(spider_blob_names, fetch_feed)
         meetings = sorted(meetings, key=itemgetter(self.start_key))
         yesterday_iso = (datetime.now() - timedelta(days=1)).isoformat()[:19]
         upcoming = [
@@ -148,9 +243,10 @@ class Command(ScrapyCommand):
             if meeting[self.start_key][:19] > yesterday_iso
         ]
 
+        latest_text = "\n".join([json.dumps(meeting) for meeting in meetings])
         container_client.upload_blob(
             "latest.json",
-            "\n".join([json.dumps(meeting) for meeting in meetings]),
+            latest_text,
             content_settings=ContentSettings(cache_control="no-cache"),
             overwrite=True,
         )
@@ -161,6 +257,12 @@ class Command(ScrapyCommand):
             content_settings=ContentSettings(cache_control="no-cache"),
             overwrite=True,
         )
+        self.save_manifest(
+            write_object,
+            self.get_manifest_lines(meetings),
+            sha1(latest_text.encode()).hexdigest(),
+        )
+        self.combine_deltas(read_object, write_object)
 
     def combine_gcs(self):
         from google.cloud import storage
@@ -171,30 +273,59 @@ class Command(ScrapyCommand):
         client = storage.Client()
         bucket = client.bucket(bucket_name)
 
-        max_days_previous = 3
-        days_previous = 0
-        prefix_blobs = []
-        while days_previous <= max_days_previous:
-            prefix_blobs = client.list_blobs(
-                bucket,
-                prefix=(datetime.now() - timedelta(days=days_previous)).strftime(
-                    feed_prefix
-                ),
-            )
-            prefix_blobs = [blob for blob in prefix_blobs]
-            if len(prefix_blobs) > 0:
-                break
-            days_previous += 1
+        def read_object(blob_name):
+            blob = bucket.get_blob(blob_name)
+            if blob is None:
+                return None
+            return blob.download_as_bytes().decode("utf-8")
 
-        meetings = []
-        for blob in prefix_blobs:
+        def write_object(blob_name, text):
+            bucket.blob(blob_name).upload_from_string(text.encode())
+
+        if self.index_prefix:
+            blob_names, fingerprints = self.get_index_paths(read_object)
+        else:
+            days_previous = 0
+            prefix_blobs = []
+            while days_previous <= MAX_DAYS_PREVIOUS:
+                prefix_blobs = client.list_blobs(
+                    bucket,
+                    prefix=(datetime.now() - timedelta(days=days_previous)).strftime(
+                        feed_prefix
+                    ),
+                )
+                prefix_blobs = [blob for blob in prefix_blobs]
+                if len(prefix_blobs) > 0:
+                    break
+                days_previous += 1
+
+            blob_names = [blob.name for blob in prefix_blobs]
+            fingerprints = {
+                blob.name: blob.md5_hash or blob.etag for blob in prefix_blobs
+            }
+
+        def fetch_feed(blob_name):
+            blob = bucket.blob(blob_name)
             feed_text = blob.download_as_bytes().decode("utf-8")
-            meetings.extend(
-                [json.loads(line) for line in feed_text.split("\n") if line.strip()]
-            )
             # Copy latest results for each spider
-            spider_name = blob.name.split("/")[-1]
+            spider_name = blob_name.split("/")[-1]
             bucket.copy_blob(blob, bucket, new_name=spider_name)
+            return self.parse_feed(feed_text)
+
+        fetch_feed = self.load_manifest(fetch_feed, fingerprints, read_object)
+        if self.streaming:
+
+            def upload_file(blob_name, file):
+                bucket.blob(blob_name).upload_from_file(file)
+
+            feed_lines, latest_hash = self.merge_feeds(
+                blob_names, fetch_feed, upload_file
+            )
+            self.save_manifest(write_object, feed_lines, latest_hash)
+            self.combine_deltas(read_object, write_object)
+            return
+
+        meetings = self.fetch_feeds(blob_names, fetch_feed)
         meetings = sorted(meetings, key=itemgetter(self.start_key))
         yesterday_iso = (datetime.now() - timedelta(days=1)).isoformat()[:19]
         upcoming = [
@@ -203,14 +334,246 @@ class Command(ScrapyCommand):
             if meeting[self.start_key][:19] > yesterday_iso
         ]
 
+        latest_body = "\n".join([json.dumps(meeting) for meeting in meetings]).encode()
         new_meetings_blob = bucket.blob("latest.json")
-        new_meetings_blob.upload_from_string(
-            "\n".join([json.dumps(meeting) for meeting in meetings]).encode()
-        )
+        new_meetings_blob.upload_from_string(latest_body)
         new_upcoming_blob = bucket.blob("upcoming.json")
         new_upcoming_blob.upload_from_string(
             "\n".join([json.dumps(meeting) for meeting in upcoming]).encode()
         )
+        self.save_manifest(
+            write_object,
+            self.get_manifest_lines(meetings),
+            sha1(latest_body).hexdigest(),
+        )
+        self.combine_deltas(read_object, write_object)
+
+    def fetch_feeds(self, keys, fetch_feed):
+        """Run ``fetch_feed`` for each key on a bounded thread pool and return all
+        meetings in the same order as a serial loop over ``keys`` would.
+
+        The number of workers is set by ``CITY_SCRAPERS_COMBINE_WORKERS``.
+        """
+        meetings = []
+        with ThreadPoolExecutor(max_workers=self.combine_workers) as executor:
+            for feed_meetings in executor.map(fetch_feed, keys):
+                meetings.extend(feed_meetings)
+        return meetings
+
+    def merge_feeds(self, keys, fetch_feed, upload_file):
+        """Sort each feed separately into a local spill file, then merge the sorted
+        files into ``latest.json`` and ``upcoming.json`` in a single pass.
+
+        Only the feeds currently being fetched are held in memory, and the combined
+        files are passed to ``upload_file`` as file objects so that each backend can
+        use a multipart or chunked upload. Output matches :meth:`fetch_feeds` followed
+        by a stable sort.
+
+        Returns the line numbers of each key's meetings in ``latest.json`` and the SHA1
+        hash of ``latest.json`` for the manifest.
+        """
+        start_key = self.start_key
+        yesterday_iso = (datetime.now() - timedelta(days=1)).isoformat()[:19]
+        with TemporaryDirectory() as tmp_dir:
+
+            def spill_feed(idx_key):
+                idx, key = idx_key
+                feed_path = os.path.join(tmp_dir, f"{idx}.jsonl")
+                meetings = sorted(fetch_feed(key), key=itemgetter(start_key))
+                with open(feed_path, "w", encoding="utf-8") as f:
+                    for meeting in meetings:
+                        # Prefix each line with its sort key to avoid parsing on merge
+                        f.write(f"{meeting[start_key]}\t{idx}\t{json.dumps(meeting)}\n")
+                return feed_path
+
+            with ThreadPoolExecutor(max_workers=self.combine_workers) as executor:
+                feed_paths = list(executor.map(spill_feed, enumerate(keys)))
+
+            latest_path = os.path.join(tmp_dir, "latest.json")
+            upcoming_path = os.path.join(tmp_dir, "upcoming.json")
+            feed_files = [open(path, "r", encoding="utf-8") for path in feed_paths]
+            feed_lines = {key: [] for key in keys}
+            latest_hash = sha1()
+            try:
+                with open(latest_path, "wb") as latest, open(
+                    upcoming_path, "wb"
+                ) as upcoming:
+                    latest_sep = upcoming_sep = b""
+                    for line_num, line in enumerate(
+                        heapq.merge(
+                            *feed_files, key=lambda line: line.split("\t", 1)[0]
+                        )
+                    ):
+                        meeting_start, idx, meeting_str = line.rstrip("\n").split(
+                            "\t", 2
+                        )
+                        feed_lines[keys[int(idx)]].append(line_num)
+                        meeting_bytes = meeting_str.encode()
+                        latest.write(latest_sep + meeting_bytes)
+                        latest_hash.update(latest_sep + meeting_bytes)
+                        latest_sep = b"\n"
+                        if meeting_start[:19] > yesterday_iso:
+                            upcoming.write(upcoming_sep + meeting_bytes)
+                            upcoming_sep = b"\n"
+            finally:
+                for feed_file in feed_files:
+                    feed_file.close()
+
+            for key, path in [
+                ("latest.json", latest_path),
+                ("upcoming.json", upcoming_path),
+            ]:
+                with open(path, "rb") as f:
+                    upload_file(key, f)
+        return feed_lines, latest_hash.hexdigest()
+
+    def load_manifest(self, fetch_feed, fingerprints, read_object):
+        """Wrap ``fetch_feed`` so that feeds with an unchanged fingerprint (ETag or MD5)
+        are read from the previous ``latest.json`` instead of downloaded.
+
+        The manifest is stored at the key set in ``CITY_SCRAPERS_COMBINE_MANIFEST``. It
+        maps each spider to its latest key, fingerprint, and the lines of its meetings
+        in ``latest.json``, along with a hash of that ``latest.json``. The previous
+        ``latest.json`` is read once for all unchanged feeds, and only used if it still
+        matches the hash. If the setting is empty ``fetch_feed`` is returned unchanged.
+        """
+        self._manifest = None
+        if not self.manifest_key:
+            return fetch_feed
+        manifest_text = read_object(self.manifest_key)
+        previous = json.loads(manifest_text) if manifest_text else {}
+        previous_spiders = previous.get("spiders", {})
+        self._manifest = {}
+        self._manifest_feeds = {}
+        self._manifest_reused = set()
+
+        def get_unchanged_entry(key):
+            entry = previous_spiders.get(key.split("/")[-1]) or {}
+            fingerprint = fingerprints.get(key)
+            if (
+                fingerprint
+                and entry.get("fingerprint") == fingerprint
+                and entry.get("lines") is not None
+            ):
+                return entry
+
+        previous_lines = {}
+        if any(get_unchanged_entry(key) for key in fingerprints):
+            latest_text = read_object("latest.json")
+            if latest_text is not None and sha1(
+                latest_text.encode()
+            ).hexdigest() == previous.get("latest"):
+                latest_lines = latest_text.split("\n")
+                # Only keep the lines of unchanged feeds while feeds are combined
+                previous_lines = {
+                    spider_name: [latest_lines[line] for line in entry["lines"]]
+                    for spider_name, entry in previous_spiders.items()
+                    if entry.get("lines") is not None
+                }
+                del latest_text, latest_lines
+
+        def manifest_fetch_feed(key):
+            spider_name = key.split("/")[-1]
+            if get_unchanged_entry(key) and spider_name in previous_lines:
+                meetings = [json.loads(line) for line in previous_lines[spider_name]]
+                self._manifest_reused.add(spider_name)
+            else:
+                meetings = fetch_feed(key)
+            self._manifest[spider_name] = {
+                "key": key,
+                "fingerprint": fingerprints.get(key),
+            }
+            self._manifest_feeds[key] = meetings
+            return meetings
+
+        return manifest_fetch_feed
+
+    def get_manifest_lines(self, meetings):
+        """Get the line numbers in ``latest.json`` of each combined feed's meetings from
+        the sorted list of all meetings, or ``None`` if no manifest is configured
+        """
+        if self._manifest is None:
+            return None
+        feed_keys = {
+            id(meeting): key
+            for key, feed_meetings in self._manifest_feeds.items()
+            for meeting in feed_meetings
+        }
+        lines = {key: [] for key in self._manifest_feeds}
+        for line, meeting in enumerate(meetings):
+            lines[feed_keys[id(meeting)]].append(line)
+        return lines
+
+    def save_manifest(self, write_object, feed_lines, latest_hash):
+        """Write the manifest of feeds combined in this run if one is configured, with
+        the lines of each feed's meetings in ``latest.json`` and its SHA1 hash. Must be
+        called after ``latest.json`` is uploaded.
+        """
+        if self._manifest is None:
+            return
+        for entry in self._manifest.values():
+            entry["lines"] = feed_lines.get(entry["key"], [])
+        write_object(
+            self.manifest_key,
+            json.dumps({"latest": latest_hash, "spiders": self._manifest}),
+        )
+        logger.info(
+            f"Reused {len(self._manifest_reused)} of {len(self._manifest)} feeds "
+            "from manifest"
+        )
+
+    def combine_deltas(self, read_object, write_object):
+        """Combine the most recent delta feed from :class:`DiffPipeline` for each spider
+        into ``delta.json`` if ``CITY_SCRAPERS_DIFF_DELTA_PREFIX`` is set. Deltas are
+        dated by the start of their run, so the same days are checked as for feeds.
+        """
+        if not self.settings.get("CITY_SCRAPERS_DIFF_DELTA_PREFIX"):
+            return
+        now = datetime.now()
+
+        def read_delta(spider):
+            for days_previous in range(MAX_DAYS_PREVIOUS + 1):
+                delta_text = read_object(
+                    get_delta_key(
+                        self.settings, spider, now - timedelta(days=days_previous)
+                    )
+                )
+                if delta_text is not None:
+                    return self.parse_feed(delta_text)
+            return []
+
+        changes = self.fetch_feeds(
+            self.crawler_process.spider_loader.list(), read_delta
+        )
+        start_key = self.start_key
+        changes = sorted(changes, key=lambda change: change["meeting"][start_key])
+        write_object("delta.json", "\n".join(json.dumps(change) for change in changes))
+
+    def parse_feed(self, feed_text):
+        """Parse a JSON lines feed into a list of meeting dicts"""
+        return [json.loads(line) for line in feed_text.split("\n") if line.strip()]
+
+    def get_index_paths(self, read_object):
+        """Get the most recent scraper results for each spider from the index objects
+        written by :class:`FeedIndexExtension`, along with their fingerprints. Like
+        listing feeds, only feeds updated within ``MAX_DAYS_PREVIOUS`` days are used.
+        """
+        spiders = self.crawler_process.spider_loader.list()
+
+        def read_index(spider):
+            index_text = read_object(get_index_key(self.settings, spider))
+            return json.loads(index_text) if index_text else None
+
+        with ThreadPoolExecutor(max_workers=self.combine_workers) as executor:
+            indexes = [
+                index
+                for index in executor.map(read_index, spiders)
+                if index and is_recent_index(index)
+            ]
+        return (
+            [index["key"] for index in indexes],
+            {index["key"]: index.get("fingerprint") for index in indexes},
+        )
 
     def get_spider_paths(self, path_list):
         """Get a list of the most recent scraper results for each spider"""
@@ -221,9 +584,24 @@ class Command(ScrapyCommand):
                 spider_paths.append(sorted(all_spider_paths)[-1])
         return spider_paths
 
+    @property
+    def combine_workers(self):
+        return max(self.settings.getint("CITY_SCRAPERS_COMBINE_WORKERS", 8), 1)
+
+    @property
+    def index_prefix(self):
+        return self.settings.get("CITY_SCRAPERS_FEED_INDEX_PREFIX")
+
+    @property
+    def manifest_key(self):
+        return self.settings.get("CITY_SCRAPERS_COMBINE_MANIFEST")
+
+    @property
+    def streaming(self):
+        return self.settings.getbool("CITY_SCRAPERS_COMBINE_STREAMING")
+
     @property
     def start_key(self):
-        pipelines = self.settings.get("ITEM_PIPELINES", {})
-        if "city_scrapers_core.pipelines.OpenCivicDataPipeline" in pipelines:
+        if get_output_format(self.settings) == "ocd":
             return "start_time"
         return "start"
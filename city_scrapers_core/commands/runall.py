@@ -11,6 +11,11 @@ class Command(ScrapyCommand):
         return "Run all spiders in a project"
 
     def run(self, args, opts):
+        # Share storage clients and listings across DiffPipeline instances
+        self.settings.setdefault("CITY_SCRAPERS_DIFF_SHARED_LOADER", True)
+        # Don't store empty feeds from spiders closed when DiffPipeline fails to load
+        # previous results, unless the project enables them
+        self.settings.set("FEED_STORE_EMPTY", False, priority="default")
         for spider in self.crawler_process.spider_loader.list():
             self.crawler_process.crawl(spider)
         self.crawler_process.start()
@@ -1,9 +1,16 @@
+import json
 import logging
 import os
+import subprocess
+import sys
 from importlib import import_module
+from tempfile import TemporaryDirectory
+from typing import Dict, List
 
 from scrapy.commands import ScrapyCommand
+from scrapy.crawler import Crawler
 
+from ..middlewares import FixtureReplayMiddleware
 from ..pipelines import ValidationPipeline
 
 logger = logging.getLogger(__name__)
@@ -26,9 +33,33 @@ class Command(ScrapyCommand):
             action="store_true",
             help="Run validation on all scrapers",
         )
+        parser.add_argument(
+            "--workers",
+            dest="workers",
+            type=int,
+            default=1,
+            help="Number of processes to split spiders across",
+        )
+        parser.add_argument(
+            "--fixtures",
+            dest="fixtures",
+            action="store_true",
+            help="Replay test fixtures instead of requesting pages from the network",
+        )
+        parser.add_argument(
+            "--report",
+            dest="report",
+            help="Path to write a JSON report of validation results for all spiders",
+        )
 
     def run(self, args, opts):
         self._add_validation_pipeline()
+        # Always validate every item, even if sampling is configured for production or
+        # in a spider's custom_settings
+        self.settings.set("CITY_SCRAPERS_VALIDATION_SAMPLE_RATE", 1, priority="cmdline")
+        self.settings.set(
+            "CITY_SCRAPERS_VALIDATION_TIME_FRACTION", 0, priority="cmdline"
+        )
         spider_list = self.crawler_process.spider_loader.list()
         spiders = [spider for spider in args if spider in spider_list]
         if len(spiders) == 0 and not opts.all:
@@ -36,9 +67,108 @@ class Command(ScrapyCommand):
             return
         elif opts.all:
             spiders = spider_list
+        if opts.workers > 1 and len(spiders) > 1:
+            summaries = self.run_shards(spiders, opts)
+        else:
+            if opts.fixtures:
+                self._add_fixture_replay()
+            summaries = self.run_spiders(spiders)
+        failed = [summary["spider"] for summary in summaries if not summary["passed"]]
+        logger.info(
+            f"Validated {len(summaries)} spiders, {len(failed)} failed"
+            + (f": {', '.join(failed)}" if failed else "")
+        )
+        if opts.report:
+            self.write_report(opts.report, summaries)
+        if failed:
+            self.exitcode = 1
+
+    def run_spiders(self, spiders: List[str]) -> List[Dict]:
+        """Run spiders in the current process and collect their validation summaries
+
+        :param spiders: Names of spiders to run
+        :return: List of validation summaries
+        """
+        crawlers = []
         for spider in spiders:
-            self.crawler_process.crawl(spider)
+            crawler = self.crawler_process.create_crawler(spider)
+            crawlers.append(crawler)
+            self.crawler_process.crawl(crawler)
         self.crawler_process.start()
+        return [self.get_summary(crawler) for crawler in crawlers]
+
+    def run_shards(self, spiders: List[str], opts) -> List[Dict]:
+        """Split spiders into shards and validate each shard in a separate process
+
+        :param spiders: Names of spiders to run
+        :param opts: Command options
+        :return: List of validation summaries from all shards sorted by spider
+        """
+        workers = min(opts.workers, len(spiders))
+        shards = [spiders[idx::workers] for idx in range(workers)]
+        summaries = []
+        with TemporaryDirectory() as report_dir:
+            processes = []
+            for idx, shard in enumerate(shards):
+                report_path = os.path.join(report_dir, f"shard-{idx}.json")
+                cmd = [sys.executable, "-m", "scrapy", "validate", *shard]
+                cmd.extend(["--report", report_path])
+                cmd.extend(["-L", self.settings.get("LOG_LEVEL")])
+                if opts.fixtures:
+                    cmd.append("--fixtures")
+                for setting in opts.set or []:
+                    cmd.extend(["-s", setting])
+                processes.append((shard, report_path, subprocess.Popen(cmd)))
+            for shard, report_path, process in processes:
+                process.wait()
+                try:
+                    with open(report_path, "r") as f:
+                        summaries.extend(json.load(f)["spiders"])
+                except (OSError, ValueError):
+                    summaries.extend(
+                        {
+                            "spider": spider,
+                            "item_count": 0,
+                            "passed": False,
+                            "error": f"Worker exited with code {process.returncode}",
+                        }
+                        for spider in shard
+                    )
+        return sorted(summaries, key=lambda summary: summary["spider"])
+
+    def get_summary(self, crawler: Crawler) -> Dict:
+        """Get the validation summary stored in a crawler's stats
+
+        :param crawler: Crawler that has finished running
+        :return: Validation summary, or a failing summary if the spider didn't finish
+        """
+        stats = getattr(crawler, "stats", None)
+        summary = stats.get_value("validation/summary") if stats else None
+        if summary is None:
+            return {
+                "spider": crawler.spidercls.name,
+                "item_count": 0,
+                "passed": False,
+                "error": "Spider did not finish validation",
+            }
+        return summary
+
+    def write_report(self, report_path: str, summaries: List[Dict]):
+        """Write a JSON report combining the validation summaries of all spiders
+
+        :param report_path: Path to write the report to
+        :param summaries: Validation summaries of each spider
+        """
+        report = {
+            "spider_count": len(summaries),
+            "item_count": sum(summary["item_count"] for summary in summaries),
+            "failed": [
+                summary["spider"] for summary in summaries if not summary["passed"]
+            ],
+            "spiders": summaries,
+        }
+        with open(report_path, "w") as f:
+            json.dump(report, f, indent=2)
 
     def _add_validation_pipeline(self):
         """Add validation pipeline to pipelines if not already present"""
@@ -52,9 +182,27 @@ class Command(ScrapyCommand):
         if len(pipelines.keys()) > 0:
             priority = max(pipelines.values()) + 1
         self.settings.set("ITEM_PIPELINES", {**pipelines, **{fullname: priority}})
-        self.settings.set("CITY_SCRAPERS_ENFORCE_VALIDATION", True)
+        self.settings.set("CITY_SCRAPERS_ENFORCE_VALIDATION", True, priority="cmdline")
+
+    def _add_fixture_replay(self):
+        """Add middleware replaying test fixtures instead of using the network"""
+        middlewares = self.settings.get("DOWNLOADER_MIDDLEWARES", {})
+        fullname = (
+            f"{FixtureReplayMiddleware.__module__}.{FixtureReplayMiddleware.__name__}"
+        )
+        # Run before other middlewares so that robots.txt isn't requested
+        self.settings.set("DOWNLOADER_MIDDLEWARES", {**middlewares, fullname: 50})
+        self.settings.set(
+            "CITY_SCRAPERS_FIXTURES_DIR", os.path.abspath(self.fixtures_dir)
+        )
 
     @property
     def spiders_dir(self):
         spiders_module = import_module(self.settings.get("NEWSPIDER_MODULE"))
         return os.path.relpath(os.path.dirname(spiders_module.__file__))
+
+    @property
+    def fixtures_dir(self):
+        return os.path.join(
+            os.path.dirname(os.path.dirname(self.spiders_dir)), "tests", "files"
+        )
@@ -0,0 +1,3 @@
+from .ocd import OpenCivicDataJsonLinesItemExporter  # noqa
+
+__all__ = ["OpenCivicDataJsonLinesItemExporter"]
@@ -0,0 +1,186 @@
+from itertools import chain
+from typing import IO, List, Mapping, Optional
+
+from scrapy import Spider
+from scrapy.crawler import Crawler
+from scrapy.exporters import JsonLinesItemExporter
+from scrapy.utils.python import to_bytes
+
+from ..clock import RunClock
+from ..pipelines import OpenCivicDataPipeline
+from ..pipelines.ocd import EventValue
+
+
+class OpenCivicDataJsonLinesItemExporter(JsonLinesItemExporter):
+    """Exporter writing Meeting items directly to JSON lines in the `Open Civic Data
+    Event format <https://opencivicdata.readthedocs.io/en/latest/data/event.html>`_.
+
+    Each line has the same structure as the output of :class:`OpenCivicDataPipeline`,
+    built from its event template, but is written without building an event dict.
+    Values that are the same for every event from a spider, like its timezone and
+    participants, are encoded once along with all of the keys. Items that were already
+    processed are written unchanged, so the exporter can run alongside
+    :class:`OpenCivicDataPipeline` or in place of it.
+
+    When it's used in place of the pipeline, the exporter must be registered in
+    ``FEED_EXPORTERS`` and used as the format of a feed in ``FEEDS``, which lets
+    :class:`DiffPipeline` and the ``combinefeeds`` command detect OCD output from its
+    ``output_format``. :class:`DiffPipeline` then assigns UIDs to new meetings when
+    writing a delta feed, and converts meetings with :class:`OpenCivicDataPipeline`
+    so that delta entries match the exported lines.
+
+    ``CITY_SCRAPERS_OCD_JSON_BACKEND`` can be set to "orjson" to encode values with
+    `orjson <https://github.com/ijl/orjson>`_ if it's installed. The default "json"
+    backend writes the same bytes as :class:`JsonLinesItemExporter`, while orjson
+    writes compact, UTF-8 encoded JSON.
+
+    :param file: File to write lines to
+    :param crawler: Current scrapy crawler, used to get the spider being run
+    :param spider: Spider being run if there's no crawler
+    :param json_backend: "json" or "orjson"
+    """
+
+    output_format = "ocd"
+
+    def __init__(
+        self,
+        file: IO,
+        crawler: Optional[Crawler] = None,
+        spider: Optional[Spider] = None,
+        json_backend: str = "json",
+        **kwargs,
+    ):
+        super().__init__(file, **kwargs)
+        self.crawler = crawler
+        self.spider = spider
+        self.pipeline = OpenCivicDataPipeline()
+        self.fragments = None
+        self.value_names = None
+        self.clock = None
+        if json_backend == "orjson":
+            import orjson
+
+            default = self.encoder.default
+            self.encode = lambda value: orjson.dumps(value, default=default).decode()
+            self.item_separator, self.key_separator = ",", ":"
+        elif json_backend == "json":
+            self.encode = self.encoder.encode
+            self.item_separator = self.encoder.item_separator
+            self.key_separator = self.encoder.key_separator
+        else:
+            raise ValueError(f"Unknown JSON backend: {json_backend}")
+
+    @classmethod
+    def from_crawler(cls, crawler: Crawler, file: IO, **kwargs):
+        """Create exporter from crawler
+
+        :param crawler: Current scrapy crawler
+        :param file: File to write lines to
+        :return: Created exporter
+        """
+        return cls(
+            file,
+            crawler=crawler,
+            json_backend=crawler.settings.get("CITY_SCRAPERS_OCD_JSON_BACKEND")
+            or "json",
+            **kwargs,
+        )
+
+    def export_item(self, item: Mapping):
+        """Write an item as a line of JSON, converting it to an OCD event if it hasn't
+        been processed
+
+        :param item: Item to write
+        """
+        if isinstance(item, dict) and "_id" in item:
+            line = self.encode(item)
+        elif self.fields_to_export:
+            # Selecting fields needs the full event dict
+            event = self.pipeline.create_event(item, self.get_spider())
+            line = self.encode(dict(self.get_serialized_fields(event)))
+        else:
+            parts = self.get_fragments()
+            line = "".join(
+                chain.from_iterable(zip(parts, self.create_event_values(item)))
+            )
+            line += parts[-1]
+        self.file.write(to_bytes(line + "\n", self.encoding))
+
+    def get_fragments(self) -> List[str]:
+        """Get the encoded JSON between each value that changes across events, which is
+        created once for the spider being run from the template of
+        :meth:`OpenCivicDataPipeline.create_event_template`
+
+        :return: List of encoded fragments to join with values
+        """
+        if self.fragments is not None:
+            return self.fragments
+        fragments = [""]
+        value_names = []
+
+        def has_values(node):
+            if isinstance(node, EventValue):
+                return True
+            if isinstance(node, dict):
+                return any(has_values(value) for value in node.values())
+            if isinstance(node, list):
+                return any(has_values(value) for value in node)
+            return False
+
+        def add(node):
+            if isinstance(node, EventValue):
+                value_names.append(node.name)
+                fragments.append("")
+            elif isinstance(node, dict) and has_values(node):
+                fragments[-1] += "{"
+                for idx, (key, value) in enumerate(node.items()):
+                    if idx > 0:
+                        fragments[-1] += self.item_separator
+                    fragments[-1] += self.encode(key) + self.key_separator
+                    add(value)
+                fragments[-1] += "}"
+            elif isinstance(node, list) and has_values(node):
+                fragments[-1] += "["
+                for idx, value in enumerate(node):
+                    if idx > 0:
+                        fragments[-1] += self.item_separator
+                    add(value)
+                fragments[-1] += "]"
+            else:
+                fragments[-1] += self.encode(node)
+
+        add(self.pipeline.create_event_template(self.get_spider()))
+        self.value_names = value_names
+        self.fragments = fragments
+        return self.fragments
+
+    def create_event_values(self, item: Mapping) -> List[str]:
+        """Encode the values of an item's OCD event that change across events, in the
+        order they appear in the event
+
+        :param item: Item to be converted
+        :return: List of encoded values
+        """
+        spider = self.get_spider()
+        values = self.pipeline.create_event_values(
+            item, spider, clock=self.get_clock(spider)
+        )
+        encode = self.encode
+        return [encode(values[name]) for name in self.value_names]
+
+    def get_spider(self) -> Spider:
+        """Get the spider being run
+
+        :return: Spider passed to the exporter or the crawler's spider
+        """
+        return self.spider or self.crawler.spider
+
+    def get_clock(self, spider: Spider) -> RunClock:
+        """Get the clock of the spider's run, which is only looked up once
+
+        :param spider: Spider being run
+        :return: Clock for the spider
+        """
+        if self.clock is None:
+            self.clock = RunClock.from_spider(spider)
+        return self.clock
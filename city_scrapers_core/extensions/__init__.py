@@ -1,4 +1,10 @@
 from .azure_storage import AzureBlobFeedStorage  # noqa
+from .feed_index import (  # noqa
+    AzureBlobFeedIndexExtension,
+    FeedIndexExtension,
+    GCSFeedIndexExtension,
+    S3FeedIndexExtension,
+)
 from .status import (  # noqa
     AzureBlobStatusExtension,
     GCSStatusExtension,
@@ -12,4 +18,8 @@ __all__ = [
     "AzureBlobStatusExtension",
     "S3StatusExtension",
     "GCSStatusExtension",
+    "FeedIndexExtension",
+    "AzureBlobFeedIndexExtension",
+    "S3FeedIndexExtension",
+    "GCSFeedIndexExtension",
 ]
@@ -0,0 +1,241 @@
+import json
+from datetime import datetime, timedelta
+from typing import Mapping, Optional
+from urllib.parse import urlparse
+
+from scrapy import signals
+from scrapy.crawler import Crawler
+from scrapy.exceptions import NotConfigured
+from scrapy.settings import Settings
+from twisted.internet.defer import Deferred
+from twisted.internet.threads import deferToThread
+
+# Number of days before today to look back for recent feeds
+MAX_DAYS_PREVIOUS = 3
+
+
+def get_index_key(settings: Settings, spider_name: str) -> Optional[str]:
+    """Get the storage key of the index object pointing to a spider's latest feed
+
+    :param settings: Current project settings
+    :param spider_name: Name of the spider
+    :return: Key of the index object, or None if ``CITY_SCRAPERS_FEED_INDEX_PREFIX``
+             is not set
+    """
+    index_prefix = settings.get("CITY_SCRAPERS_FEED_INDEX_PREFIX")
+    if not index_prefix:
+        return None
+    return f"{index_prefix.rstrip('/')}/{spider_name}.json"
+
+
+def is_recent_index(index: Mapping) -> bool:
+    """Check whether an index object was updated within ``MAX_DAYS_PREVIOUS`` days, the
+    same number of days that are listed to find recent feeds otherwise. Index objects
+    without an update time can't be checked, so they're treated as recent.
+
+    :param index: Parsed index object
+    :return: True if the index object's feed can be used
+    """
+    cutoff = (datetime.now() - timedelta(days=MAX_DAYS_PREVIOUS)).strftime("%Y-%m-%d")
+    return index.get("updated_at", cutoff) >= cutoff
+
+
+class FeedIndexExtension:
+    """Scrapy extension for writing a small index object for each spider that points
+    to its most recent feed export. This allows :class:`DiffPipeline` and the
+    ``combinefeeds`` command to find the latest feed with a single request instead of
+    listing storage prefixes.
+
+    Index objects are written to ``CITY_SCRAPERS_FEED_INDEX_PREFIX``, and the extension
+    is disabled if that setting is empty.
+    """
+
+    uri_scheme = None
+
+    def __init__(self, crawler: Crawler):
+        self.crawler = crawler
+
+    @classmethod
+    def from_crawler(cls, crawler: Crawler):
+        """Generate an extension from a crawler
+
+        :param crawler: Current scrapy crawler
+        :raises NotConfigured: Raises if ``CITY_SCRAPERS_FEED_INDEX_PREFIX`` is not set
+        """
+        if not crawler.settings.get("CITY_SCRAPERS_FEED_INDEX_PREFIX"):
+            raise NotConfigured
+        ext = cls(crawler)
+        crawler.signals.connect(ext.feed_slot_closed, signal=signals.feed_slot_closed)
+        return ext
+
+    def feed_slot_closed(self, slot) -> Optional[Deferred]:
+        """Updates the spider's index object in a thread after a feed has been stored,
+        skipping feeds for other storage backends and feeds that failed to store.
+
+        Scrapy sends ``feed_slot_closed`` even if storing the feed failed, and only
+        records the failure in the ``feedexport/failed_count/<storage>`` stat. Feeds
+        are only indexed if no feed with the same storage failed to store in the
+        crawl, because closed slots can't be matched to their result otherwise.
+
+        :param slot: Feed slot that was closed
+        :return: Deferred firing once the index object is written, or None if it's not
+                 updated
+        """
+        if urlparse(slot.uri).scheme != self.uri_scheme:
+            return None
+        storage_name = type(slot.storage).__name__
+        if self.crawler.stats.get_value(f"feedexport/failed_count/{storage_name}", 0):
+            return None
+        return deferToThread(self.update_feed_index, slot.uri)
+
+    def update_feed_index(self, uri: str):
+        """Writes the spider's index object pointing to a stored feed, unless the feed
+        can't be found
+
+        :param uri: URI of the stored feed
+        """
+        feed_key = self.get_feed_key(uri)
+        fingerprint = self.get_fingerprint(feed_key)
+        if fingerprint is None:
+            return
+        index_key = get_index_key(self.crawler.settings, self.crawler.spider.name)
+        self.update_index(
+            index_key,
+            json.dumps(
+                {
+                    "key": feed_key,
+                    "fingerprint": fingerprint,
+                    "updated_at": datetime.now().isoformat(timespec="seconds"),
+                }
+            ),
+        )
+
+    def get_feed_key(self, uri: str) -> str:
+        """Get the storage key of a feed from its URI
+
+        :param uri: Feed URI
+        :return: Key of the feed within its bucket or container
+        """
+        return urlparse(uri).path.lstrip("/")
+
+    def get_fingerprint(self, feed_key: str) -> Optional[str]:
+        """Method for getting the ETag or MD5 of a stored feed. Must be implemented on
+        subclasses.
+
+        :param feed_key: Key of the stored feed
+        :raises NotImplementedError: Raises if not implemented on subclass
+        :return: Fingerprint of the feed, or None if it wasn't stored
+        """
+        raise NotImplementedError
+
+    def update_index(self, index_key: str, index_text: str):
+        """Method for writing an index object to a storage provider. Must be implemented
+        on subclasses.
+
+        :param index_key: Key of the index object
+        :param index_text: JSON string of the index object
+        :raises NotImplementedError: Raises if not implemented on subclass
+        """
+        raise NotImplementedError
+
+
+class AzureBlobFeedIndexExtension(FeedIndexExtension):
+    """Implements :class:`FeedIndexExtension` for Azure Blob Storage"""
+
+    uri_scheme = "azure"
+
+    def __init__(self, crawler: Crawler):
+        from azure.storage.blob import ContainerClient
+
+        super().__init__(crawler)
+        feed_uri = crawler.settings.get("FEED_URI")
+        account_name, account_key = feed_uri[8::].split("@")[0].split(":")
+        self.container_client = ContainerClient(
+            f"{account_name}.blob.core.windows.net",
+            feed_uri.split("@")[1].split("/")[0],
+            credential=account_key,
+        )
+
+    def get_feed_key(self, uri: str) -> str:
+        return "/".join(uri.split("@")[1].split("/")[1::])
+
+    def get_fingerprint(self, feed_key: str) -> Optional[str]:
+        from azure.core.exceptions import ResourceNotFoundError
+
+        try:
+            properties = self.container_client.get_blob_client(
+                feed_key
+            ).get_blob_properties()
+        except ResourceNotFoundError:
+            return None
+        if properties.content_settings.content_md5:
+            return bytes(properties.content_settings.content_md5).hex()
+        return properties.etag
+
+    def update_index(self, index_key: str, index_text: str):
+        from azure.storage.blob import ContentSettings
+
+        self.container_client.upload_blob(
+            index_key,
+            index_text,
+            content_settings=ContentSettings(
+                content_type="application/json", cache_control="no-cache"
+            ),
+            overwrite=True,
+        )
+
+
+class S3FeedIndexExtension(FeedIndexExtension):
+    """Implements :class:`FeedIndexExtension` for AWS S3"""
+
+    uri_scheme = "s3"
+
+    def __init__(self, crawler: Crawler):
+        import boto3
+
+        super().__init__(crawler)
+        self.bucket = urlparse(crawler.settings.get("FEED_URI")).netloc
+        self.client = boto3.client(
+            "s3",
+            aws_access_key_id=crawler.settings.get("AWS_ACCESS_KEY_ID"),
+            aws_secret_access_key=crawler.settings.get("AWS_SECRET_ACCESS_KEY"),
+        )
+
+    def get_fingerprint(self, feed_key: str) -> Optional[str]:
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=feed_key)["ETag"]
+        except self.client.exceptions.ClientError:
+            return None
+
+    def update_index(self, index_key: str, index_text: str):
+        self.client.put_object(
+            Body=index_text.encode(),
+            Bucket=self.bucket,
+            CacheControl="no-cache",
+            ContentType="application/json",
+            Key=index_key,
+        )
+
+
+class GCSFeedIndexExtension(FeedIndexExtension):
+    """Implements :class:`FeedIndexExtension` for Google Cloud Storage"""
+
+    uri_scheme = "gs"
+
+    def __init__(self, crawler: Crawler):
+        from google.cloud import storage
+
+        super().__init__(crawler)
+        client = storage.Client()
+        self.bucket = client.bucket(urlparse(crawler.settings.get("FEED_URI")).netloc)
+
+    def get_fingerprint(self, feed_key: str) -> Optional[str]:
+        blob = self.bucket.get_blob(feed_key)
+        if blob is None:
+            return None
+        return blob.md5_hash or blob.etag
+
+    def update_index(self, index_key: str, index_text: str):
+        self.bucket.blob(index_key).upload_from_string(
+            index_text.encode(), content_type="application/json"
+        )
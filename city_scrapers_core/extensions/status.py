@@ -1,9 +1,8 @@
-from datetime import datetime
-
-import pytz
 from scrapy import Spider, signals
 from scrapy.crawler import Crawler
 
+from ..clock import RunClock
+
 RUNNING = "running"
 FAILING = "failing"
 STATUS_COLOR_MAP = {RUNNING: "#44cc11", FAILING: "#cb2431"}
@@ -76,11 +75,11 @@ class StatusExtension:
         :return: An SVG string formatted for a given spider and status
         """
 
-        tz = pytz.timezone(spider.timezone)
+        clock = RunClock.from_crawler(self.crawler)
         return STATUS_ICON.format(
             color=STATUS_COLOR_MAP[status],
             status=status,
-            date=tz.localize(datetime.now()).strftime("%Y-%m-%d"),
+            date=clock.localized_now(spider.timezone).strftime("%Y-%m-%d"),
         )
 
     def update_status_svg(self, spider: Spider, svg: str):
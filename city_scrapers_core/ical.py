@@ -0,0 +1,122 @@
+import re
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, NamedTuple, Optional, Tuple
+
+import pytz
+
+CONTENT_LINE_RE = re.compile(
+    r'(?P<name>[A-Za-z0-9-]+)(?P<params>(?:;[A-Za-z0-9-]+=(?:"[^"]*"|[^";:]*))*):(?P<value>.*)'  # noqa
+)
+PARAM_RE = re.compile(r';([A-Za-z0-9-]+)=("[^"]*"|[^";:]*)')
+TEXT_ESCAPE_RE = re.compile(r"\\([\\;,nN])")
+DATE_TIME_RE = re.compile(r"(\d{8})(?:T(\d{6}|\d{4})(Z?))?")
+
+# Properties with TEXT values that can include escaped characters
+TEXT_PROPERTIES = {"SUMMARY", "DESCRIPTION", "LOCATION", "COMMENT", "CATEGORIES"}
+
+
+class ICalProperty(NamedTuple):
+    value: str
+    params: Dict[str, str]
+
+
+def unfold_lines(lines: Iterable[str]) -> Iterator[str]:
+    """Join folded iCalendar content lines, which continue on following lines that
+    start with a space or tab
+
+    :param lines: Iterable of raw lines, with or without line endings
+    :return: Iterator of unfolded content lines
+    """
+    current = None
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if current is not None and line[:1] in (" ", "\t"):
+            current += line[1:]
+            continue
+        if current:
+            yield current
+        current = line
+    if current:
+        yield current
+
+
+def parse_content_line(line: str) -> Optional[Tuple[str, ICalProperty]]:
+    """Parse an unfolded iCalendar content line into its name, value and parameters
+
+    :param line: Unfolded content line
+    :return: Upper case property name and property, or None if the line is invalid
+    """
+    match = CONTENT_LINE_RE.fullmatch(line)
+    if match is None:
+        return None
+    name = match.group("name").upper()
+    params = {
+        param.upper(): param_value.strip('"')
+        for param, param_value in PARAM_RE.findall(match.group("params"))
+    }
+    value = match.group("value")
+    if name in TEXT_PROPERTIES:
+        value = TEXT_ESCAPE_RE.sub(
+            lambda m: "\n" if m.group(1) in "nN" else m.group(1), value
+        )
+    return name, ICalProperty(value, params)
+
+
+def iter_ical_events(lines: Iterable[str]) -> Iterator[Dict[str, ICalProperty]]:
+    """Stream VEVENT components from iCalendar lines without loading the whole
+    calendar. Properties of components nested in events like VALARM are ignored, and
+    only the first value of repeated properties is kept.
+
+    :param lines: Iterable of iCalendar lines, like an open file
+    :return: Iterator of dictionaries of upper case property names to properties
+    """
+    event = None
+    depth = 0
+    for line in unfold_lines(lines):
+        parsed = parse_content_line(line)
+        if parsed is None:
+            continue
+        name, prop = parsed
+        component = prop.value.strip().upper()
+        if name == "BEGIN":
+            if event is not None:
+                depth += 1
+            elif component == "VEVENT":
+                event = {}
+        elif name == "END":
+            if event is None:
+                continue
+            if depth > 0:
+                depth -= 1
+            elif component == "VEVENT":
+                yield event
+                event = None
+        elif event is not None and depth == 0:
+            event.setdefault(name, prop)
+
+
+def parse_ical_datetime(prop: ICalProperty, tz_name: str) -> Tuple[datetime, bool]:
+    """Parse an iCalendar DATE or DATE-TIME property as a naive datetime in a
+    timezone. UTC times are converted, and times with a TZID or without a timezone
+    are assumed to already be in the timezone because many calendars use TZID names
+    that aren't in the tz database.
+
+    :param prop: Property with a DATE or DATE-TIME value
+    :param tz_name: Name of the timezone to return the datetime in
+    :raises ValueError: Raises if the value isn't a valid date or time
+    :return: Tuple of the naive datetime and whether the value included a time
+    """
+    value = prop.value.strip()
+    match = DATE_TIME_RE.fullmatch(value)
+    if match is None:
+        raise ValueError(f"Invalid iCalendar date or time: {value}")
+    date_value, time_value, utc = match.groups()
+    if time_value is None:
+        return datetime.strptime(date_value, "%Y%m%d"), False
+    # Some calendars leave out seconds
+    time_format = "%H%M" if len(time_value) == 4 else "%H%M%S"
+    dt = datetime.strptime(date_value + time_value, "%Y%m%d" + time_format)
+    if utc:
+        dt = pytz.utc.localize(dt).astimezone(pytz.timezone(tz_name))
+        dt = dt.replace(tzinfo=None)
+    return dt, True
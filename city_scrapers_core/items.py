@@ -1,3 +1,8 @@
+from collections.abc import MutableMapping
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Mapping
+
 import scrapy
 
 from .constants import CLASSIFICATIONS, STATUSES
@@ -86,3 +91,94 @@ class Meeting(scrapy.Item):
         },
         "required": ["id", "title", "start", "source"],
     }
+
+
+MEETING_FIELDS = (
+    "id",
+    "title",
+    "description",
+    "classification",
+    "status",
+    "start",
+    "end",
+    "all_day",
+    "time_notes",
+    "location",
+    "links",
+    "source",
+    # Set by DiffPipeline when a meeting matches a previous result
+    "_id",
+)
+
+
+@dataclass(init=False, repr=False, eq=False)
+class SlottedMeeting(MutableMapping):
+    """Compact alternative to :class:`Meeting` that stores values in ``__slots__``
+    instead of a per-instance dict. It has the same fields and ``jsonschema`` and
+    supports the same dict-like access, so it can be yielded by spiders and used with
+    all of the pipelines. Unset fields are missing like they are on :class:`Meeting`.
+    """
+
+    __slots__ = MEETING_FIELDS
+
+    id: str
+    title: str
+    description: str
+    classification: str
+    status: str
+    start: datetime
+    end: datetime
+    all_day: bool
+    time_notes: str
+    location: Dict[str, str]
+    links: List[Dict[str, str]]
+    source: str
+    _id: str
+
+    fields = {field: scrapy.Field() for field in MEETING_FIELDS[:-1]}
+    jsonschema = Meeting.jsonschema
+
+    def __init__(self, *args: Mapping, **kwargs: Any):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in MEETING_FIELDS:
+            raise KeyError(key)
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key: str, value: Any):
+        if key not in MEETING_FIELDS:
+            raise KeyError(f"{self.__class__.__name__} does not support field: {key}")
+        setattr(self, key, value)
+
+    def __delitem__(self, key: str):
+        if key not in MEETING_FIELDS:
+            raise KeyError(key)
+        try:
+            delattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __contains__(self, key: Any) -> bool:
+        return key in MEETING_FIELDS and hasattr(self, key)
+
+    def __iter__(self) -> Iterator[str]:
+        return (field for field in MEETING_FIELDS if hasattr(self, field))
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({dict(self)!r})"
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key not in MEETING_FIELDS:
+            return default
+        return getattr(self, key, default)
+
+    def copy(self) -> "SlottedMeeting":
+        return self.__class__(self)
@@ -0,0 +1,3 @@
+from .fixtures import FixtureReplayMiddleware  # noqa
+
+__all__ = ["FixtureReplayMiddleware"]
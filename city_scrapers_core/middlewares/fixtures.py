@@ -0,0 +1,75 @@
+import os
+from typing import Optional
+
+from scrapy import Request, Spider
+from scrapy.crawler import Crawler
+from scrapy.exceptions import IgnoreRequest, NotConfigured
+from scrapy.http import Response, TextResponse
+from scrapy.responsetypes import responsetypes
+
+
+class FixtureReplayMiddleware:
+    """Downloader middleware for running spiders offline by replaying the fixture files
+    used in a project's tests instead of requesting pages from the network.
+
+    Fixtures are read from ``CITY_SCRAPERS_FIXTURES_DIR``, and the middleware is
+    disabled if that setting is empty. By default a spider's start URLs are answered
+    with the fixture named after the spider (like ``tests/files/chi_example.html``),
+    which matches the files created by the ``genspider`` command. Any other requests
+    are ignored and counted in the "fixtures/missing" stat.
+    """
+
+    def __init__(self, crawler: Crawler, fixtures_dir: str):
+        self.crawler = crawler
+        self.fixtures_dir = fixtures_dir
+        self.served_start = False
+
+    @classmethod
+    def from_crawler(cls, crawler: Crawler):
+        """Generate a middleware from a crawler
+
+        :param crawler: Current scrapy crawler
+        :raises NotConfigured: Raises if ``CITY_SCRAPERS_FIXTURES_DIR`` is not set
+        """
+        fixtures_dir = crawler.settings.get("CITY_SCRAPERS_FIXTURES_DIR")
+        if not fixtures_dir:
+            raise NotConfigured
+        return cls(crawler, fixtures_dir)
+
+    def process_request(self, request: Request, spider: Spider) -> Response:
+        """Respond to a request with a fixture file
+
+        :param request: Request to respond to
+        :param spider: Spider object being run
+        :raises IgnoreRequest: Raises if there's no fixture for the request
+        :return: Response with the contents of the fixture file
+        """
+        fixture_path = self.get_fixture_path(request, spider)
+        if fixture_path is None:
+            self.crawler.stats.inc_value("fixtures/missing")
+            raise IgnoreRequest(f"No fixture found for {request.url}")
+        with open(fixture_path, "rb") as f:
+            body = f.read()
+        response_cls = responsetypes.from_args(filename=fixture_path, body=body)
+        kwargs = {"encoding": "utf-8"} if issubclass(response_cls, TextResponse) else {}
+        self.crawler.stats.inc_value("fixtures/replayed")
+        return response_cls(url=request.url, request=request, body=body, **kwargs)
+
+    def get_fixture_path(self, request: Request, spider: Spider) -> Optional[str]:
+        """Get the fixture file to respond to a request with. Can be overridden to map
+        other requests to fixtures.
+
+        :param request: Request to respond to
+        :param spider: Spider object being run
+        :return: Path to the fixture file, or None if there isn't one
+        """
+        start_urls = getattr(spider, "start_urls", None) or []
+        if request.url not in start_urls and (start_urls or self.served_start):
+            return None
+        self.served_start = True
+        if not os.path.isdir(self.fixtures_dir):
+            return None
+        for file_name in sorted(os.listdir(self.fixtures_dir)):
+            if os.path.splitext(file_name)[0] == spider.name:
+                return os.path.join(self.fixtures_dir, file_name)
+        return None
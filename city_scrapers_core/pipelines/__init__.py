@@ -1,3 +1,4 @@
+from .core import CorePipeline  # noqa
 from .default import DefaultValuesPipeline  # noqa
 from .diff import (  # noqa
     AzureDiffPipeline,
@@ -10,6 +11,7 @@ from .ocd import OpenCivicDataPipeline  # noqa
 from .validation import ValidationPipeline  # noqa
 
 __all__ = [
+    "CorePipeline",
     "DefaultValuesPipeline",
     "DiffPipeline",
     "AzureDiffPipeline",
@@ -0,0 +1,49 @@
+from datetime import datetime, timedelta
+from typing import Mapping
+
+from scrapy import Item, Spider
+
+from ..constants import NOT_CLASSIFIED, TENTATIVE
+from ..decorators import ignore_processed
+from .ocd import OpenCivicDataPipeline
+
+
+class CorePipeline(OpenCivicDataPipeline):
+    """Pipeline producing the same events as :class:`DefaultValuesPipeline`,
+    :class:`MeetingPipeline` and :class:`OpenCivicDataPipeline` run in order, in a
+    single pass over each item.
+
+    Instead of setting defaults and cleaning up each field on the item, the item's
+    values are copied once into a plain dict over the defaults, and the event is built
+    from that dict. The scraped item isn't changed. Subclasses of
+    :class:`DefaultValuesPipeline` or :class:`MeetingPipeline` with custom processing
+    should be run in place of this pipeline.
+    """
+
+    @ignore_processed
+    def process_item(self, item: Item, spider: Spider) -> Mapping:
+        """Sets defaults, cleans up the meeting, and converts it into an OCD event
+
+        :param item: Scraped item passed to pipeline
+        :param spider: Current spider being run
+        :return: Dict formatted as an OCD event
+        """
+        meeting = {
+            "description": "",
+            "all_day": False,
+            "location": {},
+            "links": [],
+            "time_notes": "",
+            "classification": NOT_CLASSIFIED,
+            "status": TENTATIVE,
+            **item,
+        }
+        meeting["title"] = spider._clean_title(meeting["title"])
+        # Set default end time of two hours later if end time is not present or if it's
+        # the same time as the start
+        end = meeting.get("end")
+        if not end or (
+            isinstance(end, datetime) and (end - meeting["start"]).seconds < 60
+        ):
+            meeting["end"] = meeting["start"] + timedelta(hours=2)
+        return self.create_event(meeting, spider)
@@ -15,7 +15,14 @@ class DefaultValuesPipeline:
         :param spider: Spider passed to the pipeline
         :return: Item with defaults set
         """
+        return self.set_defaults(item)
 
+    def set_defaults(self, item: Item) -> Item:
+        """Sets default values on an item that hasn't been processed
+
+        :param item: An individual Item that's been scraped
+        :return: Item with defaults set
+        """
         item.setdefault("description", "")
         item.setdefault("all_day", False)
         item.setdefault("location", {})
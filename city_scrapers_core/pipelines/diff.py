@@ -1,17 +1,83 @@
 import json
+import logging
 from datetime import datetime, timedelta
-from operator import attrgetter, itemgetter
-from typing import List, Mapping
+from hashlib import sha1
+from itertools import islice
+from tempfile import TemporaryFile
+from typing import IO, Any, Callable, Hashable, Iterable, List, Mapping, Optional, Tuple
 from urllib.parse import urlparse
+from uuid import uuid1
 
-from pytz import timezone
 from scrapy import Spider, signals
 from scrapy.crawler import Crawler
 from scrapy.exceptions import DontCloseSpider, DropItem
 from scrapy.http import Response
+from scrapy.settings import Settings
+from scrapy.utils.defer import deferred_from_coro
+from twisted.internet.defer import Deferred, DeferredList, maybeDeferred
+from twisted.internet.threads import deferToThread
+from twisted.python.failure import Failure
 
+from ..clock import RunClock
 from ..constants import CANCELLED
-from ..items import Meeting
+from ..extensions.feed_index import MAX_DAYS_PREVIOUS, get_index_key, is_recent_index
+from ..items import Meeting, SlottedMeeting
+from .feed_cache import FeedCache
+from .ocd import OpenCivicDataPipeline, get_output_format
+from .shared_storage import SharedStorage
+
+logger = logging.getLogger(__name__)
+
+
+def get_content_hash(item: Mapping) -> str:
+    """Get a hash of an output item's content, ignoring when it was last updated
+
+    :param item: Item in its output format
+    :return: Hex digest of the item's content
+    """
+    content = {key: value for key, value in item.items() if key != "updated_at"}
+    return sha1(json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+
+def is_incremental(spider: Spider) -> bool:
+    """Check whether a spider only requests recent pages and relies on previous
+    results for older meetings
+
+    :param spider: Spider object
+    :return: True if the spider is incremental
+    """
+    return getattr(spider, "incremental", False) is True
+
+
+def get_incremental_start(spider: Spider) -> Optional[str]:
+    """Get the start of the window of meetings an incremental spider requested
+
+    :param spider: Spider object
+    :return: ISO 8601 datetime string, or None if the spider requested everything
+    """
+    incremental_start = getattr(spider, "incremental_start", None)
+    if isinstance(incremental_start, str):
+        return incremental_start
+
+
+def get_delta_key(
+    settings: Settings, spider_name: str, dt: Optional[datetime] = None
+) -> Optional[str]:
+    """Get the storage key of a spider's delta feed for a date
+
+    :param settings: Current project settings
+    :param spider_name: Name of the spider
+    :param dt: Date of the delta feed, defaults to the current date
+    :return: Key of the delta feed, or None if ``CITY_SCRAPERS_DIFF_DELTA_PREFIX`` is
+             not set
+    """
+    delta_prefix = settings.get("CITY_SCRAPERS_DIFF_DELTA_PREFIX")
+    if not delta_prefix:
+        return None
+    date_prefix = (dt or datetime.now()).strftime(
+        settings.get("CITY_SCRAPERS_DIFF_FEED_PREFIX", "%Y/%m/%d")
+    )
+    return f"{delta_prefix.rstrip('/')}/{date_prefix}/{spider_name}.json"
 
 
 class DiffPipeline:
@@ -20,7 +86,18 @@ class DiffPipeline:
     appear as cancelled.
 
     Provider-specific backends can be created by subclassing and implementing the
-    `load_previous_results` method.
+    `load_previous_results` method, or `iter_previous_results` to stream results.
+
+    Spiders with ``incremental`` set to True only request recent pages. Their previous
+    results are loaded before the crawl starts so the spider can choose what to
+    request, and previous results starting before the spider's ``incremental_start``
+    are kept in the output unchanged.
+
+    If previous results fail to load, the spider is closed with the reason
+    ``diff_load_failed`` and no items are exported. Feed exports still store an empty
+    feed unless ``FEED_STORE_EMPTY`` is False, which the ``runall`` command sets by
+    default, so the next run and ``combinefeeds`` don't use an empty feed as the
+    spider's latest results.
     """
 
     def __init__(self, crawler: Crawler, output_format: str):
@@ -31,6 +108,23 @@ class DiffPipeline:
         """
         self.crawler = crawler
         self.output_format = output_format
+        self._loading = None
+        self._load_failure = None
+        self._load_waiters = []
+        self._spider_opened = False
+        self._spill_file = None
+        self._spill_index = []
+        self._replay_results = None
+        self._replay_done = False
+        self.feed_cache = FeedCache.from_settings(crawler.settings) if crawler else None
+        self.shared_storage = None
+        self.delta_prefix = (
+            crawler.settings.get("CITY_SCRAPERS_DIFF_DELTA_PREFIX") if crawler else None
+        )
+        self._previous_hashes = {}
+        self._cancelled_ids = set()
+        self._delta_file = None
+        self._ocd_pipeline = OpenCivicDataPipeline()
 
     @classmethod
     def from_crawler(cls, crawler: Crawler):
@@ -40,25 +134,292 @@ class DiffPipeline:
         :raises ValueError: Raises an error if an output format is not supplied
         :return: Instance of DiffPipeline
         """
-        pipelines = crawler.settings.get("ITEM_PIPELINES", {})
-        if "city_scrapers_core.pipelines.OpenCivicDataPipeline" in pipelines:
-            output_format = "ocd"
-        else:
+        output_format = get_output_format(crawler.settings)
+        if output_format is None:
             raise ValueError(
                 "An output format pipeline must be enabled for diff middleware"
             )
         pipeline = cls(crawler, output_format)
-        crawler.spider._previous_results = pipeline.load_previous_results()
-        if output_format == "ocd":
-            crawler.spider._previous_map = {}
-            for result in crawler.spider._previous_results:
-                extras_dict = result.get("extras") or result.get("extra") or {}
-                previous_id = extras_dict.get("cityscrapers.org/id")
-                crawler.spider._previous_map[previous_id] = result["_id"]
+        crawler.spider._previous_map = {}
+        crawler.spider._previous_starts = {}
+        crawler.spider._previous_updates = {}
         crawler.spider._scraped_ids = set()
+        if is_incremental(crawler.spider):
+            # Incremental spiders use previous results to choose which pages to request
+            pipeline._loading = maybeDeferred(
+                pipeline.load_previous_index, crawler.spider
+            )
+        else:
+            # Load previous results in a thread so the crawl can start in the meantime
+            pipeline._loading = deferToThread(
+                pipeline.load_previous_index, crawler.spider
+            )
+        pipeline._loading.addCallbacks(
+            lambda _: pipeline._finish_loading(None),
+            pipeline._previous_results_failed,
+        )
         crawler.signals.connect(pipeline.spider_idle, signal=signals.spider_idle)
+        crawler.signals.connect(pipeline.spider_opened, signal=signals.spider_opened)
+        if pipeline.delta_prefix:
+            pipeline._delta_file = TemporaryFile("w+", encoding="utf-8")
+            crawler.signals.connect(pipeline.item_scraped, signal=signals.item_scraped)
         return pipeline
 
+    def load_previous_index(self, spider: Spider):
+        """Load previous results and index them on the spider. Uses the local feed cache
+        if ``CITY_SCRAPERS_DIFF_CACHE_DIR`` is set, which requires ``get_previous_key``
+        and ``open_feed`` to be implemented.
+
+        :param spider: Spider currently being scraped
+        """
+        if self.feed_cache is None or self.output_format != "ocd":
+            self.set_previous_results(spider, self.iter_previous_results())
+            return
+        key = self.get_previous_key()
+        if key is None:
+            self.set_previous_results(spider, [])
+            return
+        cache_key = f"{urlparse(self.crawler.settings.get('FEED_URI')).netloc}/{key}"
+        cached = self.feed_cache.get(cache_key)
+        etag, lines = self.open_feed(key, etag=cached[0]["etag"] if cached else None)
+        if lines is None:
+            self.crawler.stats.inc_value("diff/cache_hit", spider=spider)
+            header, feed_file = cached
+        else:
+            self.crawler.stats.inc_value("diff/cache_miss", spider=spider)
+            if cached is not None:
+                cached[1].close()
+            # Cached entries always include content hashes, since the cache is shared
+            # by runs with and without delta feeds
+            header, feed_file = self.feed_cache.put(
+                cache_key,
+                etag,
+                lines,
+                lambda line: self._index_result(json.loads(line), content_hash=True),
+            )
+        entries = header["entries"]
+        if self.delta_prefix and any(
+            len(entry) < 6 or entry[5] is None for entry in entries
+        ):
+            # Entries cached by earlier versions are missing content hashes
+            feed_start = feed_file.tell()
+            entries = [
+                self._index_result(json.loads(line), content_hash=True)
+                for line in feed_file
+            ]
+            feed_file.seek(feed_start)
+        self.set_previous_index(
+            spider,
+            entries,
+            feed_file,
+            [(entry[0], entry[2]) for entry in entries],
+        )
+
+    def set_previous_results(self, spider: Spider, results: Iterable[Mapping]):
+        """Index previously scraped results on the spider by ID, keeping only their
+        UIDs and start times in memory. Upcoming results are written to a temporary
+        spill file so they can be streamed back to the spider when it's idle.
+
+        :param spider: Spider currently being scraped
+        :param results: Items previously scraped and loaded from a storage backend
+        """
+        if self.output_format != "ocd":
+            return
+        entries = []
+        spill_file = TemporaryFile("w+", encoding="utf-8")
+        spill_index = []
+        dt_str = RunClock.from_spider(spider).now_str
+        for result in results:
+            entry = self._index_result(result)
+            entries.append(entry)
+            previous_id, previous_start = entry[0], entry[2]
+            # Past results are dropped unless the spider is incremental, so only
+            # upcoming results are replayed otherwise
+            if previous_start and (previous_start >= dt_str or is_incremental(spider)):
+                spill_file.write(json.dumps(result) + "\n")
+                spill_index.append((previous_id, previous_start))
+        spill_file.seek(0)
+        self.set_previous_index(spider, entries, spill_file, spill_index)
+
+    def set_previous_index(
+        self,
+        spider: Spider,
+        entries: List[List],
+        spill_file: IO,
+        spill_index: List[Tuple[str, str]],
+    ):
+        """Set the ID maps on the spider and the spill file of results to replay
+
+        :param spider: Spider currently being scraped
+        :param entries: List of scraper ID, UID, start, fingerprint, updated time and
+                        content hash for each previous result. Fingerprint, updated
+                        time and content hash can be None.
+        :param spill_file: Open file of JSON lines results that may be replayed
+        :param spill_index: Scraper ID and start for each line in ``spill_file``
+        """
+        spider._previous_map = {}
+        spider._previous_starts = {}
+        spider._previous_updates = {}
+        self._previous_hashes = {}
+        for entry in entries:
+            # Entries cached by earlier versions may be missing trailing values
+            previous_id, uid, start, fingerprint, updated_at, content_hash = (
+                list(entry) + [None] * 6
+            )[:6]
+            spider._previous_map[previous_id] = uid
+            spider._previous_starts[previous_id] = start
+            if fingerprint:
+                spider._previous_updates[previous_id] = (fingerprint, updated_at)
+            if self.delta_prefix:
+                self._previous_hashes[previous_id] = content_hash
+        self._close_spill_file()
+        self._spill_file = spill_file
+        self._spill_index = spill_index
+
+    def _index_result(self, result: Mapping, content_hash: bool = False) -> List:
+        extras_dict = result.get("extras") or result.get("extra") or {}
+        return [
+            extras_dict.get("cityscrapers.org/id"),
+            result["_id"],
+            result.get("start", result.get("start_time")),
+            extras_dict.get("cityscrapers.org/fingerprint"),
+            result.get("updated_at"),
+            get_content_hash(result) if content_hash or self.delta_prefix else None,
+        ]
+
+    def iter_unscraped_results(self, spider: Spider) -> Iterable[Mapping]:
+        """Stream previous upcoming results that haven't been scraped in this run from
+        the spill file
+
+        :param spider: Spider currently being scraped
+        :return: Iterable of previously scraped items
+        """
+        if self._spill_file is None:
+            return
+        dt_str = RunClock.from_spider(spider).now_str
+        for (previous_id, previous_start), line in zip(
+            self._spill_index, self._spill_file
+        ):
+            # Skip scraped and past results before decoding them
+            if self._should_replay(spider, previous_id, previous_start, dt_str):
+                yield json.loads(line)
+        self._close_spill_file()
+
+    def _should_replay(
+        self, spider: Spider, previous_id: str, previous_start: str, dt_str: str
+    ) -> bool:
+        if not previous_start or (previous_id or "") in spider._scraped_ids:
+            return False
+        incremental_start = get_incremental_start(spider)
+        return previous_start >= dt_str or bool(
+            incremental_start and previous_start < incremental_start
+        )
+
+    def item_scraped(self, item: Mapping, spider: Spider):
+        """Record added, modified and cancelled meetings in the delta feed once items
+        have passed through every pipeline
+
+        :param item: Scraped item in its final output format, or a meeting that will be
+                     converted by an exporter
+        :param spider: Spider being scraped
+        """
+        if isinstance(item, (Meeting, SlottedMeeting)) or (
+            isinstance(item, dict) and "id" in item
+        ):
+            if "_id" not in item:
+                return
+            item = self._ocd_pipeline.create_event(item, spider)
+        elif not isinstance(item, dict) or "_id" not in item:
+            return
+        extras_dict = item.get("extras") or item.get("extra") or {}
+        scraper_id = extras_dict.get("cityscrapers.org/id", "")
+        if scraper_id in self._cancelled_ids:
+            action = "cancelled"
+        elif scraper_id in spider._previous_map:
+            if self._previous_hashes.get(scraper_id) == get_content_hash(item):
+                return
+            action = "modified"
+        else:
+            action = "added"
+        self.crawler.stats.inc_value(f"diff/delta/{action}", spider=spider)
+        self._delta_file.write(json.dumps({"action": action, "meeting": item}) + "\n")
+
+    def close_spider(self, spider: Spider):
+        """Write the delta feed if enabled, and remove the spill file of previous
+        results when the spider is closed
+
+        :param spider: Spider object being run
+        """
+        self._close_spill_file()
+        if self._delta_file is not None and self._load_failure is None:
+            self._delta_file.seek(0)
+            # Key the delta by the start of the run, like its feed
+            self.write_text(
+                get_delta_key(
+                    self.crawler.settings,
+                    spider.name,
+                    RunClock.from_spider(spider).now,
+                ),
+                self._delta_file.read(),
+            )
+        if self._delta_file is not None:
+            self._delta_file.close()
+            self._delta_file = None
+
+    def _close_spill_file(self):
+        if self._spill_file is not None:
+            self._spill_file.close()
+        self._spill_file = None
+        self._spill_index = []
+
+    def _previous_results_failed(self, failure: Failure):
+        logger.error(
+            "Failed to load previous results",
+            exc_info=(failure.type, failure.value, failure.getTracebackObject()),
+        )
+        self._finish_loading(failure)
+        settings = self.crawler.settings
+        if settings.getbool("FEED_STORE_EMPTY") or any(
+            (options or {}).get("store_empty")
+            for options in settings.getdict("FEEDS").values()
+        ):
+            logger.warning(
+                "An empty feed will be stored since FEED_STORE_EMPTY is enabled"
+            )
+        # Loading can fail before the spider is opened, in which case spider_opened
+        # closes it once feed exports are ready
+        if self._spider_opened:
+            self._close_after_load_failure()
+
+    def spider_opened(self, spider: Spider):
+        """Close the spider if previous results already failed to load
+
+        :param spider: Spider object being run
+        """
+        from twisted.internet import reactor
+
+        self._spider_opened = True
+        if self._load_failure is not None:
+            # Close after other spider_opened receivers like feed exports have run
+            reactor.callLater(0, self._close_after_load_failure)
+
+    def _close_after_load_failure(self):
+        engine = self.crawler.engine
+        if hasattr(engine, "close_spider_async"):
+            deferred_from_coro(engine.close_spider_async(reason="diff_load_failed"))
+        else:
+            engine.close_spider(self.crawler.spider, "diff_load_failed")
+
+    def _finish_loading(self, failure: Optional[Failure]):
+        self._loading = None
+        self._load_failure = failure
+        waiters, self._load_waiters = self._load_waiters, []
+        for waiter in waiters:
+            if failure is None:
+                waiter.callback(None)
+            else:
+                waiter.errback(failure)
+
     def process_item(self, item: Mapping, spider: Spider) -> Mapping:
         """Processes Item objects or general dict-like objects and compares them to
         previously scraped values.
@@ -67,49 +428,133 @@ class DiffPipeline:
         :param spider: Spider currently being scraped
         :raises DropItem: Drops items with IDs that have been already scraped
         :raises DropItem: Drops items that are in the past and already scraped
-        :return: Returns the item, merged with previous values if found
+        :return: Returns the item, merged with previous values if found, or a Deferred
+                 firing with it if previous results are still loading
         """
+        if self._loading is not None:
+            waiter = Deferred()
+            self._load_waiters.append(waiter)
+            return waiter.addCallback(lambda _: self.process_item(item, spider))
+        if self._load_failure is not None:
+            self._load_failure.raiseException()
         # Merge uid if this is a current item
         id_key = "_id"
-        if isinstance(item, Meeting) or (isinstance(item, dict) and id_key not in item):
+        if isinstance(item, (Meeting, SlottedMeeting)) or (
+            isinstance(item, dict) and id_key not in item
+        ):
             if item["id"] in spider._scraped_ids:
                 raise DropItem("Item has already been scraped")
             spider._scraped_ids.add(item["id"])
             if item["id"] in spider._previous_map:
-                # Bypass __setitem__ call on Meeting to add uid
-                if isinstance(item, Meeting):
-                    item._values[id_key] = spider._previous_map[item["id"]]
-                else:
-                    item[id_key] = spider._previous_map[item["id"]]
+                uid = spider._previous_map[item["id"]]
+            elif self.delta_prefix and not item.get(id_key):
+                # Exporters create events after the delta feed records items, so new
+                # UIDs are set here for both to use
+                uid = "ocd-event/" + str(uuid1())
+            else:
+                return item
+            # Bypass __setitem__ call on Meeting to add uid
+            if isinstance(item, Meeting):
+                item._values[id_key] = uid
+            else:
+                item[id_key] = uid
             return item
         if self.output_format == "ocd":
             extras_dict = item.get("extras") or item.get("extra") or {}
             scraper_id = extras_dict.get("cityscrapers.org/id", "")
 
-        # Drop items that are already included or are in the past
-        dt_str = datetime.now().isoformat()[:19]
+        # Keep items from before the pages requested by incremental spiders unchanged
+        start = item.get("start", item.get("start_time"))
+        incremental_start = get_incremental_start(spider)
         if (
-            scraper_id in spider._scraped_ids
-            or item.get("start", item.get("start_time")) < dt_str
+            incremental_start
+            and start < incremental_start
+            and scraper_id not in spider._scraped_ids
         ):
+            spider._scraped_ids.add(scraper_id)
+            return item
+        # Drop items that are already included or are in the past
+        dt_str = RunClock.from_spider(spider).now_str
+        if scraper_id in spider._scraped_ids or start < dt_str:
             raise DropItem("Previous item is in scraped results or the past")
         # # If the item is upcoming and not scraped, mark it cancelled
         spider._scraped_ids.add(scraper_id)
+        if item.get("status") != CANCELLED:
+            self._cancelled_ids.add(scraper_id)
         return {**item, "status": CANCELLED}
 
     def spider_idle(self, spider: Spider):
-        """Add _previous_results to spider queue when current results finish
+        """Add previous results that weren't scraped to the spider queue in batches
+        when current results finish
 
         :param spider: Spider being scraped
         :raises DontCloseSpider: Makes sure spider isn't closed to make sure prior
                                  results are processed
         """
-        scraper = self.crawler.engine.scraper
-        self.crawler.signals.disconnect(self.spider_idle, signal=signals.spider_idle)
-        for item in spider._previous_results:
-            scraper._process_spidermw_output(item, None, Response(""), spider)
+        if self._replay_done:
+            return
+        if self._loading is not None:
+            # Wait for the next idle signal if previous results haven't loaded yet
+            raise DontCloseSpider
+        if self._replay_results is None:
+            dt_str = RunClock.from_spider(spider).now_str
+            self.crawler.stats.set_value(
+                "diff/replay_pending",
+                sum(
+                    1
+                    for previous_id, start in self._spill_index
+                    if self._should_replay(spider, previous_id, start, dt_str)
+                ),
+                spider=spider,
+            )
+            self._replay_results = self.iter_unscraped_results(spider)
+            self._replay_batch(spider)
         raise DontCloseSpider
 
+    def _replay_batch(self, spider: Spider):
+        """Send the next batch of previous results to the item pipelines, scheduling the
+        following batch once all items in this one have been processed
+        """
+        from twisted.internet import reactor
+
+        scraper = self.crawler.engine.scraper
+        if getattr(scraper, "slot", None) and scraper.slot.needs_backout():
+            reactor.callLater(0.1, self._replay_batch, spider)
+            return
+        batch_size = self.crawler.settings.getint(
+            "CITY_SCRAPERS_DIFF_REPLAY_BATCH_SIZE",
+            self.crawler.settings.getint("CONCURRENT_ITEMS", 100),
+        )
+        batch = list(islice(self._replay_results, max(batch_size, 1)))
+        if len(batch) == 0:
+            self._replay_done = True
+            return
+        dfds = []
+        for item in batch:
+            dfd = self._start_itemproc(scraper, item, spider)
+            if isinstance(dfd, Deferred):
+                dfds.append(dfd)
+        self.crawler.stats.inc_value("diff/replay_batches", spider=spider)
+        self.crawler.stats.inc_value("diff/replayed_count", len(batch), spider=spider)
+        # Schedule the next batch in a new reactor iteration after this one drains
+        DeferredList(dfds).addBoth(
+            lambda _: reactor.callLater(0, self._replay_batch, spider)
+        )
+
+    def _start_itemproc(self, scraper: Any, item: Mapping, spider: Spider) -> Any:
+        """Send a replayed item to the item pipelines with the entry point available in
+        the installed version of Scrapy
+
+        :return: Deferred firing once the item has been processed, if any
+        """
+        if hasattr(scraper, "start_itemproc_async"):
+            # Scrapy 2.14+
+            return deferred_from_coro(scraper.start_itemproc_async(item, response=None))
+        if hasattr(scraper, "start_itemproc"):
+            # Scrapy 2.13
+            return scraper.start_itemproc(item, response=None)
+        return scraper._process_spidermw_output(item, None, Response(""), spider)
+
     def load_previous_results(self) -> List[Mapping]:
         """Method that must be implemented for loading previously-scraped results
 
@@ -118,6 +563,123 @@ class DiffPipeline:
         """
         raise NotImplementedError
 
+    def iter_previous_results(self) -> Iterable[Mapping]:
+        """Iterate over previously scraped results. Defaults to the output of
+        ``load_previous_results``, and can be overridden to stream results from storage
+        without loading them all into memory.
+
+        :return: Items previously scraped and loaded from a storage backend
+        """
+        return iter(self.load_previous_results())
+
+    def get_previous_key(self) -> Optional[str]:
+        """Find the key of the most recent feed for the current spider. Reads the index
+        written by :class:`FeedIndexExtension` if ``CITY_SCRAPERS_FEED_INDEX_PREFIX`` is
+        set and it was updated in the last few days, otherwise falls back to listing the
+        last few days of feeds.
+
+        Relies on ``read_text`` and ``list_keys`` being implemented on subclasses.
+
+        :return: Key of the latest feed, or None if no feed is found
+        """
+        index_key = get_index_key(self.crawler.settings, self.spider.name)
+        if index_key:
+            index_text = self.read_text(index_key)
+            index = json.loads(index_text) if index_text else None
+            if index and is_recent_index(index):
+                return index["key"]
+
+        days_previous = 0
+        now = RunClock.from_spider(self.spider).localized_now(self.spider.timezone)
+        while days_previous <= MAX_DAYS_PREVIOUS:
+            spider_keys = [
+                key
+                for key in self.list_prefix(
+                    (now - timedelta(days=days_previous)).strftime(self.feed_prefix)
+                )
+                if f"{self.spider.name}." in key
+            ]
+            if len(spider_keys) > 0:
+                return sorted(spider_keys)[-1]
+            days_previous += 1
+        return None
+
+    def read_text(self, key: str) -> Optional[str]:
+        """Read an object from storage as text
+
+        :param key: Key of the object
+        :raises NotImplementedError: Required to be implemented on subclasses
+        :return: Text of the object, or None if it doesn't exist
+        """
+        raise NotImplementedError
+
+    def open_feed(
+        self, key: str, etag: Optional[str] = None
+    ) -> Tuple[Optional[str], Optional[Iterable[str]]]:
+        """Open a feed in storage to stream it line by line, unless its ETag matches
+
+        :param key: Key of the feed
+        :param etag: ETag of a locally cached copy of the feed, defaults to None
+        :raises NotImplementedError: Required to be implemented on subclasses
+        :return: Tuple of the feed's ETag and an iterable of its lines, or None instead
+                 of lines if the feed matches ``etag``. Feeds that don't exist have no
+                 ETag and no lines.
+        """
+        raise NotImplementedError
+
+    def write_text(self, key: str, text: str):
+        """Write text to an object in storage
+
+        :param key: Key of the object
+        :param text: Text to write
+        :raises NotImplementedError: Required to be implemented on subclasses
+        """
+        raise NotImplementedError
+
+    def list_keys(self, prefix: str) -> Iterable[str]:
+        """List all keys in storage starting with a prefix
+
+        :param prefix: Prefix to list
+        :raises NotImplementedError: Required to be implemented on subclasses
+        """
+        raise NotImplementedError
+
+    def get_client(self, location: Hashable, create_client: Callable[[], Any]) -> Any:
+        """Get a storage client, sharing it and its prefix listings with every other
+        pipeline in the process for the same location if
+        ``CITY_SCRAPERS_DIFF_SHARED_LOADER`` is enabled
+
+        :param location: Hashable identifier of the storage location
+        :param create_client: Function creating a storage client for the location
+        :return: Storage client
+        """
+        if not self.crawler.settings.getbool("CITY_SCRAPERS_DIFF_SHARED_LOADER"):
+            return create_client()
+        self.shared_storage = SharedStorage.get(location, create_client)
+        return self.shared_storage.client
+
+    def list_prefix(self, prefix: str) -> Iterable[str]:
+        """List all keys starting with a prefix, reusing the listing from other
+        pipelines in the process if storage is shared
+
+        :param prefix: Prefix to list
+        :return: Iterable of keys starting with the prefix
+        """
+        if self.shared_storage is None:
+            return self.list_keys(prefix)
+        return self.shared_storage.list_keys(prefix, self.list_keys)
+
+    def iter_feed(self, key: str) -> Iterable[Mapping]:
+        """Stream the items in a JSON lines feed
+
+        :param key: Key of the feed
+        :return: Iterable of items in the feed
+        """
+        _, lines = self.open_feed(key)
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+
 
 class AzureDiffPipeline(DiffPipeline):
     """Implements :class:`DiffPipeline` for Azure Blob Storage"""
@@ -131,48 +693,86 @@ class AzureDiffPipeline(DiffPipeline):
 
         from azure.storage.blob import ContainerClient
 
+        super().__init__(crawler, output_format)
         feed_uri = crawler.settings.get("FEED_URI")
         account_name, account_key = feed_uri[8::].split("@")[0].split(":")
         self.spider = crawler.spider
         self.container = feed_uri.split("@")[1].split("/")[0]
-        self.container_client = ContainerClient(
-            f"{account_name}.blob.core.windows.net",
-            self.container,
-            credential=account_key,
+        self.container_client = self.get_client(
+            ("azure", account_name, self.container),
+            lambda: ContainerClient(
+                f"{account_name}.blob.core.windows.net",
+                self.container,
+                credential=account_key,
+            ),
         )
         self.feed_prefix = crawler.settings.get(
             "CITY_SCRAPERS_DIFF_FEED_PREFIX", "%Y/%m/%d"
         )
-        super().__init__(crawler, output_format)
 
     def load_previous_results(self) -> List[Mapping]:
         """Loads previously scraped items on Azure Blob Storage
 
         :return: Previously scraped results
         """
-        max_days_previous = 3
-        days_previous = 0
-        tz = timezone(self.spider.timezone)
-        while days_previous <= max_days_previous:
-            matching_blobs = self.container_client.list_blobs(
-                name_starts_with=(
-                    tz.localize(datetime.now()) - timedelta(days=days_previous)
-                ).strftime(self.feed_prefix)
+        return list(self.iter_previous_results())
+
+    def iter_previous_results(self) -> Iterable[Mapping]:
+        blob_name = self.get_previous_key()
+        if blob_name is None:
+            return iter([])
+        return self.iter_feed(blob_name)
+
+    def read_text(self, key: str) -> Optional[str]:
+        from azure.core.exceptions import ResourceNotFoundError
+
+        try:
+            return (
+                self.container_client.get_blob_client(key)
+                .download_blob()
+                .content_as_text()
             )
-            spider_blobs = [
-                blob for blob in matching_blobs if f"{self.spider.name}." in blob.name
-            ]
-            if len(spider_blobs) > 0:
-                break
-            days_previous += 1
-
-        if len(spider_blobs) == 0:
-            return []
+        except ResourceNotFoundError:
+            return None
+
+    def open_feed(
+        self, key: str, etag: Optional[str] = None
+    ) -> Tuple[Optional[str], Optional[Iterable[str]]]:
+        from azure.core import MatchConditions
+        from azure.core.exceptions import (
+            ResourceNotFoundError,
+            ResourceNotModifiedError,
+        )
 
-        blob = sorted(spider_blobs, key=attrgetter("name"))[-1]
-        feed_blob = self.container_client.get_blob_client(blob.name)
-        feed_text = feed_blob.download_blob().content_as_text()
-        return [json.loads(line) for line in feed_text.split("\n") if line.strip()]
+        blob_client = self.container_client.get_blob_client(key)
+        try:
+            if etag:
+                downloader = blob_client.download_blob(
+                    etag=etag, match_condition=MatchConditions.IfModified
+                )
+            else:
+                downloader = blob_client.download_blob()
+        except ResourceNotModifiedError:
+            return etag, None
+        except ResourceNotFoundError:
+            return None, iter([])
+        return downloader.properties.etag, self._iter_chunk_lines(downloader.chunks())
+
+    def _iter_chunk_lines(self, chunks: Iterable[bytes]) -> Iterable[str]:
+        buffer = b""
+        for chunk in chunks:
+            *lines, buffer = (buffer + chunk).split(b"\n")
+            for line in lines:
+                yield line.decode("utf-8")
+        if buffer:
+            yield buffer.decode("utf-8")
+
+    def write_text(self, key: str, text: str):
+        self.container_client.upload_blob(key, text, overwrite=True)
+
+    def list_keys(self, prefix: str) -> Iterable[str]:
+        for blob in self.container_client.list_blobs(name_starts_with=prefix):
+            yield blob.name
 
 
 class S3DiffPipeline(DiffPipeline):
@@ -186,54 +786,71 @@ class S3DiffPipeline(DiffPipeline):
         """
         import boto3
 
+        super().__init__(crawler, output_format)
         parsed = urlparse(crawler.settings.get("FEED_URI"))
         self.spider = crawler.spider
         self.feed_prefix = crawler.settings.get(
             "CITY_SCRAPERS_DIFF_FEED_PREFIX", "%Y/%m/%d"
         )
         self.bucket = parsed.netloc
-        self.client = boto3.client(
-            "s3",
-            aws_access_key_id=crawler.settings.get("AWS_ACCESS_KEY_ID"),
-            aws_secret_access_key=crawler.settings.get("AWS_SECRET_ACCESS_KEY"),
+        self.client = self.get_client(
+            ("s3", self.bucket),
+            lambda: boto3.client(
+                "s3",
+                aws_access_key_id=crawler.settings.get("AWS_ACCESS_KEY_ID"),
+                aws_secret_access_key=crawler.settings.get("AWS_SECRET_ACCESS_KEY"),
+            ),
         )
-        super().__init__(crawler, output_format)
 
     def load_previous_results(self) -> List[Mapping]:
         """Load previously scraped items on AWS S3
 
         :return: Previously scraped results
         """
-        max_days_previous = 3
-        days_previous = 0
-        tz = timezone(self.spider.timezone)
-        while days_previous <= max_days_previous:
-            match_objects = self.client.list_objects(
-                Bucket=self.bucket,
-                Prefix=(
-                    tz.localize(datetime.now()) - timedelta(days=days_previous)
-                ).strftime(self.feed_prefix),
-                MaxKeys=1000,
+        return list(self.iter_previous_results())
+
+    def iter_previous_results(self) -> Iterable[Mapping]:
+        key = self.get_previous_key()
+        if key is None:
+            return iter([])
+        return self.iter_feed(key)
+
+    def read_text(self, key: str) -> Optional[str]:
+        try:
+            return (
+                self.client.get_object(Bucket=self.bucket, Key=key)
+                .get("Body")
+                .read()
+                .decode("utf-8")
             )
-            spider_objects = [
-                obj
-                for obj in match_objects.get("Contents", [])
-                if f"{self.spider.name}." in obj["Key"]
-            ]
-            if len(spider_objects) > 0:
-                break
-            days_previous += 1
-
-        if len(spider_objects) == 0:
-            return []
-        obj = sorted(spider_objects, key=itemgetter("Key"))[-1]
-        feed_text = (
-            self.client.get_object(Bucket=self.bucket, Key=obj["Key"])
-            .get("Body")
-            .read()
-            .decode("utf-8")
+        except self.client.exceptions.NoSuchKey:
+            return None
+
+    def open_feed(
+        self, key: str, etag: Optional[str] = None
+    ) -> Tuple[Optional[str], Optional[Iterable[str]]]:
+        kwargs = {"IfNoneMatch": etag} if etag else {}
+        try:
+            obj = self.client.get_object(Bucket=self.bucket, Key=key, **kwargs)
+        except self.client.exceptions.NoSuchKey:
+            return None, iter([])
+        except self.client.exceptions.ClientError as e:
+            if e.response.get("Error", {}).get("Code") == "304":
+                return etag, None
+            raise
+        return (
+            obj.get("ETag"),
+            (line.decode("utf-8") for line in obj.get("Body").iter_lines()),
         )
-        return [json.loads(line) for line in feed_text.split("\n") if line.strip()]
+
+    def write_text(self, key: str, text: str):
+        self.client.put_object(Body=text.encode(), Bucket=self.bucket, Key=key)
+
+    def list_keys(self, prefix: str) -> Iterable[str]:
+        paginator = self.client.get_paginator("list_objects")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            for obj in page.get("Contents", []):
+                yield obj["Key"]
 
 
 class GCSDiffPipeline(DiffPipeline):
@@ -247,40 +864,52 @@ class GCSDiffPipeline(DiffPipeline):
         """
         from google.cloud import storage
 
+        super().__init__(crawler, output_format)
         parsed = urlparse(crawler.settings.get("FEED_URI"))
         self.spider = crawler.spider
         self.feed_prefix = crawler.settings.get(
             "CITY_SCRAPERS_DIFF_FEED_PREFIX", "%Y/%m/%d"
         )
         self.bucket_name = parsed.netloc
-        self.client = storage.Client()
+        self.client = self.get_client(("gcs", self.bucket_name), storage.Client)
         self.bucket = self.client.bucket(self.bucket_name)
-        super().__init__(crawler, output_format)
 
     def load_previous_results(self) -> List[Mapping]:
         """Load previously scraped items on Google Cloud Storage
 
         :return: Previously scraped results
         """
-        max_days_previous = 3
-        days_previous = 0
-        tz = timezone(self.spider.timezone)
-        while days_previous <= max_days_previous:
-            match_blobs = self.client.list_blobs(
-                self.bucket_name,
-                prefix=(
-                    tz.localize(datetime.now()) - timedelta(days=days_previous)
-                ).strftime(self.feed_prefix),
-            )
-            spider_blobs = [
-                blob for blob in match_blobs if f"{self.spider.name}." in blob.name
-            ]
-            if len(spider_blobs) > 0:
-                break
-            days_previous += 1
-
-        if len(spider_blobs) == 0:
-            return []
-        blob = sorted(spider_blobs, key=attrgetter("name"))[-1]
-        feed_text = self.bucket.blob(blob.name).download_as_bytes().decode("utf-8")
-        return [json.loads(line) for line in feed_text.split("\n") if line.strip()]
+        return list(self.iter_previous_results())
+
+    def iter_previous_results(self) -> Iterable[Mapping]:
+        blob_name = self.get_previous_key()
+        if blob_name is None:
+            return iter([])
+        return self.iter_feed(blob_name)
+
+    def read_text(self, key: str) -> Optional[str]:
+        blob = self.bucket.get_blob(key)
+        if blob is None:
+            return None
+        return blob.download_as_bytes().decode("utf-8")
+
+    def open_feed(
+        self, key: str, etag: Optional[str] = None
+    ) -> Tuple[Optional[str], Optional[Iterable[str]]]:
+        blob = self.bucket.get_blob(key)
+        if blob is None:
+            return None, iter([])
+        if etag and blob.etag == etag:
+            return etag, None
+        return blob.etag, self._iter_blob_lines(blob)
+
+    def _iter_blob_lines(self, blob) -> Iterable[str]:
+        with blob.open("r", encoding="utf-8") as f:
+            yield from f
+
+    def write_text(self, key: str, text: str):
+        self.bucket.blob(key).upload_from_string(text.encode())
+
+    def list_keys(self, prefix: str) -> Iterable[str]:
+        for blob in self.client.list_blobs(self.bucket_name, prefix=prefix):
+            yield blob.name
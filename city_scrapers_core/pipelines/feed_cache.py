@@ -0,0 +1,132 @@
+import json
+import os
+import shutil
+from hashlib import sha256
+from tempfile import NamedTemporaryFile, TemporaryFile
+from typing import IO, Callable, Dict, Iterable, List, Optional, Tuple
+
+from scrapy.settings import Settings
+
+
+class FeedCache:
+    """Size-bounded LRU cache of previous feeds on the local filesystem, used by
+    :class:`DiffPipeline` to avoid downloading and decoding unchanged feeds.
+
+    Each feed is stored in a single file keyed by a hash of its storage location. The
+    first line is a JSON header with the feed's ETag and an index entry for each line
+    of the feed, so an unchanged feed can be indexed without decoding any items.
+
+    :param cache_dir: Directory to store cached feeds in
+    :param max_size: Maximum total size of cached feeds in bytes
+    """
+
+    def __init__(self, cache_dir: str, max_size: int):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> Optional["FeedCache"]:
+        """Create a cache from ``CITY_SCRAPERS_DIFF_CACHE_DIR`` and
+        ``CITY_SCRAPERS_DIFF_CACHE_SIZE``
+
+        :param settings: Current project settings
+        :return: Cache, or None if ``CITY_SCRAPERS_DIFF_CACHE_DIR`` is not set
+        """
+        cache_dir = settings.get("CITY_SCRAPERS_DIFF_CACHE_DIR")
+        if not cache_dir:
+            return None
+        return cls(
+            cache_dir,
+            settings.getint("CITY_SCRAPERS_DIFF_CACHE_SIZE", 100 * 1024 * 1024),
+        )
+
+    def get(self, key: str) -> Optional[Tuple[Dict, IO]]:
+        """Open a cached feed and mark it as recently used
+
+        :param key: Storage location of the feed
+        :return: Tuple of the cache header and the feed file positioned after it, or
+                 None if the feed isn't cached
+        """
+        path = self.path(key)
+        try:
+            feed_file = open(path, "r", encoding="utf-8")
+        except FileNotFoundError:
+            return None
+        try:
+            header = json.loads(feed_file.readline())
+        except ValueError:
+            feed_file.close()
+            return None
+        os.utime(path)
+        return header, feed_file
+
+    def put(
+        self,
+        key: str,
+        etag: Optional[str],
+        lines: Iterable[str],
+        index_line: Callable[[str], List],
+    ) -> Tuple[Dict, IO]:
+        """Write a feed to the cache along with an index entry for each line, then evict
+        the least recently used feeds until the cache is under its size limit
+
+        :param key: Storage location of the feed
+        :param etag: ETag of the feed in storage
+        :param lines: Lines of the feed
+        :param index_line: Function returning the index entry for a line of the feed
+        :return: Tuple of the cache header and the feed file positioned after it
+        """
+        entries = []
+        with TemporaryFile("w+", encoding="utf-8") as lines_file:
+            for line in lines:
+                if not line.strip():
+                    continue
+                entries.append(index_line(line))
+                lines_file.write(line.rstrip("\n") + "\n")
+            lines_file.seek(0)
+            header = {"key": key, "etag": etag, "entries": entries}
+            # Write to a temporary file first so other processes never see partial feeds
+            with NamedTemporaryFile(
+                "w", encoding="utf-8", dir=self.cache_dir, delete=False
+            ) as cache_file:
+                cache_file.write(json.dumps(header) + "\n")
+                shutil.copyfileobj(lines_file, cache_file)
+        os.replace(cache_file.name, self.path(key))
+        self.evict(keep=self.path(key))
+        return self.get(key)
+
+    def evict(self, keep: Optional[str] = None):
+        """Remove the least recently used feeds until the cache is under its size limit
+
+        :param keep: Path of a feed that shouldn't be removed
+        """
+        cache_files = []
+        for file_name in os.listdir(self.cache_dir):
+            if not file_name.endswith(".jsonl"):
+                continue
+            path = os.path.join(self.cache_dir, file_name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            cache_files.append((stat.st_mtime, stat.st_size, path))
+        total_size = sum(size for _, size, _ in cache_files)
+        for _, size, path in sorted(cache_files):
+            if total_size <= self.max_size:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+
+    def path(self, key: str) -> str:
+        """Get the local path of a cached feed
+
+        :param key: Storage location of the feed
+        :return: Path to the cache file
+        """
+        return os.path.join(self.cache_dir, f"{sha256(key.encode()).hexdigest()}.jsonl")
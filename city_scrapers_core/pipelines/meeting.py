@@ -18,6 +18,15 @@ class MeetingPipeline:
         :param item: Scraped item passed to pipeline
         :return: Processed item
         """
+        return self.process_meeting(item, spider)
+
+    def process_meeting(self, item: Item, spider: Spider) -> Item:
+        """Cleans up the title and end time of a meeting that hasn't been processed
+
+        :param item: Scraped item passed to pipeline
+        :param spider: Spider passed to the pipeline
+        :return: Processed item
+        """
         item["title"] = spider._clean_title(item["title"])
         # Set default end time of two hours later if end time is not present or if it's
         # the same time as the start
@@ -1,18 +1,72 @@
-from datetime import datetime
-from typing import Mapping
+import json
+from hashlib import sha1
+from typing import Any, Dict, Mapping, NamedTuple, Optional
 from uuid import uuid1
 
-import pytz
 from scrapy import Spider
+from scrapy.settings import Settings
+from scrapy.utils.misc import load_object
 
+from ..clock import RunClock
 from ..decorators import ignore_processed
 
 
+class EventValue(NamedTuple):
+    """Placeholder in an OCD event template for a value that changes across events"""
+
+    name: str
+
+
+class _EventPlaceholders(dict):
+    """Event values where every value is an :class:`EventValue` placeholder"""
+
+    def __missing__(self, name: str) -> EventValue:
+        return EventValue(name)
+
+
+def _get_class_output_format(obj: Any) -> Optional[str]:
+    try:
+        cls = load_object(obj) if isinstance(obj, str) else obj
+    except (ImportError, NameError, ValueError):
+        return None
+    return getattr(cls, "output_format", None)
+
+
+def get_output_format(settings: Settings) -> Optional[str]:
+    """Get the format of items output by the enabled item pipelines or feed exporters
+    from the ``output_format`` attribute of their classes, so that subclasses and
+    pipelines combining :class:`OpenCivicDataPipeline` with other stages are detected
+
+    :param settings: Scrapy settings
+    :return: Output format like "ocd", or None if no pipeline or exporter declares one
+    """
+    pipelines = settings.getdict("ITEM_PIPELINES")
+    for pipeline, priority in pipelines.items():
+        if priority is None:
+            continue
+        output_format = _get_class_output_format(pipeline)
+        if output_format:
+            return output_format
+    exporters = settings.getwithbase("FEED_EXPORTERS")
+    for feed_options in settings.getdict("FEEDS").values():
+        exporter = exporters.get((feed_options or {}).get("format"))
+        output_format = exporter and _get_class_output_format(exporter)
+        if output_format:
+            return output_format
+    return None
+
+
 class OpenCivicDataPipeline:
     """Pipeline for transforming Meeting items into the `Open Civic Data Event format
     <https://opencivicdata.readthedocs.io/en/latest/data/event.html>`_.
+
+    Each event includes a fingerprint of the meeting's content in its extras. If
+    :class:`DiffPipeline` found a previous event with the same fingerprint, its
+    ``updated_at`` value is reused so unchanged meetings produce identical output.
     """
 
+    output_format = "ocd"
+
     @ignore_processed
     def process_item(self, item: Mapping, spider: Spider) -> Mapping:
         """Takes a dict-like object and converts it into an Open Civic Data Event.
@@ -21,26 +75,52 @@ class OpenCivicDataPipeline:
         :param spider: Current spider being run
         :return: Dict formatted as an OCD event
         """
+        return self.create_event(item, spider)
 
-        tz = pytz.timezone(spider.timezone)
+    def create_event(self, item: Mapping, spider: Spider) -> Mapping:
+        """Converts an item that hasn't been processed into an Open Civic Data Event
+
+        :param item: Item to be converted
+        :param spider: Current spider being run
+        :return: Dict formatted as an OCD event
+        """
+        return self.build_event(spider, self.create_event_values(item, spider))
+
+    def create_event_template(self, spider: Spider) -> Mapping:
+        """Creates the structure of every OCD event from a spider, with values that are
+        the same for each event filled in and :class:`EventValue` placeholders for the
+        values returned by :meth:`create_event_values`
+
+        :param spider: Current spider being run
+        :return: Dict of an OCD event with placeholders
+        """
+        return self.build_event(spider, _EventPlaceholders())
+
+    def build_event(self, spider: Spider, values: Mapping[str, Any]) -> Mapping:
+        """Builds an OCD event from the values of :meth:`create_event_values`. Events
+        and the template used by :class:`OpenCivicDataJsonLinesItemExporter` are both
+        built here, so they always have the same structure.
+
+        :param spider: Current spider being run
+        :param values: Dict of value names to values
+        :return: Dict formatted as an OCD event
+        """
         return {
             "_type": "event",
-            "_id": item.get("_id") or "ocd-event/" + str(uuid1()),
-            "updated_at": tz.localize(datetime.now()).isoformat(timespec="seconds"),
-            "name": item["title"],
-            "description": item["description"],
-            "classification": item["classification"],
-            "status": item["status"],
-            "all_day": item["all_day"],
-            "start_time": tz.localize(item["start"]).isoformat(timespec="seconds"),
-            "end_time": tz.localize(item["end"]).isoformat(timespec="seconds"),
+            "_id": values["_id"],
+            "updated_at": values["updated_at"],
+            "name": values["name"],
+            "description": values["description"],
+            "classification": values["classification"],
+            "status": values["status"],
+            "all_day": values["all_day"],
+            "start_time": values["start_time"],
+            "end_time": values["end_time"],
             "timezone": spider.timezone,
-            "location": self.create_location(item),
+            "location": values["location"],
             "documents": [],
-            "links": [
-                {"note": link["title"], "url": link["href"]} for link in item["links"]
-            ],
-            "sources": [{"url": item["source"], "note": ""}],
+            "links": values["links"],
+            "sources": values["sources"],
             "participants": [
                 {
                     "note": "host",
@@ -52,13 +132,86 @@ class OpenCivicDataPipeline:
                 }
             ],
             "extras": {
-                "cityscrapers.org/id": item["id"],
+                "cityscrapers.org/id": values["id"],
                 "cityscrapers.org/agency": spider.agency,
-                "cityscrapers.org/time_notes": item.get("time_notes", ""),
-                "cityscrapers.org/address": item["location"]["address"],
+                "cityscrapers.org/time_notes": values["time_notes"],
+                "cityscrapers.org/address": values["address"],
+                "cityscrapers.org/fingerprint": values["fingerprint"],
             },
         }
 
+    def create_event_values(
+        self, item: Mapping, spider: Spider, clock: Optional[RunClock] = None
+    ) -> Dict[str, Any]:
+        """Creates the values of an item's OCD event that change across events, keyed
+        by the names used in :meth:`build_event`
+
+        :param item: Item to be converted
+        :param spider: Current spider being run
+        :param clock: Clock of the spider's run, looked up if not provided
+        :return: Dict of placeholder names to values
+        """
+        clock = clock or RunClock.from_spider(spider)
+        fingerprint = self.create_fingerprint(item, spider)
+        previous_update = getattr(spider, "_previous_updates", {}).get(item["id"])
+        if previous_update and previous_update[0] == fingerprint:
+            updated_at = previous_update[1]
+        else:
+            updated_at = clock.now_isoformat(spider.timezone)
+        return {
+            "_id": item.get("_id") or "ocd-event/" + str(uuid1()),
+            "updated_at": updated_at,
+            "name": item["title"],
+            "description": item["description"],
+            "classification": item["classification"],
+            "status": item["status"],
+            "all_day": item["all_day"],
+            "start_time": clock.isoformat(spider.timezone, item["start"]),
+            "end_time": clock.isoformat(spider.timezone, item["end"]),
+            "location": self.create_location(item),
+            "links": [
+                {"note": link["title"], "url": link["href"]} for link in item["links"]
+            ],
+            "sources": [{"url": item["source"], "note": ""}],
+            "id": item["id"],
+            "time_notes": item.get("time_notes", ""),
+            "address": item["location"]["address"],
+            "fingerprint": fingerprint,
+        }
+
+    def create_fingerprint(self, item: Mapping, spider: Spider) -> str:
+        """Creates a stable hash of the values of a scraped item that are included in
+        its OCD event, aside from its UID and updated time
+
+        :param item: Item to fingerprint
+        :param spider: Current spider being run
+        :return: Hex digest of the item's content
+        """
+        content = [
+            spider.agency,
+            spider.timezone,
+            *[
+                item.get(field)
+                for field in [
+                    "id",
+                    "title",
+                    "description",
+                    "classification",
+                    "status",
+                    "all_day",
+                    "start",
+                    "end",
+                    "time_notes",
+                    "location",
+                    "links",
+                    "source",
+                ]
+            ],
+        ]
+        return sha1(
+            json.dumps(content, sort_keys=True, default=str).encode()
+        ).hexdigest()
+
     def create_location(self, item: Mapping) -> Mapping:
         """Creates an OCD-formatted location from a scraped item's data
 
@@ -0,0 +1,184 @@
+from numbers import Number
+from typing import Any, Callable, Dict, Iterable, Mapping, Set
+
+from jsonschema.validators import Draft7Validator
+
+# Keywords that never produce validation errors, including "format" because
+# ValidationPipeline has never validated with a format checker
+IGNORED_KEYWORDS = {
+    "$comment",
+    "$id",
+    "$schema",
+    "default",
+    "definitions",
+    "description",
+    "examples",
+    "format",
+    "title",
+}
+
+# Top-level keywords that either can't produce errors or only produce errors without a
+# property path, which ValidationPipeline doesn't count. This only applies to boolean
+# values of additionalProperties.
+ROOT_KEYWORDS = IGNORED_KEYWORDS | {
+    "additionalProperties",
+    "properties",
+    "required",
+    "type",
+}
+
+TYPE_CHECKS: Dict[str, Callable[[Any], bool]] = {
+    "array": lambda value: isinstance(value, list),
+    "boolean": lambda value: isinstance(value, bool),
+    "integer": lambda value: (isinstance(value, int) and not isinstance(value, bool))
+    or (isinstance(value, float) and value.is_integer()),
+    "null": lambda value: value is None,
+    "number": lambda value: isinstance(value, Number) and not isinstance(value, bool),
+    "object": lambda value: isinstance(value, dict),
+    "string": lambda value: isinstance(value, str),
+}
+
+
+class SchemaChecker:
+    """Validation plan compiled once from an item's JSON schema and reused for every
+    item of that class. Each top-level property gets a single check function built
+    from fast type, enum and required checks, and any keywords that aren't handled
+    directly fall back to a :class:`Draft7Validator` for that property only.
+
+    Results match counting the first path element of every error reported by
+    :class:`Draft7Validator` for the whole schema.
+
+    :param schema: JSON schema to compile
+    """
+
+    def __init__(self, schema: Mapping):
+        self.schema = schema
+        self.props = list(schema.get("properties", {}).keys())
+        self.validator = None
+        self.error_validator = None
+        self.checks = None
+        if set(schema.keys()) - ROOT_KEYWORDS or not isinstance(
+            schema.get("additionalProperties", True), bool
+        ):
+            self.validator = Draft7Validator(schema)
+        else:
+            self.checks = {
+                prop: self.compile(prop_schema)
+                for prop, prop_schema in schema.get("properties", {}).items()
+            }
+
+    def get_error_props(self, item_dict: Mapping) -> Set[str]:
+        """Get the top-level properties of an item that fail validation
+
+        :param item_dict: Dictionary of item values with JSON-compatible types
+        :return: Set of property names with at least one validation error
+        """
+        if self.checks is None:
+            return {
+                error.path[0]
+                for error in self.validator.iter_errors(item_dict)
+                if len(error.path) > 0
+            }
+        return {
+            prop
+            for prop, check in self.checks.items()
+            if prop in item_dict and not check(item_dict[prop])
+        }
+
+    def get_error_details(
+        self, item_dict: Mapping, error_props: Iterable[str]
+    ) -> Dict[str, Dict]:
+        """Get the values and error messages of invalid properties. This uses the full
+        :class:`Draft7Validator`, so it should only be called for items that failed.
+
+        :param item_dict: Dictionary of item values with JSON-compatible types
+        :param error_props: Properties of the item that failed validation
+        :return: Dictionary of properties to their value and list of error messages
+        """
+        if self.error_validator is None:
+            self.error_validator = Draft7Validator(self.schema)
+        details = {
+            prop: {"value": item_dict.get(prop), "messages": []} for prop in error_props
+        }
+        for error in self.error_validator.iter_errors(item_dict):
+            if len(error.path) > 0 and error.path[0] in details:
+                details[error.path[0]]["messages"].append(error.message)
+        return details
+
+    def compile(self, schema: Any) -> Callable[[Any], bool]:
+        """Compile a subschema into a function returning whether a value is valid
+
+        :param schema: Subschema to compile
+        :return: Function returning True if a value is valid
+        """
+        if schema is True or schema == {}:
+            return lambda value: True
+        if not isinstance(schema, dict):
+            return self.fallback(schema)
+        checks = []
+        for keyword, keyword_value in schema.items():
+            if keyword in IGNORED_KEYWORDS:
+                continue
+            check = self.compile_keyword(keyword, keyword_value)
+            if check is None:
+                return self.fallback(schema)
+            checks.append(check)
+        if len(checks) == 1:
+            return checks[0]
+        return lambda value: all(check(value) for check in checks)
+
+    def compile_keyword(
+        self, keyword: str, keyword_value: Any
+    ) -> Callable[[Any], bool]:
+        """Compile a single keyword of a subschema
+
+        :param keyword: Schema keyword
+        :param keyword_value: Value of the keyword in the schema
+        :return: Function returning True if a value is valid, or None if the keyword
+                 isn't supported
+        """
+        if keyword == "type":
+            types = [keyword_value] if isinstance(keyword_value, str) else keyword_value
+            if not all(type_name in TYPE_CHECKS for type_name in types):
+                return None
+            type_checks = [TYPE_CHECKS[type_name] for type_name in types]
+            if len(type_checks) == 1:
+                return type_checks[0]
+            return lambda value: any(check(value) for check in type_checks)
+        if keyword == "enum":
+            # Only string enums are handled directly to avoid differences in how
+            # jsonschema compares booleans and numbers
+            if not all(isinstance(option, str) for option in keyword_value):
+                return None
+            options = frozenset(keyword_value)
+            return lambda value: isinstance(value, str) and value in options
+        if keyword == "required":
+            required = list(keyword_value)
+            return lambda value: not isinstance(value, dict) or all(
+                key in value for key in required
+            )
+        if keyword == "properties":
+            prop_checks = [
+                (prop, self.compile(prop_schema))
+                for prop, prop_schema in keyword_value.items()
+            ]
+            return lambda value: not isinstance(value, dict) or all(
+                check(value[prop]) for prop, check in prop_checks if prop in value
+            )
+        if keyword == "items" and isinstance(keyword_value, (dict, bool)):
+            item_check = self.compile(keyword_value)
+            return lambda value: not isinstance(value, list) or all(
+                item_check(list_item) for list_item in value
+            )
+        return None
+
+    def fallback(self, schema: Any) -> Callable[[Any], bool]:
+        """Create a check for a subschema using :class:`Draft7Validator`, including
+        the root schema's definitions so that references still resolve
+
+        :param schema: Subschema that can't be compiled directly
+        :return: Function returning True if a value is valid
+        """
+        if isinstance(schema, dict) and "definitions" in self.schema:
+            schema = {"definitions": self.schema["definitions"], **schema}
+        return Draft7Validator(schema).is_valid
@@ -0,0 +1,53 @@
+from threading import Lock
+from typing import Any, Callable, Dict, Hashable, Iterable, List
+
+
+class SharedStorage:
+    """Storage client and prefix listings shared by every :class:`DiffPipeline` in a
+    process that reads from the same storage location. When many crawlers run in one
+    process, each date prefix is only listed once instead of once per spider.
+
+    :param client: Storage client to share
+    """
+
+    _instances: Dict[Hashable, "SharedStorage"] = {}
+    _instances_lock = Lock()
+
+    def __init__(self, client: Any):
+        self.client = client
+        self.prefix_keys: Dict[str, List[str]] = {}
+        self.lock = Lock()
+
+    @classmethod
+    def get(cls, location: Hashable, create_client: Callable[[], Any]):
+        """Get the shared storage for a location, creating it if needed
+
+        :param location: Hashable identifier of the storage location
+        :param create_client: Function creating a storage client for the location
+        :return: Shared storage for the location
+        """
+        with cls._instances_lock:
+            if location not in cls._instances:
+                cls._instances[location] = cls(create_client())
+            return cls._instances[location]
+
+    @classmethod
+    def clear(cls):
+        """Remove all shared storage instances"""
+        with cls._instances_lock:
+            cls._instances = {}
+
+    def list_keys(
+        self, prefix: str, list_keys: Callable[[str], Iterable[str]]
+    ) -> List[str]:
+        """List keys for a prefix, only calling ``list_keys`` the first time a prefix
+        is requested in this process
+
+        :param prefix: Prefix to list
+        :param list_keys: Function listing keys for a prefix from storage
+        :return: List of keys starting with the prefix
+        """
+        with self.lock:
+            if prefix not in self.prefix_keys:
+                self.prefix_keys[prefix] = list(list_keys(prefix))
+            return self.prefix_keys[prefix]
@@ -1,16 +1,200 @@
+import json
 import logging
+import math
+import os
+import random
 from collections import defaultdict
-from typing import Mapping
+from concurrent.futures import (
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from copy import deepcopy
+from datetime import datetime
+from threading import Lock
+from timeit import default_timer
+from typing import Dict, List, Mapping, Optional, Set, Tuple
+from urllib.parse import urlparse
 
-from jsonschema.validators import Draft7Validator
 from scrapy import Spider
 from scrapy.crawler import Crawler
+from scrapy.utils.misc import load_object
+from twisted.internet.defer import Deferred
+from twisted.internet.threads import deferToThread
+
+from .schema_checker import SchemaChecker
 
 logger = logging.getLogger(__name__)
 
+# z-score for 95% confidence intervals on sampled pass rates
+CONFIDENCE_Z = 1.96
+
+
+def get_confidence_interval(
+    passed: int, total: int, z: float = CONFIDENCE_Z
+) -> Tuple[float, float]:
+    """Get the Wilson score interval for a pass rate estimated from a sample
+
+    :param passed: Number of sampled items that passed
+    :param total: Number of sampled items
+    :param z: z-score of the confidence level, defaults to 95%
+    :return: Tuple of the lower and upper bounds of the pass rate
+    """
+    if total == 0:
+        return 0.0, 1.0
+    rate = passed / total
+    denominator = 1 + z**2 / total
+    center = (rate + z**2 / (2 * total)) / denominator
+    margin = (
+        z * math.sqrt(rate * (1 - rate) / total + z**2 / (4 * total**2))
+    ) / denominator
+    return max(0.0, center - margin), min(1.0, center + margin)
+
+
+def get_percentile(values: List[float], percentile: float) -> float:
+    """Get a percentile of a list of values using the nearest-rank method
+
+    :param values: List of values
+    :param percentile: Percentile between 0 and 100
+    :return: Value at the percentile, or 0 if the list is empty
+    """
+    if len(values) == 0:
+        return 0.0
+    sorted_values = sorted(values)
+    rank = math.ceil(percentile / 100 * len(sorted_values))
+    return sorted_values[max(rank, 1) - 1]
+
+
+_batch_checkers: Dict[str, SchemaChecker] = {}
+
+_executors: Dict[str, Executor] = {}
+_executors_lock = Lock()
+
+
+def get_executor(worker: str, max_workers: int) -> Executor:
+    """Get the executor shared by every validation pipeline in the process for a kind
+    of worker, so crawls of many spiders don't start a pool for each one. The pool is
+    created with ``max_workers`` the first time it's requested.
+
+    :param worker: "thread" or "process"
+    :param max_workers: Maximum number of workers in the pool
+    :return: Shared executor
+    """
+    with _executors_lock:
+        executor = _executors.get(worker)
+        if executor is None:
+            executor_cls = (
+                ThreadPoolExecutor if worker == "thread" else ProcessPoolExecutor
+            )
+            executor = executor_cls(max_workers=max(max_workers, 1))
+            _executors[worker] = executor
+        return executor
+
+
+def validate_batch(
+    schema: Mapping, item_dicts: List[Mapping], error_details: bool = False
+) -> Tuple[List[str], List[Tuple[Set[str], float, Optional[Dict]]]]:
+    """Validate a batch of item snapshots against a schema. This runs in a worker thread
+    or process, so checkers are cached by the schema's contents.
+
+    :param schema: JSON schema to validate against
+    :param item_dicts: Dictionaries of item values with JSON-compatible types
+    :param error_details: Whether to include values and messages for invalid items
+    :return: Tuple of the schema's properties and a list with the invalid properties,
+             time spent validating in seconds, and error details for each item
+    """
+    schema_key = json.dumps(schema, sort_keys=True, default=str)
+    checker = _batch_checkers.get(schema_key)
+    if checker is None:
+        checker = SchemaChecker(schema)
+        _batch_checkers[schema_key] = checker
+    results = []
+    for item_dict in item_dicts:
+        start_time = default_timer()
+        error_props = checker.get_error_props(item_dict)
+        elapsed = default_timer() - start_time
+        details = None
+        if error_details and error_props:
+            details = checker.get_error_details(item_dict, error_props)
+        results.append((error_props, elapsed, details))
+    return checker.props, results
+
 
 class ValidationPipeline:
-    """Pipeline for validating whether a scraper's results match the expected schema."""
+    """Pipeline for validating whether a scraper's results match the expected schema.
+
+    Each item class's schema is compiled into a :class:`SchemaChecker` the first time
+    an item of that class is validated, and the checker is reused for later items.
+
+    By default every item is validated. For production crawls, validation can be
+    limited to a random sample of items with ``CITY_SCRAPERS_VALIDATION_SAMPLE_RATE``
+    (validate 1 in N items) and ``CITY_SCRAPERS_VALIDATION_TIME_FRACTION`` (the
+    maximum fraction of crawl time spent validating). When only the sample rate is
+    set, the summary includes 95% confidence bounds for each property's pass rate,
+    and validation only fails if the upper bound is below the 90% threshold. Items
+    validated within a time budget depend on when they're scraped rather than being
+    chosen at random, so those summaries have no bounds and use the sampled pass
+    rate. The summary's "sample_method" is "random", "time_fraction" or None.
+
+    Setting ``CITY_SCRAPERS_VALIDATION_WORKER`` to "thread" or "process" moves
+    validation off the reactor thread. Snapshots of items are validated in batches of
+    ``CITY_SCRAPERS_VALIDATION_BATCH_SIZE`` by a worker, items continue through the
+    pipeline without waiting for their results, and all results are merged into the
+    error counts before the report runs in ``close_spider``. Workers come from a pool
+    of up to ``CITY_SCRAPERS_VALIDATION_MAX_WORKERS`` shared by every spider in the
+    process, and ``close_spider`` waits for batches in a thread so the reactor isn't
+    blocked. With a worker, the time fraction only limits the time spent copying items
+    on the reactor thread.
+
+    Setting ``CITY_SCRAPERS_VALIDATION_REPORT_URI`` writes a JSON report for each spider
+    with its pass rates, up to ``CITY_SCRAPERS_VALIDATION_REPORT_SAMPLES`` failing
+    values and error messages for each property, the total, p50 and p99 time spent
+    validating each item, and the time spent on the reactor thread and in workers. The
+    URI can be a local path or use any scheme in
+    ``FEED_STORAGES``, and can include ``%(name)s``, ``%(year)s``, ``%(month)s``,
+    ``%(day)s`` and ``%(time)s`` parameters.
+
+    :param enforce_validation: Whether to raise an error if validation fails
+    :param sample_rate: Validate a random 1 in ``sample_rate`` items
+    :param time_fraction: Maximum fraction of crawl time to spend validating, or 0 for
+                          no limit
+    :param worker: "thread" or "process" to validate batches in a worker, or None to
+                   validate each item in ``process_item``
+    :param batch_size: Number of items to validate in each batch
+    :param max_workers: Maximum number of workers in the shared pool
+    :param report_uri: URI template to write a JSON report to, or None to skip it
+    :param report_samples: Maximum number of failing values to include in the report
+                           for each property
+    """
+
+    _checkers: Dict[type, SchemaChecker] = {}
+
+    def __init__(
+        self,
+        enforce_validation: bool = False,
+        sample_rate: int = 1,
+        time_fraction: float = 0,
+        worker: Optional[str] = None,
+        batch_size: int = 100,
+        report_uri: Optional[str] = None,
+        report_samples: int = 5,
+        max_workers: int = 2,
+    ):
+        if worker not in (None, "", "thread", "process"):
+            raise ValueError(f"Unknown validation worker: {worker}")
+        self.enforce_validation = enforce_validation
+        self.sample_rate = max(sample_rate, 1)
+        self.time_fraction = time_fraction
+        self.worker = worker or None
+        self.batch_size = max(batch_size, 1)
+        self.max_workers = max_workers
+        self.report_uri = report_uri or None
+        self.report_samples = report_samples
+        self.random = random.Random()
+        self.executor = None
+        self.crawler = None
 
     @classmethod
     def from_crawler(cls, crawler: Crawler):
@@ -19,25 +203,98 @@ class ValidationPipeline:
         :param crawler: Current Crawler object
         :return: Created pipeline
         """
-        obj = cls()
-        obj.enforce_validation = crawler.settings.getbool(
-            "CITY_SCRAPERS_ENFORCE_VALIDATION"
+        obj = cls(
+            enforce_validation=crawler.settings.getbool(
+                "CITY_SCRAPERS_ENFORCE_VALIDATION"
+            ),
+            sample_rate=crawler.settings.getint(
+                "CITY_SCRAPERS_VALIDATION_SAMPLE_RATE", 1
+            ),
+            time_fraction=crawler.settings.getfloat(
+                "CITY_SCRAPERS_VALIDATION_TIME_FRACTION", 0
+            ),
+            worker=crawler.settings.get("CITY_SCRAPERS_VALIDATION_WORKER"),
+            batch_size=crawler.settings.getint(
+                "CITY_SCRAPERS_VALIDATION_BATCH_SIZE", 100
+            ),
+            report_uri=crawler.settings.get("CITY_SCRAPERS_VALIDATION_REPORT_URI"),
+            report_samples=crawler.settings.getint(
+                "CITY_SCRAPERS_VALIDATION_REPORT_SAMPLES", 5
+            ),
+            max_workers=crawler.settings.getint(
+                "CITY_SCRAPERS_VALIDATION_MAX_WORKERS", 2
+            ),
         )
+        obj.crawler = crawler
         return obj
 
+    @property
+    def sampling(self) -> bool:
+        """Whether only a sample of items is validated"""
+        return self.sample_rate > 1 or self.time_fraction > 0
+
+    @property
+    def sample_method(self) -> Optional[str]:
+        """How items are sampled: "random" if items are only sampled at random,
+        "time_fraction" if a time budget also limits which items are validated, or
+        None if every item is validated"""
+        if self.time_fraction > 0:
+            return "time_fraction"
+        if self.sample_rate > 1:
+            return "random"
+        return None
+
     def open_spider(self, spider: Spider):
         """Set initial item count and error count for tracking
 
         :param spider: Spider object being run
         """
         self.item_count = 0
+        self.scraped_count = 0
         self.error_count = defaultdict(int)
+        self.start_time = default_timer()
+        # Time spent validating or copying items on the thread calling the pipeline,
+        # which is what the time fraction limits, and time spent validating in workers
+        self.validation_time = 0.0
+        self.worker_time = 0.0
+        self.durations: List[float] = []
+        self.error_samples = defaultdict(list)
+        self.pending: Dict[type, Tuple[Mapping, List[Mapping]]] = {}
+        self.futures: List[Future] = []
+        if self.worker is not None:
+            self.executor = get_executor(self.worker, self.max_workers)
 
-    def close_spider(self, spider: Spider):
-        """Run validation report when Spider is closed
+    def close_spider(self, spider: Spider) -> Optional[Deferred]:
+        """Wait for any batches in progress, write the JSON report if configured, and
+        run validation report when Spider is closed
 
         :param spider: Spider object being run
+        :return: Deferred that fires once batches are merged and the report is stored,
+                 if batches are in progress or the report is stored remotely
         """
+        if self.executor is not None:
+            for item_cls in list(self.pending.keys()):
+                self.submit_batch(item_cls)
+            # The executor is shared with other spiders, so it's left running
+            self.executor = None
+            if not all(future.done() for future in self.futures):
+                return deferToThread(wait, self.futures).addCallback(
+                    lambda _: self.finish_validation(spider)
+                )
+        return self.finish_validation(spider)
+
+    def finish_validation(self, spider: Spider) -> Optional[Deferred]:
+        """Merge the results of all batches, write the JSON report if configured, and
+        run validation report
+
+        :param spider: Spider object being run
+        :return: Deferred that fires once the report is stored, if it's stored remotely
+        """
+        self.merge_results(wait=True)
+        if self.report_uri:
+            stored = self.write_report(spider)
+            if isinstance(stored, Deferred):
+                return stored.addCallback(lambda _: self.validation_report(spider))
         self.validation_report(spider)
 
     def process_item(self, item: Mapping, spider: Spider) -> Mapping:
@@ -49,36 +306,242 @@ class ValidationPipeline:
         """
         if not hasattr(item, "jsonschema"):
             return item
+        self.scraped_count += 1
+        if not self.should_validate():
+            return item
+        start_time = default_timer()
         item_dict = dict(item)
         item_dict["start"] = item_dict["start"].isoformat()[:19]
         item_dict["end"] = item_dict["end"].isoformat()[:19]
-        validator = Draft7Validator(item.jsonschema)
-        props = list(item.jsonschema["properties"].keys())
-        errors = list(validator.iter_errors(item_dict))
-        error_props = self._get_props_from_errors(errors)
+        if self.executor is not None:
+            # Copy nested values so later pipelines can't change them before the
+            # snapshot is validated
+            self.pending.setdefault(type(item), (item.jsonschema, []))[1].append(
+                deepcopy(item_dict)
+            )
+            if len(self.pending[type(item)][1]) >= self.batch_size:
+                self.submit_batch(type(item))
+            self.validation_time += default_timer() - start_time
+            self.merge_results()
+            return item
+        checker = self.get_checker(item)
+        error_props = checker.get_error_props(item_dict)
+        elapsed = default_timer() - start_time
+        details = None
+        if error_props and self.needs_error_samples(error_props):
+            details = checker.get_error_details(item_dict, error_props)
+        self.record_result(checker.props, error_props, elapsed, details)
+        self.validation_time += default_timer() - start_time
+        return item
+
+    def record_result(
+        self,
+        props: List[str],
+        error_props: Set[str],
+        elapsed: float,
+        details: Optional[Dict] = None,
+    ):
+        """Add the validation result of an item to the error counts and timings
+
+        :param props: Properties in the item's schema
+        :param error_props: Properties of the item that failed validation
+        :param elapsed: Time spent validating the item in seconds
+        :param details: Values and error messages of invalid properties, if available
+        """
         for prop in props:
             self.error_count[prop] += 1 if prop in error_props else 0
         self.item_count += 1
-        return item
+        self.durations.append(elapsed)
+        for prop, prop_details in (details or {}).items():
+            if len(self.error_samples[prop]) < self.report_samples:
+                self.error_samples[prop].append(prop_details)
+
+    def needs_error_samples(self, error_props: Set[str]) -> bool:
+        """Check whether error details should be collected for an invalid item
+
+        :param error_props: Properties of the item that failed validation
+        :return: Whether the report is enabled and any property needs more samples
+        """
+        return self.report_uri is not None and any(
+            len(self.error_samples[prop]) < self.report_samples for prop in error_props
+        )
+
+    def submit_batch(self, item_cls: type):
+        """Submit pending item snapshots of a class to the worker for validation
+
+        :param item_cls: Class of the pending items
+        """
+        schema, item_dicts = self.pending.pop(item_cls)
+        self.futures.append(
+            self.executor.submit(
+                validate_batch, schema, item_dicts, self.report_uri is not None
+            )
+        )
+
+    def merge_results(self, wait: bool = False):
+        """Merge the results of completed batches into the error counts. Results are
+        only merged on the thread calling the pipeline, so counts are never updated
+        concurrently.
+
+        :param wait: Whether to wait for all submitted batches to complete
+        """
+        remaining = []
+        for future in self.futures:
+            if not wait and not future.done():
+                remaining.append(future)
+                continue
+            props, results = future.result()
+            for error_props, elapsed, details in results:
+                self.worker_time += elapsed
+                self.record_result(props, error_props, elapsed, details)
+        self.futures = remaining
+
+    def should_validate(self) -> bool:
+        """Determine whether the current item should be included in the sample. Items
+        are sampled at random so that pass rate estimates aren't biased by the order
+        items are scraped in.
+
+        :return: Whether the item should be validated
+        """
+        if self.sample_rate > 1 and self.random.randrange(self.sample_rate) != 0:
+            return False
+        # Only time spent on the thread calling the pipeline counts, since workers
+        # don't hold up the crawl
+        if self.time_fraction > 0 and self.validation_time > 0:
+            elapsed = default_timer() - self.start_time
+            return self.validation_time <= elapsed * self.time_fraction
+        return True
+
+    def get_checker(self, item: Mapping) -> SchemaChecker:
+        """Get the compiled schema checker for an item's class, creating it if needed
+
+        :param item: Item with a jsonschema attribute
+        :return: Schema checker for the item's class
+        """
+        item_cls = type(item)
+        checker = self._checkers.get(item_cls)
+        if checker is None or checker.schema is not item.jsonschema:
+            checker = SchemaChecker(item.jsonschema)
+            self._checkers[item_cls] = checker
+        return checker
+
+    def get_summary(self, spider: Spider) -> Dict:
+        """Summarize the validation results for a spider
+
+        :param spider: Spider object being run
+        :return: Dictionary with the number of items validated, the pass rate of each
+                 property, and whether the spider passed validation
+        """
+        # Confidence bounds are only valid for random samples
+        random_sample = self.sample_method == "random"
+        pass_rates = {}
+        for prop in self.error_count.keys():
+            passed = self.item_count - self.error_count[prop]
+            pass_rates[prop] = {"rate": passed / self.item_count}
+            if random_sample:
+                lower, upper = get_confidence_interval(passed, self.item_count)
+                pass_rates[prop].update({"lower": lower, "upper": upper})
+        # When sampling at random, only fail if the pass rate is likely below the
+        # threshold
+        rate_key = "upper" if random_sample else "rate"
+        return {
+            "spider": spider.name,
+            "item_count": self.item_count,
+            "scraped_count": self.scraped_count,
+            "sampled": self.sampling,
+            "sample_method": self.sample_method,
+            "pass_rates": pass_rates,
+            "passed": all(rates[rate_key] >= 0.9 for rates in pass_rates.values()),
+        }
+
+    def get_report(self, spider: Spider) -> Dict:
+        """Create a detailed report of validation results for a spider
+
+        :param spider: Spider object being run
+        :return: Validation summary with samples of failing values and timings
+        """
+        return {
+            **self.get_summary(spider),
+            "error_samples": dict(self.error_samples),
+            "timings": {
+                "total": sum(self.durations),
+                "crawl_thread": self.validation_time,
+                "worker": self.worker_time,
+                "p50": get_percentile(self.durations, 50),
+                "p99": get_percentile(self.durations, 99),
+            },
+        }
+
+    def write_report(self, spider: Spider) -> Optional[Deferred]:
+        """Write the JSON validation report to a local path or feed storage
+
+        :param spider: Spider object being run
+        :return: Deferred from the feed storage, if the report is stored remotely
+        """
+        now = datetime.now()
+        report_uri = self.report_uri % {
+            "name": spider.name,
+            "year": now.strftime("%Y"),
+            "month": now.strftime("%m"),
+            "day": now.strftime("%d"),
+            "time": now.strftime("%Y-%m-%dT%H-%M-%S"),
+        }
+        report_text = json.dumps(self.get_report(spider), default=str)
+        scheme = urlparse(report_uri).scheme
+        if scheme in ("", "file"):
+            report_path = urlparse(report_uri).path if scheme else report_uri
+            if os.path.dirname(report_path):
+                os.makedirs(os.path.dirname(report_path), exist_ok=True)
+            with open(report_path, "w") as f:
+                f.write(report_text)
+            return None
+        storage_cls = load_object(
+            self.crawler.settings.getwithbase("FEED_STORAGES")[scheme]
+        )
+        if hasattr(storage_cls, "from_crawler"):
+            storage = storage_cls.from_crawler(self.crawler, report_uri)
+        else:
+            storage = storage_cls(report_uri)
+        report_file = storage.open(spider)
+        report_file.write(report_text.encode())
+        return storage.store(report_file)
 
     def validation_report(self, spider: Spider):
-        """Print the results of validating Spider output against a required schema
+        """Print the results of validating Spider output against a required schema. The
+        summary is also stored in the crawler's stats as "validation/summary".
 
         :param spider: Spider object to validate
         :raises ValueError: Raises error if validation fails
         """
-        props = list(self.error_count.keys())
+        summary = self.get_summary(spider)
+        if self.crawler is not None:
+            self.crawler.stats.set_value("validation/summary", summary)
         line_str = "-" * 12
         logger.info(f"\n{line_str}\nValidation summary for: {spider.name}\n{line_str}")
-        logger.info(f"Validating {self.item_count} items\n")
-        valid_list = []
-        for prop in props:
-            valid = (self.item_count - self.error_count[prop]) / self.item_count
-            valid_list.append(valid)
-            logger.info("{}: {:.0%}".format(prop, valid))
-        try:
-            assert all([val >= 0.9 for val in valid_list])
-        except AssertionError:
+        random_sample = summary["sample_method"] == "random"
+        if random_sample:
+            logger.info(
+                f"Validating a random sample of {self.item_count} of "
+                f"{self.scraped_count} items with 95% confidence bounds\n"
+            )
+        elif self.sampling:
+            logger.info(
+                f"Validating {self.item_count} of {self.scraped_count} items within a "
+                "time budget, which isn't a random sample, so no confidence bounds "
+                "are given\n"
+            )
+        else:
+            logger.info(f"Validating {self.item_count} items\n")
+        for prop, rates in summary["pass_rates"].items():
+            if random_sample:
+                logger.info(
+                    "{}: {:.0%} ({:.0%} - {:.0%})".format(
+                        prop, rates["rate"], rates["lower"], rates["upper"]
+                    )
+                )
+            else:
+                logger.info("{}: {:.0%}".format(prop, rates["rate"]))
+        if not summary["passed"]:
             message = (
                 "Less than 90% of the scraped items from {} passed validation. See "
                 "the validation summary printed in stdout, and check that the "
@@ -89,10 +552,3 @@ class ValidationPipeline:
                 raise ValueError(message)
             else:
                 logger.info(message)
-
-    def _get_props_from_errors(self, errors):
-        error_props = []
-        for error in errors:
-            if len(error.path) > 0:
-                error_props.append(error.path[0])
-        return error_props
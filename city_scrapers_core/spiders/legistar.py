@@ -1,30 +1,113 @@
-from collections import defaultdict
+import io
+import json
+import re
 from datetime import datetime
-from typing import Dict, Iterable, List, Union
-from urllib.parse import parse_qs, urlencode
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+from urllib.parse import parse_qs, urlencode, urljoin, urlparse
 
 import scrapy
+from lxml import etree
+from parsel.csstranslator import css2xpath
+from scrapy.utils.response import get_base_url
 
+from ..clock import RunClock
+from ..ical import ICalProperty, iter_ical_events, parse_ical_datetime
 from ..items import Meeting
 from .spider import CityScrapersSpider
 
 LINK_TYPES = ["Agenda", "Minutes", "Video", "Summary", "Captions"]
 
+# Compiled once from the CSS selectors for the calendar grid so that each grid is
+# walked without creating selectors for every cell
+HEADER_XPATH = etree.XPath(css2xpath("th[class^='rgHeader']"))
+ROW_XPATH = etree.XPath(css2xpath("tr.rgRow, tr.rgAltRow"))
+ONCLICK_PREFIXES = ("radopen('", "window.open", "OpenTelerikWindow")
+# Relative URLs of a file name and query like "View.ashx?M=IC&ID=1", which urljoin
+# resolves by appending them to the base URL's directory
+FILE_URL_RE = re.compile(r"[\w\-~%]+\.\w+(\?[^\s\x00-\x1f#]+)?")
+
+LEGISTAR_API_URL = "https://webapi.legistar.com/v1"
+
+# Legistar Web API event fields mapped to the link columns of the calendar page
+API_LINK_FIELDS = {
+    "Agenda": "EventAgendaFile",
+    "Minutes": "EventMinutesFile",
+    "Video": "EventVideoPath",
+}
+
 
 class LegistarSpider(CityScrapersSpider):
     """Subclass of :class:`CityScrapersSpider` that handles processing Legistar sites,
     which almost always share the same components and general structure.
 
     Any methods that don't pull the correct values can be replaced.
+
+    Events are scraped from the ``Calendar.aspx`` page by default. Setting
+    ``legistar_engine = "api"`` pulls them from the `Legistar Web API <https://webapi.legistar.com/Help>`_
+    instead, requesting several pages at once and converting them into the same event
+    dicts passed to ``parse_legistar``. Setting ``legistar_engine = "ical"`` reads
+    events from the calendar-wide iCalendar feed at ``legistar_ical_url`` and only uses
+    the calendar page to add links to them.
+
+    Setting ``incremental = True`` only requests events from ``incremental_months``
+    before the current month if previous results loaded by :class:`DiffPipeline`
+    include earlier meetings, which are then kept from the previous results.
     """  # noqa
 
     link_types = []
+    # Set to "api" for the Legistar Web API or "ical" for an iCalendar feed instead of
+    # the calendar page
+    legistar_engine = "calendar"
+    # Grid page size requested with each year, defaults to "All" or the largest option
+    # on the calendar page. Set to False to always page through results.
+    legistar_page_size = None
+    # Client name used in Web API URLs, defaults to the start URL's subdomain
+    legistar_client = None
+    legistar_api_url = LEGISTAR_API_URL
+    # Web API requests return at most 1000 results
+    legistar_api_page_size = 1000
+    legistar_api_concurrency = 4
+    # Calendar-wide iCalendar feed used when legistar_engine is "ical"
+    legistar_ical_url = None
+    # Only request recent events, keeping older meetings from previous results
+    incremental = False
+    # Months before the current month to request again for updated links and statuses
+    incremental_months = 2
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         # Can override since_year to start earlier
         self.since_year = datetime.now().year - 1
         self._scraped_urls = set()
+        # Set to the start of the requested window when crawling incrementally
+        self.incremental_start: Optional[str] = None
+
+    async def start(self):
+        for request in self.start_requests():
+            yield request
+
+    def start_requests(self) -> Iterable[scrapy.Request]:
+        """Creates initial requests for the calendar page, the first pages of Web API
+        results if ``legistar_engine`` is "api", or the iCalendar feed if it's "ical"
+
+        :return: Iterable of ``Request`` objects
+        """
+        if self.legistar_engine == "ical":
+            if not self.legistar_ical_url:
+                raise ValueError("legistar_ical_url must be set for the ical engine")
+            yield scrapy.Request(
+                self.legistar_ical_url,
+                callback=self._parse_legistar_ical,
+                dont_filter=True,
+            )
+            return
+        if self.legistar_engine == "api":
+            self.legistar_window_start()
+            for page in range(self.legistar_api_concurrency):
+                yield self._legistar_api_request(page * self.legistar_api_page_size)
+            return
+        for url in self.start_urls:
+            yield scrapy.Request(url, dont_filter=True)
 
     def parse(self, response: scrapy.http.Response) -> Iterable[scrapy.Request]:
         """Creates initial event requests for each queried year.
@@ -34,23 +117,39 @@ class LegistarSpider(CityScrapersSpider):
         """
 
         secrets = self._parse_secrets(response)
+        page_size_fields = self._parse_page_size_fields(response)
         current_year = datetime.now().year
-        for year in range(self.since_year, current_year + 1):
-            yield scrapy.Request(
-                response.url,
-                method="POST",
-                headers={"Content-Type": "application/x-www-form-urlencoded"},
-                body=urlencode(
-                    {
-                        **secrets,
-                        "__EVENTTARGET": "ctl00$ContentPlaceHolder1$lstYears",
-                        "ctl00_ContentPlaceHolder1_lstYears_ClientState": f'{{"value":"{year}"}}',  # noqa
-                    }
-                ),
-                callback=self._parse_legistar_events_page,
-                dont_filter=True,
+        for year in range(self.legistar_window_start().year, current_year + 1):
+            yield self._legistar_year_request(
+                response.url, secrets, year, page_size_fields
             )
 
+    def legistar_window_start(self) -> datetime:
+        """Gets the earliest date to request events from. Incremental spiders start
+        ``incremental_months`` before the current month and set ``incremental_start``
+        if previous results include earlier meetings, otherwise events are requested
+        from the start of ``since_year``.
+
+        :return: Earliest date to request events from
+        """
+        since = datetime(self.since_year, 1, 1)
+        if not self.incremental:
+            return since
+        now = RunClock.from_spider(self).now
+        month_idx = now.year * 12 + now.month - 1 - self.incremental_months
+        window_start = datetime(month_idx // 12, month_idx % 12 + 1, 1)
+        previous_starts = [
+            start for start in getattr(self, "_previous_starts", {}).values() if start
+        ]
+        if (
+            window_start <= since
+            or len(previous_starts) == 0
+            or min(previous_starts) >= window_start.isoformat()
+        ):
+            return since
+        self.incremental_start = window_start.isoformat()
+        return window_start
+
     def parse_legistar(self, events: Iterable[Dict]) -> Iterable[Meeting]:
         """Method to be implemented by Spider classes that will handle the response from
         Legistar. Functions similar to ``parse`` for other Spider classes.
@@ -106,72 +205,316 @@ class LegistarSpider(CityScrapersSpider):
             return item["Meeting Details"].get("url", default_url)
         return default_url
 
+    def _legistar_year_request(
+        self, url: str, secrets: Dict, year: int, page_size_fields: Dict
+    ) -> scrapy.Request:
+        """Create a postback request for a year of events, including the page size
+        override if available. Requests that fail or don't return the events grid are
+        retried without the override and paginated instead.
+        """
+        request = scrapy.Request(
+            url,
+            method="POST",
+            headers={"Content-Type": "application/x-www-form-urlencoded"},
+            body=urlencode(
+                {
+                    **secrets,
+                    **page_size_fields,
+                    "__EVENTTARGET": "ctl00$ContentPlaceHolder1$lstYears",
+                    "ctl00_ContentPlaceHolder1_lstYears_ClientState": f'{{"value":"{year}"}}',  # noqa
+                }
+            ),
+            callback=self._parse_legistar_events_page,
+            dont_filter=True,
+        )
+        if not page_size_fields:
+            return request
+        return request.replace(
+            errback=self._retry_legistar_year,
+            meta={"legistar_year": (secrets, year)},
+        )
+
+    def _retry_legistar_year(self, failure) -> Iterable[scrapy.Request]:
+        yield self._legistar_year_fallback(failure.request)
+
+    def _legistar_year_fallback(self, request: scrapy.Request) -> scrapy.Request:
+        secrets, year = request.meta["legistar_year"]
+        self.logger.info(f"Page size override failed for {year}, paginating instead")
+        return self._legistar_year_request(request.url, secrets, year, {})
+
+    def _parse_page_size_fields(self, response: scrapy.http.Response) -> Dict:
+        """Get form fields setting the page size of the events grid so that a full year
+        of events can be returned in one response
+
+        :param response: Calendar page response
+        :return: Dictionary of form fields, empty if the page size can't be set
+        """
+        if self.legistar_page_size is False:
+            return {}
+        combo_input = response.css("input[name$='PageSizeComboBox']")
+        if len(combo_input) == 0:
+            return {}
+        name = combo_input[0].attrib["name"]
+        combo_id = name.replace("$", "_")
+        page_size = self.legistar_page_size
+        if page_size is None:
+            options = [
+                option.strip()
+                for option in response.css(f"#{combo_id}_DropDown li::text").extract()
+            ]
+            if any(option.lower() == "all" for option in options):
+                page_size = next(opt for opt in options if opt.lower() == "all")
+            elif any(option.isdigit() for option in options):
+                page_size = max(int(opt) for opt in options if opt.isdigit())
+            else:
+                return {}
+        client_state = {
+            "logEntries": [],
+            "value": str(page_size),
+            "text": str(page_size),
+            "enabled": True,
+            "checkedIndices": [],
+            "checkedItemsTextOverflows": False,
+        }
+        return {
+            name: str(page_size),
+            f"{combo_id}_ClientState": json.dumps(client_state, separators=(",", ":")),
+        }
+
     def _parse_legistar_events_page(
         self, response: scrapy.http.Response
     ) -> Iterable[Union[Meeting, scrapy.http.Request]]:
+        if "legistar_year" in response.meta and not response.css("table.rgMasterTable"):
+            yield self._legistar_year_fallback(response.request)
+            return
         legistar_events = self._parse_legistar_events(response)
         yield from self.parse_legistar(legistar_events)
         yield from self._parse_next_page(response)
 
     def _parse_legistar_events(self, response: scrapy.http.Response) -> Iterable[Dict]:
-        events_table = response.css("table.rgMasterTable")[0]
+        events = []
+        for ical_url, event in self._iter_legistar_rows(response):
+            if ical_url in self._scraped_urls:
+                continue
+            self._scraped_urls.add(ical_url)
+            events.append(event)
+        return events
+
+    def _iter_legistar_rows(
+        self, response: scrapy.http.Response
+    ) -> Iterable[Tuple[str, Dict]]:
+        events_table = response.css("table.rgMasterTable")[0].root
+        base_url = get_base_url(response)
+        base_dir = urljoin(base_url, "x")[:-1]
+
+        def join_url(url: str) -> str:
+            if FILE_URL_RE.fullmatch(url):
+                return base_dir + url
+            return urljoin(base_url, url)
 
         headers = []
-        for header in events_table.css("th[class^='rgHeader']"):
-            header_text = (
-                " ".join(header.css("*::text").extract()).replace("&nbsp;", " ").strip()
-            )
-            header_inputs = header.css("input")
+        for header in HEADER_XPATH(events_table):
+            header_text = " ".join(header.itertext()).replace("&nbsp;", " ").strip()
+            header_input = next(header.iter("input"), None)
+            header_img = next(header.iter("img"), None)
             if header_text:
                 headers.append(header_text)
-            elif len(header_inputs) > 0:
-                headers.append(header_inputs[0].attrib["value"])
+            elif header_input is not None:
+                headers.append(header_input.attrib.get("value", ""))
+            elif header_img is not None:
+                headers.append(header_img.attrib.get("alt", ""))
             else:
-                headers.append(header.css("img")[0].attrib["alt"])
+                # Blank columns are labeled by their values, like iCalendar links
+                headers.append("")
 
-        events = []
-        for row in events_table.css("tr.rgRow, tr.rgAltRow"):
+        for row in ROW_XPATH(events_table):
+            data = {}
             try:
-                data = defaultdict(lambda: None)
-                for header, field in zip(headers, row.css("td")):
-                    field_text = (
-                        " ".join(field.css("*::text").extract())
-                        .replace("&nbsp;", " ")
-                        .strip()
-                    )
+                for header, field in zip(headers, row.iter("td")):
+                    link_el = next(field.iter("a"), None)
                     url = None
-                    if len(field.css("a")) > 0:
-                        link_el = field.css("a")[0]
-                        if "onclick" in link_el.attrib and link_el.attrib[
-                            "onclick"
-                        ].startswith(("radopen('", "window.open", "OpenTelerikWindow")):
-                            url = response.urljoin(
-                                link_el.attrib["onclick"].split("'")[1]
-                            )
+                    if link_el is not None:
+                        onclick = link_el.get("onclick")
+                        if onclick is not None and onclick.startswith(ONCLICK_PREFIXES):
+                            url = join_url(onclick.split("'")[1])
                         elif "href" in link_el.attrib:
-                            url = response.urljoin(link_el.attrib["href"])
+                            url = join_url(link_el.attrib["href"])
                     if url:
                         if header in ["", "ics"] and "View.ashx?M=IC" in url:
-                            header = "iCalendar"
-                            value = {"url": url}
-                        else:
-                            value = {"label": field_text, "url": url}
+                            data["iCalendar"] = {"url": url}
+                            continue
+                        field_text = (
+                            " ".join(field.itertext()).replace("&nbsp;", " ").strip()
+                        )
+                        data[header] = {"label": field_text, "url": url}
                     else:
-                        value = field_text
+                        data[header] = (
+                            " ".join(field.itertext()).replace("&nbsp;", " ").strip()
+                        )
+            except (IndexError, ValueError):
+                # Skip rows with links that can't be parsed
+                continue
 
-                    data[header] = value
+            ical = data.get("iCalendar")
+            if isinstance(ical, dict) and ical.get("url") is not None:
+                yield ical["url"], data
 
-                ical_url = data.get("iCalendar", {}).get("url")
-                if ical_url is None or ical_url in self._scraped_urls:
-                    continue
-                else:
-                    self._scraped_urls.add(ical_url)
-                events.append(dict(data))
-            except Exception:
-                pass
+    def _legistar_api_request(self, skip: int) -> scrapy.Request:
+        client = (
+            self.legistar_client or urlparse(self.start_urls[0]).netloc.split(".")[0]
+        )
+        params = {
+            "$filter": "EventDate ge datetime'{}'".format(
+                (self.incremental_start or f"{self.since_year}-01-01")[:10]
+            ),
+            "$orderby": "EventDate,EventId",
+            "$top": self.legistar_api_page_size,
+            "$skip": skip,
+        }
+        return scrapy.Request(
+            f"{self.legistar_api_url}/{client}/events?{urlencode(params)}",
+            callback=self._parse_legistar_api_page,
+            cb_kwargs={"skip": skip},
+            dont_filter=True,
+        )
 
+    def _parse_legistar_api_page(
+        self, response: scrapy.http.Response, skip: int
+    ) -> Iterable[Union[Meeting, scrapy.http.Request]]:
+        api_events = json.loads(response.text)
+        yield from self.parse_legistar(self._parse_legistar_api_events(api_events))
+        # Each full page requests the page after the ones already in progress
+        if len(api_events) >= self.legistar_api_page_size:
+            yield self._legistar_api_request(
+                skip + self.legistar_api_page_size * self.legistar_api_concurrency
+            )
+
+    def _parse_legistar_api_events(self, api_events: List[Dict]) -> List[Dict]:
+        start_url = urlparse(self.start_urls[0])
+        base_url = f"{start_url.scheme}://{start_url.netloc}"
+        events = []
+        for api_event in api_events:
+            ical_url = "{}/View.ashx?M=IC&ID={}&GUID={}".format(
+                base_url, api_event["EventId"], api_event["EventGuid"]
+            )
+            if ical_url in self._scraped_urls:
+                continue
+            self._scraped_urls.add(ical_url)
+            # Match the unpadded month and day of the calendar page
+            date = datetime.strptime(api_event["EventDate"][:10], "%Y-%m-%d")
+            details_url = api_event.get("EventInSiteURL")
+            event = {
+                "Name": {"label": api_event.get("EventBodyName") or ""},
+                "Meeting Date": f"{date.month}/{date.day}/{date.year}",
+                "Meeting Time": api_event.get("EventTime") or "",
+                "Meeting Location": api_event.get("EventLocation") or "",
+                "Meeting Details": "Not available",
+                "iCalendar": {"url": ical_url},
+            }
+            if details_url:
+                event["Name"]["url"] = details_url
+                event["Meeting Details"] = {
+                    "label": "Meeting details",
+                    "url": details_url,
+                }
+            for link_type, field in API_LINK_FIELDS.items():
+                if api_event.get(field):
+                    event[link_type] = {"label": link_type, "url": api_event[field]}
+                else:
+                    event[link_type] = "Not available"
+            events.append(event)
         return events
 
+    def _parse_legistar_ical(
+        self, response: scrapy.http.Response
+    ) -> Iterable[scrapy.Request]:
+        events = []
+        # Decode lines as they're parsed instead of decoding the whole body at once
+        lines = io.TextIOWrapper(
+            io.BytesIO(response.body), encoding=response.encoding, errors="replace"
+        )
+        for ical_event in iter_ical_events(lines):
+            try:
+                event = self._parse_legistar_ical_event(ical_event)
+            except ValueError:
+                uid = ical_event["UID"].value if "UID" in ical_event else None
+                self.logger.warning(f"Skipping iCalendar event {uid} with invalid date")
+                continue
+            if event is not None:
+                events.append(event)
+        # Links to agendas, minutes and videos are only listed on the calendar page
+        yield scrapy.Request(
+            self.start_urls[0],
+            callback=self._parse_legistar_ical_links,
+            errback=self._parse_legistar_ical_links_failed,
+            cb_kwargs={"events": events},
+            dont_filter=True,
+        )
+
+    def _parse_legistar_ical_event(
+        self, ical_event: Dict[str, ICalProperty]
+    ) -> Optional[Dict]:
+        if "DTSTART" not in ical_event:
+            return None
+        start, has_time = parse_ical_datetime(ical_event["DTSTART"], self.timezone)
+        details_url = ical_event["URL"].value if "URL" in ical_event else None
+        details_params = parse_qs(urlparse(details_url or "").query)
+        if "ID" in details_params and "GUID" in details_params:
+            start_url = urlparse(self.start_urls[0])
+            ical_url = "{}://{}/View.ashx?M=IC&ID={}&GUID={}".format(
+                start_url.scheme,
+                start_url.netloc,
+                details_params["ID"][0],
+                details_params["GUID"][0],
+            )
+        elif "UID" in ical_event:
+            ical_url = f"{self.legistar_ical_url}#{ical_event['UID'].value}"
+        else:
+            return None
+        summary = ical_event["SUMMARY"].value if "SUMMARY" in ical_event else ""
+        location = ical_event["LOCATION"].value if "LOCATION" in ical_event else ""
+        event = {
+            "Name": {"label": summary},
+            "Meeting Date": f"{start.month}/{start.day}/{start.year}",
+            "Meeting Time": start.strftime("%I:%M %p").lstrip("0") if has_time else "",
+            "Meeting Location": location,
+            "Meeting Details": "Not available",
+            "iCalendar": {"url": ical_url},
+        }
+        if details_url:
+            event["Name"]["url"] = details_url
+            event["Meeting Details"] = {"label": "Meeting details", "url": details_url}
+        return event
+
+    def _parse_legistar_ical_links(
+        self, response: scrapy.http.Response, events: List[Dict]
+    ) -> Iterable[Meeting]:
+        rows = {}
+        if response.css("table.rgMasterTable"):
+            rows = dict(self._iter_legistar_rows(response))
+        yield from self.parse_legistar(self._merge_legistar_ical_links(events, rows))
+
+    def _parse_legistar_ical_links_failed(self, failure) -> Iterable[Meeting]:
+        self.logger.info("Calendar page failed, using iCalendar events without links")
+        events = failure.request.cb_kwargs["events"]
+        yield from self.parse_legistar(self._merge_legistar_ical_links(events, {}))
+
+    def _merge_legistar_ical_links(
+        self, events: List[Dict], rows: Dict[str, Dict]
+    ) -> List[Dict]:
+        new_events = []
+        for event in events:
+            ical_url = event["iCalendar"]["url"]
+            if ical_url in self._scraped_urls:
+                continue
+            self._scraped_urls.add(ical_url)
+            # Add links from the calendar page row of the same meeting
+            for header, value in rows.get(ical_url, {}).items():
+                if header != "iCalendar" and isinstance(value, dict):
+                    event[header] = value
+            new_events.append(event)
+        return new_events
+
     def _parse_next_page(
         self, response: scrapy.http.Response
     ) -> Iterable[scrapy.Request]:
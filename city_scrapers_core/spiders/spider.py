@@ -4,22 +4,43 @@ from typing import Mapping, Optional
 
 from pytz import timezone
 from scrapy import Spider
+from scrapy.crawler import Crawler
 
+from ..clock import RunClock
 from ..constants import CANCELLED, PASSED, TENTATIVE
 
 
 class CityScrapersSpider(Spider):
     """Base Spider class for City Scrapers projects. Provides a few utilities for common
     tasks like creating a meeting ID and checking the status based on meeting details.
+
+    When run by a crawler, the spider uses the crawler's :class:`RunClock` so that its
+    feed storage parameters and statuses use the same current time as the pipelines.
     """
 
+    clock = None
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         # Add parameters for feed storage in spider local time
         if not hasattr(self, "timezone"):
             self.timezone = "America/Chicago"
-        tz = timezone(self.timezone)
-        now = tz.localize(datetime.now())
+        self._set_time_params(timezone(self.timezone).localize(datetime.now()))
+
+    @classmethod
+    def from_crawler(cls, crawler: Crawler, *args, **kwargs):
+        """Create spider from crawler and attach the crawler's clock
+
+        :param crawler: Current scrapy crawler
+        :return: Created spider
+        """
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        spider.clock = RunClock.from_crawler(crawler)
+        spider._set_time_params(spider.clock.localized_now(spider.timezone))
+        return spider
+
+    def _set_time_params(self, now: datetime):
+        """Set parameters for feed storage from the current localized time"""
         self.year = now.year
         self.month = now.strftime("%m")
         self.day = now.strftime("%d")
@@ -79,6 +100,7 @@ class CityScrapersSpider(Spider):
         ).lower()
         if any(word in meeting_text for word in ["cancel", "rescheduled", "postpone"]):
             return CANCELLED
-        if item["start"] < datetime.now():
+        now = self.clock.now if self.clock is not None else datetime.now()
+        if item["start"] < now:
             return PASSED
         return TENTATIVE
@@ -0,0 +1,53 @@
+from datetime import datetime, timedelta
+
+import pytz
+from scrapy.utils.test import get_crawler
+
+from city_scrapers_core.clock import RunClock
+from city_scrapers_core.constants import PASSED, TENTATIVE
+from city_scrapers_core.spiders import CityScrapersSpider
+
+
+def test_isoformat_matches_pytz():
+    clock = RunClock()
+    for tz_name in ["America/Chicago", "Australia/Lord_Howe", "Asia/Kolkata"]:
+        tz = pytz.timezone(tz_name)
+        start = datetime(2021, 3, 13, 23, 15, 30)
+        # Cover both daylight saving time transitions in the US and Australia
+        for dt in [start + timedelta(minutes=15 * idx) for idx in range(24)] + [
+            datetime(2021, 11, 7, 1, 30),
+            datetime(2021, 4, 4, 1, 45, 59),
+            datetime(2021, 10, 3, 2, 15),
+        ]:
+            expected = tz.localize(dt).isoformat(timespec="seconds")
+            assert clock.isoformat(tz_name, dt) == expected
+            # Cached offsets return the same value
+            assert clock.isoformat(tz_name, dt) == expected
+
+
+def test_isoformat_offset_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr("city_scrapers_core.clock.OFFSET_CACHE_SIZE", 10)
+    clock = RunClock()
+    start = datetime(2021, 1, 1)
+    clock.isoformat("America/Chicago", start)
+    for idx in range(1, 20):
+        clock.isoformat("America/Chicago", start + timedelta(minutes=idx))
+        # Recently used offsets are kept
+        clock.isoformat("America/Chicago", start)
+    assert len(clock.offsets) == 10
+    assert ("America/Chicago", start) in clock.offsets
+
+
+def test_clock_shared_by_crawler():
+    crawler = get_crawler(CityScrapersSpider)
+    clock = RunClock.from_crawler(crawler)
+    assert RunClock.from_crawler(crawler) is clock
+    spider = CityScrapersSpider.from_crawler(crawler, name="test")
+    assert spider.clock is clock
+    assert RunClock.from_spider(spider) is clock
+    assert spider.day == clock.localized_now(spider.timezone).strftime("%d")
+    clock.now = datetime(2020, 1, 1)
+    assert spider.get_status({"start": datetime(2020, 1, 2)}) == TENTATIVE
+    assert spider.get_status({"start": datetime(2019, 12, 31)}) == PASSED
+    # Spiders without a crawler use the current time
+    assert RunClock.from_spider(CityScrapersSpider(name="test")) is not clock
@@ -1,9 +1,22 @@
+import json
 import os
+import subprocess
+import sys
+from argparse import Namespace
+from datetime import datetime, timedelta
+from hashlib import md5, sha1
 from unittest.mock import MagicMock
 
 import pytest  # noqa
+from scrapy.settings import Settings
+from twisted.internet.defer import Deferred
 
+from city_scrapers_core.commands.combinefeeds import Command as CombineFeedsCommand
+from city_scrapers_core.commands.runall import Command as RunAllCommand
 from city_scrapers_core.commands.validate import Command as ValidateCommand
+from city_scrapers_core.items import Meeting
+from city_scrapers_core.pipelines import CorePipeline, DiffPipeline
+from city_scrapers_core.spiders import CityScrapersSpider
 
 
 def test_validate_updates_pipelines(monkeypatch):
@@ -25,3 +38,351 @@ def test_validate_updates_pipelines(monkeypatch):
             "city_scrapers_core.pipelines.validation.ValidationPipeline": 11,
         },
     )
+
+
+def test_runall_disables_empty_feeds_by_default():
+    for project_settings, store_empty in [
+        ({}, False),
+        ({"FEED_STORE_EMPTY": True}, True),
+    ]:
+        command = RunAllCommand()
+        command.settings = Settings()
+        command.settings.setdict(project_settings, priority="project")
+        command.crawler_process = MagicMock()
+        command.crawler_process.spider_loader.list.return_value = ["spider"]
+        command.run([], Namespace())
+        assert command.settings.getbool("FEED_STORE_EMPTY") is store_empty
+        assert command.settings.getbool("CITY_SCRAPERS_DIFF_SHARED_LOADER")
+        command.crawler_process.crawl.assert_called_once_with("spider")
+
+
+def _make_validate_command(spiders):
+    command = ValidateCommand()
+    command.settings = Settings({"LOG_LEVEL": "INFO"})
+    command.crawler_process = MagicMock()
+    command.crawler_process.spider_loader.list.return_value = spiders
+    return command
+
+
+def test_validate_overrides_sampling_settings():
+    command = _make_validate_command([])
+    command.settings.setdict(
+        {
+            "CITY_SCRAPERS_VALIDATION_SAMPLE_RATE": 0.1,
+            "CITY_SCRAPERS_VALIDATION_TIME_FRACTION": 0.05,
+            "CITY_SCRAPERS_ENFORCE_VALIDATION": False,
+        },
+        priority="cmdline",
+    )
+    command.run([], Namespace(all=False))
+    # Spider custom_settings have a lower priority than validate's settings
+    command.settings.setdict(
+        {
+            "CITY_SCRAPERS_VALIDATION_SAMPLE_RATE": 0.1,
+            "CITY_SCRAPERS_VALIDATION_TIME_FRACTION": 0.05,
+            "CITY_SCRAPERS_ENFORCE_VALIDATION": False,
+        },
+        priority="spider",
+    )
+    assert command.settings.getfloat("CITY_SCRAPERS_VALIDATION_SAMPLE_RATE") == 1
+    assert command.settings.getfloat("CITY_SCRAPERS_VALIDATION_TIME_FRACTION") == 0
+    assert command.settings.getbool("CITY_SCRAPERS_ENFORCE_VALIDATION")
+
+
+def test_validate_shards_spiders(monkeypatch, tmp_path):
+    commands = []
+
+    class MockPopen:
+        def __init__(self, cmd):
+            commands.append(cmd)
+            self.returncode = 0
+            spiders = cmd[cmd.index("validate") + 1 : cmd.index("--report")]
+            if "spider_c" in spiders:
+                self.returncode = 1
+                return
+            with open(cmd[cmd.index("--report") + 1], "w") as f:
+                json.dump(
+                    {
+                        "spiders": [
+                            {"spider": spider, "item_count": 2, "passed": True}
+                            for spider in spiders
+                        ]
+                    },
+                    f,
+                )
+
+        def wait(self):
+            return self.returncode
+
+    monkeypatch.setattr(subprocess, "Popen", MockPopen)
+    command = _make_validate_command(["spider_a", "spider_b", "spider_c"])
+    report_path = tmp_path / "report.json"
+    opts = Namespace(
+        all=True, workers=2, fixtures=True, report=str(report_path), set=[]
+    )
+    command.run([], opts)
+    assert len(commands) == 2
+    assert all("--fixtures" in cmd for cmd in commands)
+    command.crawler_process.start.assert_not_called()
+    report = json.loads(report_path.read_text())
+    assert [summary["spider"] for summary in report["spiders"]] == [
+        "spider_a",
+        "spider_b",
+        "spider_c",
+    ]
+    # spider_a shares a shard with spider_c, so both fail when the worker fails
+    assert report["failed"] == ["spider_a", "spider_c"]
+    assert report["spiders"][0]["error"] == "Worker exited with code 1"
+    assert report["item_count"] == 2
+    assert command.exitcode == 1
+
+
+def _make_combine_command(spiders, **settings):
+    command = CombineFeedsCommand()
+    command.settings = Settings(
+        {
+            "FEED_URI": "s3://test-bucket/%(year)s/%(month)s/%(day)s/%(name)s.json",
+            "FEED_STORAGES": {"s3": "scrapy.extensions.feedexport.S3FeedStorage"},
+            "ITEM_PIPELINES": {"city_scrapers_core.pipelines.OpenCivicDataPipeline": 1},
+            **settings,
+        }
+    )
+    command.crawler_process = MagicMock()
+    command.crawler_process.spider_loader.list.return_value = spiders
+    return command
+
+
+def _mock_s3_client(feeds):
+    client = MagicMock()
+    client.objects = dict(feeds)
+    client.uploads = {}
+    client.exceptions.NoSuchKey = KeyError
+
+    def list_objects(Bucket, Prefix, **kwargs):
+        return {
+            "Contents": [
+                {"Key": key, "ETag": md5(body.encode()).hexdigest()}
+                for key, body in client.objects.items()
+                if key.startswith(Prefix)
+            ]
+        }
+
+    def get_object(Bucket, Key):
+        body = MagicMock()
+        body.read.return_value = client.objects[Key].encode()
+        return {"Body": body}
+
+    def put_object(Body, Bucket, Key, **kwargs):
+        client.objects[Key] = Body.decode()
+
+    def upload_fileobj(file, bucket, key, ExtraArgs=None):
+        client.uploads[key] = file.read()
+        client.objects[key] = client.uploads[key].decode()
+
+    client.list_objects.side_effect = list_objects
+    client.get_object.side_effect = get_object
+    client.put_object.side_effect = put_object
+    client.upload_fileobj.side_effect = upload_fileobj
+    return client
+
+
+def _s3_feeds():
+    prefix = datetime.now().strftime("%Y/%m/%d")
+    start = datetime.now() - timedelta(days=2)
+    feeds = {}
+    for idx, spider in enumerate(["spider_a", "spider_b", "spider_c"]):
+        meetings = [
+            {
+                "_id": f"{spider}-{hour}",
+                "start_time": (start + timedelta(hours=hour)).isoformat()[:19],
+            }
+            for hour in [idx, idx + 30, 60]
+        ]
+        feeds[f"{prefix}/0000/{spider}.json"] = "\n".join(
+            json.dumps(meeting) for meeting in meetings
+        )
+    return feeds
+
+
+def _put_bodies(client):
+    return {
+        call.kwargs["Key"]: call.kwargs["Body"]
+        for call in client.put_object.call_args_list
+    }
+
+
+def test_combinefeeds_parallel_matches_serial(monkeypatch):
+    feeds = _s3_feeds()
+    outputs = []
+    for workers in [1, 4]:
+        client = _mock_s3_client(feeds)
+        boto3 = MagicMock()
+        boto3.client.return_value = client
+        monkeypatch.setitem(sys.modules, "boto3", boto3)
+        command = _make_combine_command(
+            ["spider_a", "spider_b", "spider_c"],
+            CITY_SCRAPERS_COMBINE_WORKERS=workers,
+        )
+        command.combine_s3()
+        assert client.copy_object.call_count == 3
+        outputs.append(_put_bodies(client))
+    assert outputs[0] == outputs[1]
+    latest = [json.loads(line) for line in outputs[0]["latest.json"].split(b"\n")]
+    assert len(latest) == 9
+    assert latest == sorted(latest, key=lambda m: m["start_time"])
+    upcoming = [json.loads(line) for line in outputs[0]["upcoming.json"].split(b"\n")]
+    assert len(upcoming) == 6
+
+
+def test_combinefeeds_streaming_matches_in_memory(monkeypatch):
+    feeds = _s3_feeds()
+    client = _mock_s3_client(feeds)
+    boto3 = MagicMock()
+    boto3.client.return_value = client
+    monkeypatch.setitem(sys.modules, "boto3", boto3)
+    spiders = ["spider_a", "spider_b", "spider_c"]
+    _make_combine_command(spiders).combine_s3()
+    _make_combine_command(spiders, CITY_SCRAPERS_COMBINE_STREAMING=True).combine_s3()
+    assert client.uploads == _put_bodies(client)
+
+
+def test_combinefeeds_manifest_skips_unchanged_feeds(monkeypatch):
+    feeds = _s3_feeds()
+    client = _mock_s3_client(feeds)
+    boto3 = MagicMock()
+    boto3.client.return_value = client
+    monkeypatch.setitem(sys.modules, "boto3", boto3)
+    spiders = ["spider_a", "spider_b", "spider_c"]
+    manifest_settings = {"CITY_SCRAPERS_COMBINE_MANIFEST": "manifest.json"}
+
+    _make_combine_command(spiders, **manifest_settings).combine_s3()
+    latest = client.objects["latest.json"]
+    assert client.copy_object.call_count == 3
+
+    client.get_object.reset_mock()
+    client.copy_object.reset_mock()
+    changed_key = sorted(feeds.keys())[0]
+    client.objects[changed_key] = feeds[changed_key].replace("spider_a-", "changed-")
+    _make_combine_command(spiders, **manifest_settings).combine_s3()
+    fetched = [call.kwargs["Key"] for call in client.get_object.call_args_list]
+    # Unchanged feeds are read from the previous latest.json in a single request
+    assert sorted(fetched) == sorted(["manifest.json", "latest.json", changed_key])
+    manifest = json.loads(client.objects["manifest.json"])
+    assert (
+        manifest["latest"] == sha1(client.objects["latest.json"].encode()).hexdigest()
+    )
+    assert all("meetings" not in entry for entry in manifest["spiders"].values())
+    assert client.copy_object.call_count == 1
+    assert client.objects["latest.json"] == latest.replace("spider_a-", "changed-")
+
+
+def test_combinefeeds_manifest_checks_previous_latest(monkeypatch):
+    feeds = _s3_feeds()
+    client = _mock_s3_client(feeds)
+    boto3 = MagicMock()
+    boto3.client.return_value = client
+    monkeypatch.setitem(sys.modules, "boto3", boto3)
+    spiders = ["spider_a", "spider_b", "spider_c"]
+    manifest_settings = {
+        "CITY_SCRAPERS_COMBINE_MANIFEST": "manifest.json",
+        "CITY_SCRAPERS_COMBINE_STREAMING": True,
+    }
+
+    _make_combine_command(spiders, **manifest_settings).combine_s3()
+    uploads = dict(client.uploads)
+    client.get_object.reset_mock()
+    _make_combine_command(spiders, **manifest_settings).combine_s3()
+    fetched = [call.kwargs["Key"] for call in client.get_object.call_args_list]
+    assert fetched == ["manifest.json", "latest.json"]
+    assert client.uploads == uploads
+
+    # A latest.json that doesn't match the manifest isn't reused
+    client.objects["latest.json"] = ""
+    client.get_object.reset_mock()
+    _make_combine_command(spiders, **manifest_settings).combine_s3()
+    fetched = [call.kwargs["Key"] for call in client.get_object.call_args_list]
+    assert sorted(fetched) == sorted(["manifest.json", "latest.json", *feeds.keys()])
+    assert client.uploads == uploads
+
+
+def test_combinefeeds_reads_feed_index(monkeypatch):
+    feeds = _s3_feeds()
+    client = _mock_s3_client(feeds)
+    # The oldest index is outside the window of days checked for recent feeds
+    updated_ats = [datetime.now(), None, datetime.now() - timedelta(days=5)]
+    for key, updated_at in zip(feeds.keys(), updated_ats):
+        spider = key.split("/")[-1].split(".")[0]
+        index = {"key": key, "fingerprint": md5(feeds[key].encode()).hexdigest()}
+        if updated_at:
+            index["updated_at"] = updated_at.isoformat(timespec="seconds")
+        client.objects[f"index/{spider}.json"] = json.dumps(index)
+    boto3 = MagicMock()
+    boto3.client.return_value = client
+    monkeypatch.setitem(sys.modules, "boto3", boto3)
+    command = _make_combine_command(
+        ["spider_a", "spider_b", "spider_c"], CITY_SCRAPERS_FEED_INDEX_PREFIX="index"
+    )
+    command.combine_s3()
+    client.list_objects.assert_not_called()
+    assert client.copy_object.call_count == 2
+    assert len(client.objects["latest.json"].split("\n")) == 6
+
+
+def test_core_pipeline_works_with_diff_and_combinefeeds(monkeypatch):
+    pipelines = {
+        "city_scrapers_core.pipelines.CorePipeline": 200,
+        "city_scrapers_core.pipelines.DiffPipeline": 300,
+    }
+    crawler = MagicMock()
+    crawler.settings = Settings({"ITEM_PIPELINES": pipelines})
+    crawler.spider = CityScrapersSpider(name="spider_a", agency="Agency")
+    # Load previous results below instead of in a thread
+    monkeypatch.setattr(
+        "city_scrapers_core.pipelines.diff.deferToThread", lambda *args: Deferred()
+    )
+    diff_pipeline = DiffPipeline.from_crawler(crawler)
+    assert diff_pipeline.output_format == "ocd"
+    diff_pipeline.set_previous_results(crawler.spider, [])
+    diff_pipeline._finish_loading(None)
+    meeting = Meeting(
+        id="spider_a/1",
+        title="Board",
+        start=datetime.now() + timedelta(days=1),
+        location={"name": "Hall", "address": ""},
+        source="https://example.com",
+    )
+    item = CorePipeline().process_item(meeting, crawler.spider)
+    item = diff_pipeline.process_item(item, crawler.spider)
+
+    prefix = datetime.now().strftime("%Y/%m/%d")
+    client = _mock_s3_client({f"{prefix}/0000/spider_a.json": json.dumps(item)})
+    boto3 = MagicMock()
+    boto3.client.return_value = client
+    monkeypatch.setitem(sys.modules, "boto3", boto3)
+    _make_combine_command(["spider_a"], ITEM_PIPELINES=pipelines).combine_s3()
+    assert json.loads(client.objects["upcoming.json"])["_id"] == item["_id"]
+
+
+def test_combinefeeds_combines_delta_feeds(monkeypatch):
+    client = _mock_s3_client(_s3_feeds())
+    # Runs that started on a previous day are keyed by that day
+    for spider, start, days_previous in [
+        ("spider_a", "2020-01-02", 0),
+        ("spider_a-old", "2020-01-03", 2),
+        ("spider_b", "2020-01-01", 1),
+    ]:
+        date_prefix = (datetime.now() - timedelta(days=days_previous)).strftime(
+            "%Y/%m/%d"
+        )
+        client.objects[f"delta/{date_prefix}/{spider[:8]}.json"] = json.dumps(
+            {"action": "added", "meeting": {"_id": spider, "start_time": start}}
+        )
+    boto3 = MagicMock()
+    boto3.client.return_value = client
+    monkeypatch.setitem(sys.modules, "boto3", boto3)
+    command = _make_combine_command(
+        ["spider_a", "spider_b", "spider_c"], CITY_SCRAPERS_DIFF_DELTA_PREFIX="delta"
+    )
+    command.combine_s3()
+    changes = [json.loads(line) for line in client.objects["delta.json"].split("\n")]
+    assert [change["meeting"]["_id"] for change in changes] == ["spider_b", "spider_a"]
@@ -0,0 +1,134 @@
+import json
+from datetime import datetime
+from io import BytesIO
+from tempfile import TemporaryFile
+from unittest.mock import MagicMock
+
+import pytest
+from scrapy.exporters import JsonLinesItemExporter
+from scrapy.settings import Settings
+
+from city_scrapers_core.clock import RunClock
+from city_scrapers_core.exporters import OpenCivicDataJsonLinesItemExporter
+from city_scrapers_core.items import Meeting
+from city_scrapers_core.pipelines import (
+    DefaultValuesPipeline,
+    DiffPipeline,
+    MeetingPipeline,
+    OpenCivicDataPipeline,
+)
+from city_scrapers_core.pipelines.ocd import get_output_format
+from city_scrapers_core.spiders import CityScrapersSpider
+
+SPIDER = CityScrapersSpider(
+    name="test", agency="Test Agency", timezone="America/Chicago"
+)
+
+
+def _make_meeting(**kwargs):
+    item = Meeting(
+        id="test/1",
+        title="Board Meeting – Café",
+        start=datetime(2020, 1, 1, 12),
+        location={"name": "Hall", "address": "1 Main St"},
+        links=[{"href": "https://example.com/agenda", "title": "Agenda"}],
+        source="https://example.com",
+        **kwargs,
+    )
+    for pipeline in [DefaultValuesPipeline(), MeetingPipeline()]:
+        item = pipeline.process_item(item, SPIDER)
+    return item
+
+
+def _export(items, spider=SPIDER, **kwargs):
+    output = BytesIO()
+    exporter = OpenCivicDataJsonLinesItemExporter(output, spider=spider, **kwargs)
+    exporter.start_exporting()
+    for item in items:
+        exporter.export_item(item)
+    exporter.finish_exporting()
+    return output.getvalue().splitlines(keepends=True)
+
+
+def _export_pipeline_event(item, exported_line):
+    """Export the pipeline's event with the same generated values as the exporter"""
+    exported = json.loads(exported_line)
+    event = OpenCivicDataPipeline().process_item(item, SPIDER)
+    event["_id"] = exported["_id"]
+    event["updated_at"] = exported["updated_at"]
+    output = BytesIO()
+    JsonLinesItemExporter(output).export_item(event)
+    return output.getvalue()
+
+
+def test_ocd_exporter_matches_pipeline():
+    item = _make_meeting()
+    processed = {"_id": "ocd-event/1", "_type": "event", "status": "cancelled"}
+    lines = _export([item, processed])
+    assert lines[0] == _export_pipeline_event(item, lines[0])
+    assert json.loads(lines[1]) == processed
+
+
+def test_ocd_exporter_fields_to_export():
+    item = _make_meeting()
+    lines = _export([item], fields_to_export=["name", "timezone"])
+    assert json.loads(lines[0]) == {
+        "name": "Board Meeting – Café",
+        "timezone": "America/Chicago",
+    }
+
+
+def _strip_generated(line):
+    return [
+        (key, value)
+        for key, value in json.loads(line, object_pairs_hook=list)
+        if key not in ["_id", "updated_at"]
+    ]
+
+
+def test_ocd_exporter_orjson_matches_structure():
+    pytest.importorskip("orjson")
+    item = _make_meeting()
+    [line] = _export([item], json_backend="orjson")
+    [json_line] = _export([item])
+    assert _strip_generated(line) == _strip_generated(json_line)
+    assert "Café".encode() in line
+
+
+def test_ocd_exporter_without_pipeline_supports_diff():
+    settings = Settings(
+        {
+            "FEED_EXPORTERS": {
+                "ocdjson": "city_scrapers_core.exporters.OpenCivicDataJsonLinesItemExporter"  # noqa
+            },
+            "FEEDS": {"s3://bucket/%(name)s.json": {"format": "ocdjson"}},
+            "CITY_SCRAPERS_DIFF_DELTA_PREFIX": "delta",
+        }
+    )
+    assert get_output_format(settings) == "ocd"
+
+    crawler = MagicMock()
+    crawler.settings = settings
+    pipeline = DiffPipeline(crawler, "ocd")
+    pipeline._delta_file = TemporaryFile("w+", encoding="utf-8")
+    pipeline.write_text = MagicMock()
+    spider = CityScrapersSpider(
+        name="test", agency="Test Agency", timezone="America/Chicago"
+    )
+    # Share a clock like a crawler does, so both events have the same updated time
+    spider.clock = RunClock()
+    spider._scraped_ids = set()
+    pipeline.set_previous_results(spider, [])
+
+    item = pipeline.process_item(_make_meeting(), spider)
+    pipeline.item_scraped(item, spider)
+    [line] = _export([item], spider=spider)
+    pipeline.close_spider(spider)
+
+    [change] = [
+        json.loads(line)
+        for line in pipeline.write_text.call_args[0][1].split("\n")
+        if line
+    ]
+    assert change["action"] == "added"
+    assert change["meeting"] == json.loads(line)
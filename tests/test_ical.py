@@ -0,0 +1,64 @@
+import os
+from datetime import datetime
+
+import pytest
+
+from city_scrapers_core.ical import (
+    ICalProperty,
+    iter_ical_events,
+    parse_content_line,
+    parse_ical_datetime,
+)
+
+FILES_DIR = os.path.join(os.path.dirname(__file__), "files")
+
+
+def test_parse_content_line():
+    assert parse_content_line('DTSTART;TZID="Central: Time";X-A=b:20210113') == (
+        "DTSTART",
+        ICalProperty("20210113", {"TZID": "Central: Time", "X-A": "b"}),
+    )
+    assert parse_content_line("summary:A\\, B\\;\\nC\\\\D")[1].value == "A, B;\nC\\D"
+    assert parse_content_line("URL:https://example.com/a\\,b")[1].value.endswith(
+        "a\\,b"
+    )
+    assert parse_content_line("not a property") is None
+
+
+def test_iter_ical_events():
+    with open(os.path.join(FILES_DIR, "legistar_calendar.ics"), "r") as f:
+        events = list(iter_ical_events(f))
+    assert len(events) == 4
+    assert events[0]["URL"].value == (
+        "https://cityscrapers.legistar.com/MeetingDetail.aspx"
+        "?ID=1001&GUID=B&Options=info|&Search="
+    )
+    assert events[0]["DTSTART"].params == {"TZID": "Central Standard Time"}
+    # Nested alarm properties don't replace event properties
+    assert events[1]["SUMMARY"].value == "Committee on Finance"
+    assert events[1]["DESCRIPTION"].value == (
+        "Regular meeting\nPublic comment is limited to 3 minutes per speaker."
+    )
+    assert "ACTION" not in events[1]
+
+
+def test_parse_ical_datetime():
+    tz_name = "America/Chicago"
+    assert parse_ical_datetime(ICalProperty("20210113T100000", {}), tz_name) == (
+        datetime(2021, 1, 13, 10),
+        True,
+    )
+    assert parse_ical_datetime(ICalProperty("20210720T190000Z", {}), tz_name) == (
+        datetime(2021, 7, 20, 14),
+        True,
+    )
+    assert parse_ical_datetime(ICalProperty("20210301", {}), tz_name) == (
+        datetime(2021, 3, 1),
+        False,
+    )
+    assert parse_ical_datetime(ICalProperty("20210113T1000", {}), tz_name) == (
+        datetime(2021, 1, 13, 10),
+        True,
+    )
+    with pytest.raises(ValueError):
+        parse_ical_datetime(ICalProperty("20210113T10", {}), tz_name)
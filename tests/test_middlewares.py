@@ -0,0 +1,39 @@
+from unittest.mock import MagicMock
+
+import pytest
+from scrapy import Request
+from scrapy.exceptions import IgnoreRequest, NotConfigured
+from scrapy.http import HtmlResponse
+from scrapy.settings import Settings
+
+from city_scrapers_core.middlewares import FixtureReplayMiddleware
+from city_scrapers_core.spiders import CityScrapersSpider
+
+
+def _make_fixture_middleware(fixtures_dir):
+    crawler = MagicMock()
+    crawler.settings = Settings({"CITY_SCRAPERS_FIXTURES_DIR": fixtures_dir})
+    return FixtureReplayMiddleware.from_crawler(crawler)
+
+
+def test_fixture_replay_not_configured():
+    with pytest.raises(NotConfigured):
+        _make_fixture_middleware("")
+
+
+def test_fixture_replay_start_urls(tmp_path):
+    (tmp_path / "test_spider.html").write_text("<p>Meeting</p>")
+    (tmp_path / "other_spider.html").write_text("<p>Other</p>")
+    middleware = _make_fixture_middleware(str(tmp_path))
+    spider = CityScrapersSpider(
+        name="test_spider", start_urls=["https://example.com/meetings"]
+    )
+    response = middleware.process_request(
+        Request("https://example.com/meetings"), spider
+    )
+    assert isinstance(response, HtmlResponse)
+    assert response.url == "https://example.com/meetings"
+    assert response.css("p::text").get() == "Meeting"
+    with pytest.raises(IgnoreRequest):
+        middleware.process_request(Request("https://example.com/detail"), spider)
+    middleware.crawler.stats.inc_value.assert_any_call("fixtures/missing")
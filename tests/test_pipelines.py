@@ -1,18 +1,46 @@
+import json
+import logging
+import os
+import subprocess
+import sys
+from concurrent.futures import Future
 from datetime import datetime, timedelta
-from unittest.mock import MagicMock
+from tempfile import TemporaryFile
+from timeit import default_timer
+from unittest.mock import ANY, MagicMock
 
 import pytest
-from scrapy.exceptions import DropItem
+from itemadapter import ItemAdapter
+from jsonschema.validators import Draft7Validator
+from scrapy.exceptions import DontCloseSpider, DropItem
+from scrapy.extensions.feedexport import S3FeedStorage
+from scrapy.settings import Settings
+from twisted.internet.defer import Deferred, succeed
 
+from city_scrapers_core.clock import RunClock
 from city_scrapers_core.constants import CANCELLED
 from city_scrapers_core.decorators import ignore_processed
+from city_scrapers_core.extensions import S3FeedIndexExtension
 from city_scrapers_core.extensions.status import FAILING, RUNNING, StatusExtension
-from city_scrapers_core.items import Meeting
+from city_scrapers_core.items import Meeting, SlottedMeeting
 from city_scrapers_core.pipelines import (
+    CorePipeline,
+    DefaultValuesPipeline,
     DiffPipeline,
+    GCSDiffPipeline,
     MeetingPipeline,
+    OpenCivicDataPipeline,
+    S3DiffPipeline,
     ValidationPipeline,
 )
+from city_scrapers_core.pipelines.diff import get_content_hash, get_delta_key
+from city_scrapers_core.pipelines.feed_cache import FeedCache
+from city_scrapers_core.pipelines.schema_checker import SchemaChecker
+from city_scrapers_core.pipelines.shared_storage import SharedStorage
+from city_scrapers_core.pipelines.validation import (
+    get_confidence_interval,
+    get_percentile,
+)
 from city_scrapers_core.spiders import CityScrapersSpider
 
 
@@ -53,6 +81,265 @@ def test_diff_merges_uids():
     assert all("_id" in r for r in results[:2]) and all(
         "_id" not in r for r in results[2:]
     )
+    spider_mock._scraped_ids = set()
+    assert pipeline.process_item(SlottedMeeting(id="1"), spider_mock)["_id"] == "TEST"
+
+
+def test_diff_waits_for_previous_results():
+    pipeline = DiffPipeline(None, "ocd")
+    spider = CityScrapersSpider(name="test")
+    spider._previous_map = {}
+    spider._scraped_ids = set()
+    pipeline._loading = Deferred()
+    results = []
+    pipeline.process_item(Meeting(id="1"), spider).addCallback(results.append)
+    assert results == []
+    pipeline.set_previous_results(
+        spider, [{"_id": "TEST", "extras": {"cityscrapers.org/id": "1"}}]
+    )
+    assert results == []
+    pipeline._finish_loading(None)
+    assert results[0]["_id"] == "TEST"
+    assert pipeline.process_item(Meeting(id="2"), spider)["id"] == "2"
+
+
+CRAWL_SCRIPT = """
+import json
+import sys
+from datetime import datetime, timedelta
+
+from scrapy import signals
+from scrapy.crawler import CrawlerProcess
+
+from city_scrapers_core.items import Meeting
+from city_scrapers_core.pipelines import CorePipeline, DiffPipeline
+from city_scrapers_core.spiders import CityScrapersSpider
+
+START = datetime.now() + timedelta(days=1)
+
+
+class TestSpider(CityScrapersSpider):
+    name = "test"
+    agency = "Test Agency"
+    timezone = "America/Chicago"
+
+    async def start(self):
+        yield Meeting(
+            id="test/1",
+            title="Meeting",
+            start=START,
+            location={"name": "Hall", "address": "1 Main St"},
+            links=[],
+            source="https://example.com",
+        )
+
+
+%s
+
+process = CrawlerProcess(json.loads(sys.argv[1]))
+crawler = process.create_crawler(TestSpider)
+closed_slots = []
+
+
+def feed_slot_closed(slot):
+    closed_slots.append(slot)
+
+
+crawler.signals.connect(feed_slot_closed, signal=signals.feed_slot_closed)
+process.crawl(crawler)
+process.start()
+stats = crawler.stats.get_stats()
+print(json.dumps([stats.get("finish_reason"), len(closed_slots)]))
+"""
+
+
+def _run_crawl(tmp_path, pipeline_source, settings):
+    """Run a crawl of a spider yielding a single upcoming meeting in a new process,
+    since the reactor can't be restarted
+
+    :return: Tuple of the finish reason and number of stored feeds
+    """
+    script = tmp_path / "crawl.py"
+    script.write_text(CRAWL_SCRIPT % pipeline_source)
+    output = subprocess.run(
+        [sys.executable, str(script), json.dumps(settings)],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=os.path.dirname(os.path.dirname(__file__)),
+        env={**os.environ, "PYTHONPATH": os.path.dirname(os.path.dirname(__file__))},
+    )
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def test_diff_closes_spider_when_previous_results_fail(tmp_path):
+    pipeline_source = """
+class TestDiffPipeline(DiffPipeline):
+    def iter_previous_results(self):
+        raise IOError("Storage unavailable")
+"""
+    feed_path = tmp_path / "feed.json"
+    finish_reason, stored_count = _run_crawl(
+        tmp_path,
+        pipeline_source,
+        {
+            "ITEM_PIPELINES": {
+                "__main__.TestDiffPipeline": 200,
+                "city_scrapers_core.pipelines.CorePipeline": 300,
+            },
+            "FEEDS": {feed_path.as_uri(): {"format": "jsonlines"}},
+            # Set by the runall command unless a project enables it
+            "FEED_STORE_EMPTY": False,
+            "LOG_LEVEL": "ERROR",
+        },
+    )
+    assert finish_reason == "diff_load_failed"
+    assert stored_count == 0
+    assert not feed_path.exists()
+
+
+def test_diff_replays_unscraped_upcoming_items():
+    now = datetime.now()
+    pipeline = DiffPipeline(None, "ocd")
+    spider = CityScrapersSpider(name="test")
+    spider._scraped_ids = set()
+    previous = [
+        {
+            "_id": str(idx),
+            "start_time": (now + timedelta(days=days)).isoformat()[:19],
+            "extras": {"cityscrapers.org/id": str(idx)},
+        }
+        for idx, days in enumerate([-1, 1, 2])
+    ]
+    pipeline.set_previous_results(spider, iter(previous))
+    assert spider._previous_map == {"0": "0", "1": "1", "2": "2"}
+    assert spider._previous_starts["0"] == previous[0]["start_time"]
+    pipeline.process_item(Meeting(id="1"), spider)
+    assert list(pipeline.iter_unscraped_results(spider)) == [previous[2]]
+    assert pipeline._spill_file is None
+
+
+def test_diff_replays_previous_items_in_batches(monkeypatch):
+    from twisted.internet import reactor
+
+    scheduled = []
+    monkeypatch.setattr(
+        reactor, "callLater", lambda delay, func, *args: scheduled.append(args)
+    )
+    crawler = MagicMock()
+    crawler.settings = Settings({"CITY_SCRAPERS_DIFF_REPLAY_BATCH_SIZE": 2})
+    # Scrapers without start_itemproc are from Scrapy versions before 2.13
+    crawler.engine.scraper = MagicMock(spec=["slot", "_process_spidermw_output"])
+    crawler.engine.scraper.slot.needs_backout.return_value = False
+    crawler.engine.scraper._process_spidermw_output.return_value = Deferred()
+    pipeline = DiffPipeline(crawler, "ocd")
+    spider = CityScrapersSpider(name="test")
+    spider._scraped_ids = set()
+    start = (datetime.now() + timedelta(days=1)).isoformat()[:19]
+    pipeline.set_previous_results(
+        spider,
+        [
+            {"_id": str(idx), "start": start, "extras": {"cityscrapers.org/id": idx}}
+            for idx in range(3)
+        ],
+    )
+
+    with pytest.raises(DontCloseSpider):
+        pipeline.spider_idle(spider)
+    process_output = crawler.engine.scraper._process_spidermw_output
+    assert process_output.call_count == 2
+    # Next batch isn't scheduled until the current one has been processed
+    assert scheduled == []
+    with pytest.raises(DontCloseSpider):
+        pipeline.spider_idle(spider)
+    assert process_output.call_count == 2
+
+    process_output.return_value.callback(None)
+    assert len(scheduled) == 1
+    pipeline._replay_batch(spider)
+    assert process_output.call_count == 3
+    pipeline._replay_batch(spider)
+    pipeline.spider_idle(spider)
+    crawler.stats.inc_value.assert_any_call("diff/replayed_count", 1, spider=spider)
+
+
+def test_diff_replays_previous_items_with_scraper(tmp_path):
+    pipeline_source = """
+class TestDiffPipeline(DiffPipeline):
+    def iter_previous_results(self):
+        for idx in range(3):
+            yield {
+                "_id": f"ocd-event/{idx}",
+                "status": "tentative",
+                "start_time": START.isoformat(),
+                "extras": {"cityscrapers.org/id": f"test/{idx}"},
+            }
+"""
+    feed_path = tmp_path / "feed.json"
+    finish_reason, stored_count = _run_crawl(
+        tmp_path,
+        pipeline_source,
+        {
+            "ITEM_PIPELINES": {
+                "__main__.TestDiffPipeline": 200,
+                "city_scrapers_core.pipelines.CorePipeline": 300,
+            },
+            "FEEDS": {feed_path.as_uri(): {"format": "jsonlines"}},
+            "CITY_SCRAPERS_DIFF_REPLAY_BATCH_SIZE": 1,
+            "LOG_LEVEL": "ERROR",
+        },
+    )
+    results = [json.loads(line) for line in feed_path.read_text().splitlines()]
+    assert finish_reason == "finished" and stored_count == 1
+    assert sorted((result["_id"], result["status"]) for result in results) == [
+        ("ocd-event/0", "cancelled"),
+        ("ocd-event/1", "tentative"),
+        ("ocd-event/2", "cancelled"),
+    ]
+
+
+def test_diff_writes_delta_feed():
+    crawler = MagicMock()
+    crawler.settings = Settings({"CITY_SCRAPERS_DIFF_DELTA_PREFIX": "delta"})
+    pipeline = DiffPipeline(crawler, "ocd")
+    pipeline._delta_file = TemporaryFile("w+", encoding="utf-8")
+    pipeline.write_text = MagicMock()
+    spider = CityScrapersSpider(name="test")
+    spider._scraped_ids = set()
+    # Deltas are keyed by the start of the run, even if it closes on a later day
+    spider.clock = RunClock(datetime.now() - timedelta(days=1))
+    start = (datetime.now() + timedelta(days=1)).isoformat()[:19]
+
+    def ocd_item(scraper_id, title, updated_at="2020-01-01T00:00:00"):
+        return {
+            "_id": f"ocd-{scraper_id}",
+            "name": title,
+            "start_time": start,
+            "updated_at": updated_at,
+            "extras": {"cityscrapers.org/id": scraper_id},
+        }
+
+    previous = [ocd_item(idx, "Meeting") for idx in ["same", "changed", "removed"]]
+    pipeline.set_previous_results(spider, previous)
+    for idx in ["same", "changed", "new"]:
+        pipeline.process_item(Meeting(id=idx), spider)
+    cancelled = pipeline.process_item(previous[2], spider)
+
+    pipeline.item_scraped(ocd_item("same", "Meeting", updated_at="NOW"), spider)
+    pipeline.item_scraped(ocd_item("changed", "Updated"), spider)
+    pipeline.item_scraped(ocd_item("new", "Meeting"), spider)
+    pipeline.item_scraped(cancelled, spider)
+    pipeline.close_spider(spider)
+
+    key, delta_text = pipeline.write_text.call_args[0]
+    assert key == get_delta_key(crawler.settings, "test", spider.clock.now)
+    assert key.startswith("delta/") and key.endswith("/test.json")
+    changes = [json.loads(line) for line in delta_text.strip().split("\n")]
+    assert [(c["action"], c["meeting"]["_id"]) for c in changes] == [
+        ("modified", "ocd-changed"),
+        ("added", "ocd-new"),
+        ("cancelled", "ocd-removed"),
+    ]
 
 
 def test_diff_ignores_previous_items():
@@ -84,6 +371,349 @@ def test_diff_cancels_upcoming_previous_items():
     assert result["status"] == CANCELLED
 
 
+def test_diff_keeps_previous_items_before_incremental_window():
+    now = datetime.now()
+    pipeline = DiffPipeline(None, "ocd")
+    spider = CityScrapersSpider(name="test")
+    spider.incremental = True
+    spider._scraped_ids = set()
+    previous = [
+        {
+            "_id": str(idx),
+            "start_time": (now + timedelta(days=days)).isoformat()[:19],
+            "extras": {"cityscrapers.org/id": str(idx)},
+        }
+        for idx, days in enumerate([-90, -10, 2])
+    ]
+    pipeline.set_previous_results(spider, iter(previous))
+    spider.incremental_start = (now - timedelta(days=30)).isoformat()[:19]
+    replayed = list(pipeline.iter_unscraped_results(spider))
+    # Meetings before the window and upcoming meetings are replayed
+    assert replayed == [previous[0], previous[2]]
+    assert pipeline.process_item(replayed[0], spider) == previous[0]
+    assert pipeline.process_item(replayed[1], spider)["status"] == CANCELLED
+    with pytest.raises(DropItem):
+        pipeline.process_item(previous[1], spider)
+
+
+class MockClientError(Exception):
+    def __init__(self, response):
+        self.response = response
+
+
+def _mock_s3_crawler(monkeypatch, objects, **settings):
+    client = MagicMock()
+    client.exceptions.NoSuchKey = KeyError
+    client.exceptions.ClientError = MockClientError
+
+    def get_object(Bucket, Key, IfNoneMatch=None):
+        etag = f"etag-{hash(objects[Key])}"
+        if IfNoneMatch == etag:
+            raise MockClientError({"Error": {"Code": "304"}})
+        body = MagicMock()
+        body.read.return_value = objects[Key].encode()
+        body.iter_lines.return_value = objects[Key].encode().split(b"\n")
+        return {"Body": body, "ETag": etag}
+
+    def put_object(Body, Bucket, Key, **kwargs):
+        objects[Key] = Body.decode()
+
+    client.get_object.side_effect = get_object
+    client.put_object.side_effect = put_object
+    client.head_object.side_effect = lambda Bucket, Key: {"ETag": f"etag-{Key}"}
+    client.get_paginator.return_value.paginate.side_effect = lambda Bucket, Prefix: [
+        {"Contents": [{"Key": key} for key in objects if key.startswith(Prefix)]}
+    ]
+    boto3 = MagicMock()
+    boto3.client.return_value = client
+    monkeypatch.setitem(sys.modules, "boto3", boto3)
+
+    crawler = MagicMock()
+    crawler.settings = Settings(
+        {
+            "FEED_URI": "s3://bucket/%(year)s/%(month)s/%(day)s/%(name)s.json",
+            **settings,
+        }
+    )
+    crawler.spider = CityScrapersSpider(name="spider")
+    return crawler, client
+
+
+def test_feed_index_points_diff_to_latest_feed(monkeypatch):
+    today = datetime.now().strftime("%Y/%m/%d")
+    objects = {
+        f"{today}/0100/spider.json": json.dumps({"_id": "old"}),
+        f"{today}/0200/spider.json": json.dumps({"_id": "new"}),
+    }
+    crawler, client = _mock_s3_crawler(
+        monkeypatch, objects, CITY_SCRAPERS_FEED_INDEX_PREFIX="index"
+    )
+    pipeline = S3DiffPipeline(crawler, "ocd")
+    assert pipeline.load_previous_results() == [{"_id": "new"}]
+    client.get_paginator.assert_called_once()
+
+    _wait_in_thread(monkeypatch, "city_scrapers_core.extensions.feed_index")
+    stats = {}
+    crawler.stats.get_value.side_effect = lambda key, default=None: stats.get(
+        key, default
+    )
+    slot = MagicMock()
+    slot.uri = f"s3://bucket/{today}/0100/spider.json"
+    slot.storage = S3FeedStorage.__new__(S3FeedStorage)
+    extension = S3FeedIndexExtension(crawler)
+    # Slots are closed after failed stores too, so failures aren't indexed
+    stats["feedexport/failed_count/S3FeedStorage"] = 1
+    assert extension.feed_slot_closed(slot) is None
+    assert "index/spider.json" not in objects
+
+    stats.clear()
+    extension.feed_slot_closed(slot)
+    index = json.loads(objects["index/spider.json"])
+    assert index["key"] == f"{today}/0100/spider.json"
+    assert index["fingerprint"] == f"etag-{today}/0100/spider.json"
+
+    client.get_paginator.reset_mock()
+    assert pipeline.load_previous_results() == [{"_id": "old"}]
+    client.get_paginator.assert_not_called()
+
+    # Index objects that weren't updated recently fall back to listing feeds
+    index["updated_at"] = (datetime.now() - timedelta(days=5)).isoformat()
+    objects["index/spider.json"] = json.dumps(index)
+    assert pipeline.load_previous_results() == [{"_id": "new"}]
+    client.get_paginator.assert_called_once()
+
+
+def test_gcs_diff_handles_missing_feed(monkeypatch, tmp_path):
+    storage = MagicMock()
+    google_cloud = MagicMock(storage=storage)
+    monkeypatch.setitem(sys.modules, "google", MagicMock(cloud=google_cloud))
+    monkeypatch.setitem(sys.modules, "google.cloud", google_cloud)
+    bucket = storage.Client.return_value.bucket.return_value
+    # The feed was listed, but removed before it was read
+    bucket.get_blob.return_value = None
+    crawler = MagicMock()
+    crawler.settings = Settings(
+        {
+            "FEED_URI": "gs://bucket/%(year)s/%(month)s/%(day)s/%(name)s.json",
+            "CITY_SCRAPERS_DIFF_CACHE_DIR": str(tmp_path),
+        }
+    )
+    crawler.spider = CityScrapersSpider(name="spider")
+    crawler.spider._scraped_ids = set()
+    pipeline = GCSDiffPipeline(crawler, "ocd")
+    assert pipeline.open_feed("feed.json") == (None, ANY)
+    assert list(pipeline.iter_feed("feed.json")) == []
+
+    pipeline.get_previous_key = lambda: "feed.json"
+    pipeline.load_previous_index(crawler.spider)
+    assert crawler.spider._previous_map == {}
+
+
+def test_diff_feed_cache_skips_unchanged_feed(monkeypatch, tmp_path):
+    today = datetime.now().strftime("%Y/%m/%d")
+    start = (datetime.now() + timedelta(days=1)).isoformat()[:19]
+    objects = {
+        f"{today}/0100/spider.json": "\n".join(
+            json.dumps(
+                {"_id": uid, "start": start, "extras": {"cityscrapers.org/id": uid}}
+            )
+            for uid in ["1", "2"]
+        )
+    }
+    crawler, client = _mock_s3_crawler(
+        monkeypatch, objects, CITY_SCRAPERS_DIFF_CACHE_DIR=str(tmp_path)
+    )
+    spider = crawler.spider
+    spider._scraped_ids = {"1"}
+    pipeline = S3DiffPipeline(crawler, "ocd")
+    pipeline.load_previous_index(spider)
+    crawler.stats.inc_value.assert_called_with("diff/cache_miss", spider=spider)
+    assert spider._previous_map == {"1": "1", "2": "2"}
+    assert [r["_id"] for r in pipeline.iter_unscraped_results(spider)] == ["2"]
+
+    spider._previous_map = {}
+    pipeline = S3DiffPipeline(crawler, "ocd")
+    pipeline.load_previous_index(spider)
+    crawler.stats.inc_value.assert_called_with("diff/cache_hit", spider=spider)
+    assert "IfNoneMatch" in client.get_object.call_args.kwargs
+    assert spider._previous_map == {"1": "1", "2": "2"}
+    assert [r["_id"] for r in pipeline.iter_unscraped_results(spider)] == ["2"]
+
+    # Content hashes are cached without delta feeds, and recomputed for older caches
+    expected_hashes = {
+        result["_id"]: get_content_hash(result)
+        for result in map(json.loads, objects[f"{today}/0100/spider.json"].split("\n"))
+    }
+    for strip_hashes in [False, True]:
+        if strip_hashes:
+            [cache_path] = [str(path) for path in tmp_path.iterdir()]
+            with open(cache_path) as f:
+                header, *lines = f.readlines()
+            header = json.loads(header)
+            header["entries"] = [entry[:3] for entry in header["entries"]]
+            with open(cache_path, "w") as f:
+                f.writelines([json.dumps(header) + "\n", *lines])
+        pipeline = S3DiffPipeline(crawler, "ocd")
+        pipeline.delta_prefix = "delta"
+        pipeline.load_previous_index(spider)
+        crawler.stats.inc_value.assert_called_with("diff/cache_hit", spider=spider)
+        assert pipeline._previous_hashes == expected_hashes
+        assert [r["_id"] for r in pipeline.iter_unscraped_results(spider)] == ["2"]
+
+
+def test_feed_cache_evicts_least_recently_used(tmp_path):
+    cache = FeedCache(str(tmp_path), 600)
+    for key in ["a", "b", "c"]:
+        header, feed_file = cache.put(key, key, ["x" * 200], lambda line: [line[:1]])
+        feed_file.close()
+        os.utime(cache.path(key), (len(os.listdir(tmp_path)),) * 2)
+    assert cache.get("a") is None
+    header, feed_file = cache.get("c")
+    feed_file.close()
+    assert header["etag"] == "c" and header["entries"] == [["x"]]
+
+
+def test_diff_shared_loader_lists_prefix_once(monkeypatch):
+    SharedStorage.clear()
+    today = datetime.now().strftime("%Y/%m/%d")
+    objects = {
+        f"{today}/0100/{name}.json": json.dumps({"_id": name})
+        for name in ["spider", "other"]
+    }
+    crawler, client = _mock_s3_crawler(
+        monkeypatch, objects, CITY_SCRAPERS_DIFF_SHARED_LOADER=True
+    )
+    other_crawler = MagicMock()
+    other_crawler.settings = crawler.settings
+    other_crawler.spider = CityScrapersSpider(name="other")
+    pipelines = [S3DiffPipeline(c, "ocd") for c in [crawler, other_crawler]]
+    assert [p.load_previous_results() for p in pipelines] == [
+        [{"_id": "spider"}],
+        [{"_id": "other"}],
+    ]
+    assert sys.modules["boto3"].client.call_count == 1
+    assert client.get_paginator.return_value.paginate.call_count == 1
+    SharedStorage.clear()
+
+
+def test_ocd_reuses_updated_at_for_unchanged_meetings():
+    spider = CityScrapersSpider(name="test", agency="Test Agency")
+    pipeline = OpenCivicDataPipeline()
+
+    def meeting(title):
+        return Meeting(
+            id="test/1",
+            title=title,
+            description="",
+            classification="Board",
+            status="tentative",
+            start=datetime(2020, 1, 1, 12),
+            end=datetime(2020, 1, 1, 14),
+            all_day=False,
+            time_notes="",
+            location={"name": "Hall", "address": "1 Main St"},
+            links=[],
+            source="https://example.com",
+        )
+
+    previous = {
+        **pipeline.process_item(meeting("Board"), spider),
+        "updated_at": "2020-01-01T00:00:00-06:00",
+    }
+    assert previous["extras"]["cityscrapers.org/fingerprint"]
+    diff_pipeline = DiffPipeline(None, "ocd")
+    diff_pipeline.set_previous_results(spider, [previous])
+    unchanged = pipeline.process_item(meeting("Board"), spider)
+    assert unchanged["updated_at"] == previous["updated_at"]
+    changed = pipeline.process_item(meeting("Board Meeting"), spider)
+    assert changed["updated_at"] != previous["updated_at"]
+    assert (
+        changed["extras"]["cityscrapers.org/fingerprint"]
+        != previous["extras"]["cityscrapers.org/fingerprint"]
+    )
+
+
+def test_core_pipeline_matches_separate_pipelines():
+    spider = CityScrapersSpider(name="test", agency="Test Agency")
+
+    def meetings():
+        return [
+            Meeting(
+                id="test/1",
+                title="Board Meeting (Rescheduled)",
+                start=datetime(2020, 1, 1, 12),
+                end=datetime(2020, 1, 1, 12),
+                location={"name": "Hall", "address": "1 Main St"},
+                source="https://example.com",
+            ),
+            Meeting(
+                id="test/2",
+                title="Committee",
+                description="Description",
+                classification="Committee",
+                status="cancelled",
+                start=datetime(2020, 2, 1, 9),
+                end=datetime(2020, 2, 1, 11),
+                all_day=False,
+                time_notes="Notes",
+                location={"name": "Hall", "address": "1 Main St"},
+                links=[{"href": "https://example.com/agenda", "title": "Agenda"}],
+                source="https://example.com",
+            ),
+            {"_id": "ocd-event/1", "_type": "event"},
+        ]
+
+    separate_pipelines = [
+        DefaultValuesPipeline(),
+        MeetingPipeline(),
+        OpenCivicDataPipeline(),
+    ]
+    core_pipeline = CorePipeline()
+    for separate_item, core_item in zip(meetings(), meetings()):
+        for pipeline in separate_pipelines:
+            separate_item = pipeline.process_item(separate_item, spider)
+        core_item = core_pipeline.process_item(core_item, spider)
+        if isinstance(core_item, dict) and core_item.get("_type") == "event":
+            for item in [separate_item, core_item]:
+                item.pop("_id", None)
+                item.pop("updated_at", None)
+        assert core_item == separate_item
+
+
+def test_slotted_meeting_matches_meeting():
+    spider = CityScrapersSpider(name="test", agency="Test Agency")
+    values = {
+        "id": "test/1",
+        "title": "Board Meeting (Rescheduled)",
+        "start": datetime(2020, 1, 1, 12),
+        "location": {"name": "Hall", "address": "1 Main St"},
+        "source": "https://example.com",
+    }
+    pipeline = CorePipeline()
+    meeting = pipeline.process_item(Meeting(**values), spider)
+    slotted = pipeline.process_item(SlottedMeeting(**values), spider)
+    for item in [meeting, slotted]:
+        item.pop("_id")
+        item.pop("updated_at")
+    assert slotted == meeting
+
+    slotted_item = SlottedMeeting(**values)
+    assert not hasattr(slotted_item, "__dict__")
+    assert "end" not in slotted_item and slotted_item.get("end") is None
+    assert ItemAdapter(slotted_item).asdict() == dict(Meeting(**values))
+    with pytest.raises(KeyError):
+        slotted_item["other"] = "value"
+
+    slotted_item["links"] = None
+    validation = ValidationPipeline()
+    validation.open_spider(spider)
+    validation.process_item(
+        MeetingPipeline().process_item(slotted_item, spider), spider
+    )
+    assert validation.item_count == 1
+    assert validation.error_count["links"] == 1
+
+
 def test_validation_handles_errors():
     pipeline = ValidationPipeline()
     pipeline.open_spider(None)
@@ -134,6 +764,235 @@ def test_validation_throws_error():
     pipeline.validation_report(spider_mock)
 
 
+def test_validation_sampling(caplog):
+    pipeline = ValidationPipeline(enforce_validation=True, sample_rate=4)
+    pipeline.random.seed(1)
+    pipeline.open_spider(None)
+    for idx in range(400):
+        pipeline.process_item(
+            Meeting(
+                id="test",
+                title="Test",
+                start=datetime.now(),
+                end=datetime.now(),
+                links=None if idx % 20 == 0 else [],
+                source="https://example.com",
+            ),
+            None,
+        )
+    assert pipeline.scraped_count == 400
+    assert 50 < pipeline.item_count < 150
+    spider_mock = MagicMock()
+    spider_mock.name = "mock"
+    with caplog.at_level(logging.INFO):
+        pipeline.validation_report(spider_mock)
+    assert "confidence bounds" in caplog.text
+    # 20% failures in a sample of this size are very likely below the threshold
+    pipeline.error_count["links"] = pipeline.item_count // 5
+    with pytest.raises(ValueError):
+        pipeline.validation_report(spider_mock)
+
+
+def test_validation_time_fraction_has_no_confidence_bounds(caplog):
+    pipeline = ValidationPipeline(time_fraction=0.5)
+    pipeline.open_spider(None)
+    for idx in range(10):
+        pipeline.process_item(
+            Meeting(
+                id="test",
+                title="Test",
+                start=datetime.now(),
+                end=datetime.now(),
+                links=[],
+                source="https://example.com",
+            ),
+            None,
+        )
+    spider_mock = MagicMock()
+    spider_mock.name = "mock"
+    summary = pipeline.get_summary(spider_mock)
+    assert summary["sampled"] and summary["sample_method"] == "time_fraction"
+    assert summary["pass_rates"]["links"] == {"rate": 1.0}
+    with caplog.at_level(logging.INFO):
+        pipeline.validation_report(spider_mock)
+    assert "no confidence bounds" in caplog.text
+
+
+def test_validation_time_fraction_ignores_worker_time():
+    pipeline = ValidationPipeline(worker="thread", batch_size=2, time_fraction=0.5)
+    pipeline.open_spider(None)
+    pipeline.start_time = default_timer() - 1
+    for idx in range(3):
+        pipeline.process_item(
+            Meeting(
+                id="test",
+                title="Test",
+                start=datetime.now(),
+                end=datetime.now(),
+                links=[],
+                source="https://example.com",
+            ),
+            None,
+        )
+    pipeline.merge_results(wait=True)
+    crawl_thread_time = pipeline.validation_time
+    assert 0 < crawl_thread_time < 0.5
+    worker_result = Future()
+    worker_result.set_result((["links"], [(set(), 10.0, None)]))
+    pipeline.futures.append(worker_result)
+    pipeline.merge_results()
+    # Worker time is tracked separately and doesn't count against the budget
+    assert pipeline.validation_time == crawl_thread_time
+    assert pipeline.worker_time >= 10.0
+    assert pipeline.should_validate()
+
+
+def _wait_in_thread(monkeypatch, module="city_scrapers_core.pipelines.validation"):
+    """Run functions passed to deferToThread immediately, since the reactor isn't
+    running in tests"""
+    monkeypatch.setattr(
+        f"{module}.deferToThread", lambda func, *args: succeed(func(*args))
+    )
+
+
+@pytest.mark.parametrize("worker", ["thread", "process"])
+def test_validation_worker(monkeypatch, worker):
+    _wait_in_thread(monkeypatch)
+    pipeline = ValidationPipeline(worker=worker, batch_size=3)
+    pipeline.open_spider(None)
+    items = [
+        Meeting(
+            id="test",
+            title="Test",
+            start=datetime.now(),
+            end=datetime.now(),
+            links=None if idx % 2 == 0 else [],
+            source="https://example.com",
+        )
+        for idx in range(7)
+    ]
+    for item in items:
+        assert pipeline.process_item(item, None) is item
+        # Changes made by later pipelines don't affect queued snapshots
+        item["links"] = []
+    spider_mock = MagicMock()
+    spider_mock.name = "mock"
+    executor = pipeline.executor
+    pipeline.close_spider(spider_mock)
+    assert pipeline.executor is None
+    assert pipeline.item_count == 7
+    assert pipeline.error_count["links"] == 4
+    assert pipeline.error_count["title"] == 0
+    # The executor is shared across spiders and left running
+    pipeline.open_spider(None)
+    assert pipeline.executor is executor
+
+
+@pytest.mark.parametrize("worker", [None, "thread"])
+def test_validation_json_report(monkeypatch, tmp_path, worker):
+    _wait_in_thread(monkeypatch)
+    pipeline = ValidationPipeline(
+        worker=worker,
+        report_uri=str(tmp_path / "reports" / "%(name)s.json"),
+        report_samples=2,
+    )
+    pipeline.open_spider(None)
+    for idx in range(5):
+        pipeline.process_item(
+            Meeting(
+                id=f"test/{idx}",
+                title="Test",
+                start=datetime.now(),
+                end=datetime.now(),
+                links=None if idx < 3 else [],
+                source="https://example.com",
+            ),
+            None,
+        )
+    spider_mock = MagicMock()
+    spider_mock.name = "mock"
+    stored = pipeline.close_spider(spider_mock)
+    assert stored is None or stored.called
+    report = json.loads((tmp_path / "reports" / "mock.json").read_text())
+    assert report["item_count"] == 5
+    assert report["pass_rates"]["links"]["rate"] == 0.4
+    assert report["error_samples"]["links"] == [
+        {"value": None, "messages": ["None is not of type 'array'"]},
+        {"value": None, "messages": ["None is not of type 'array'"]},
+    ]
+    assert "title" not in report["error_samples"]
+    assert 0 < report["timings"]["p50"] <= report["timings"]["p99"]
+    assert report["timings"]["total"] >= report["timings"]["p99"]
+
+
+def test_percentile():
+    assert get_percentile([], 50) == 0.0
+    assert get_percentile([3, 1, 2, 4], 50) == 2
+    assert get_percentile(list(range(1, 101)), 99) == 99
+
+
+def test_confidence_interval():
+    lower, upper = get_confidence_interval(90, 100)
+    assert 0.82 < lower < 0.9 < upper < 0.95
+    assert get_confidence_interval(0, 0) == (0.0, 1.0)
+    assert get_confidence_interval(10, 10)[1] == 1.0
+
+
+def test_schema_checker_matches_draft7_validator():
+    schema = {
+        **Meeting.jsonschema,
+        "properties": {
+            **Meeting.jsonschema["properties"],
+            "links": {"type": "array", "items": {"$ref": "#/definitions/link"}},
+            "location": {"$ref": "#/definitions/location"},
+        },
+    }
+    checker = SchemaChecker(schema)
+    validator = Draft7Validator(schema)
+    valid_item = {
+        "id": "test",
+        "title": "Test",
+        "description": "",
+        "classification": "Board",
+        "status": "tentative",
+        "start": "2020-01-01T12:00:00",
+        "end": "2020-01-01T14:00:00",
+        "all_day": False,
+        "time_notes": "",
+        "location": {"name": "", "address": ""},
+        "links": [{"href": "https://example.com", "title": "Agenda"}],
+        "source": "https://example.com",
+    }
+    invalid_values = [
+        ("title", None),
+        ("classification", "Unknown"),
+        ("status", 1),
+        ("all_day", 0),
+        ("location", {"name": 1}),
+        ("links", [{"title": "Agenda"}]),
+        ("links", None),
+    ]
+    assert checker.get_error_props(valid_item) == set()
+    for prop, value in invalid_values:
+        item = {**valid_item, prop: value}
+        expected = {
+            error.path[0] for error in validator.iter_errors(item) if error.path
+        }
+        assert checker.get_error_props(item) == expected == {prop}
+
+
+def test_validation_reuses_schema_checker():
+    pipeline = ValidationPipeline()
+    item = Meeting(
+        id="test",
+        title="Test",
+        start=datetime.now(),
+        end=datetime.now(),
+        source="https://example.com",
+    )
+    assert pipeline.get_checker(item) is pipeline.get_checker(Meeting(**item))
+
+
 def _make_status_extension(item_count=0, has_error=False):
     """Create a StatusExtension with a mocked crawler."""
     crawler = MagicMock()
@@ -1,10 +1,23 @@
+import json
+import os
+import re
 from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from threading import Thread
+from urllib.parse import parse_qs, unquote, urlparse
+from urllib.request import urlopen
 
 import pytest
+from scrapy import Request
+from scrapy.http import HtmlResponse, TextResponse
+from twisted.python.failure import Failure
 
+from city_scrapers_core.clock import RunClock
 from city_scrapers_core.constants import CANCELLED, PASSED, TENTATIVE
 from city_scrapers_core.spiders import CityScrapersSpider, LegistarSpider
 
+FILES_DIR = os.path.join(os.path.dirname(__file__), "files")
+
 
 @pytest.fixture
 def spider():
@@ -75,3 +88,316 @@ def test_legistar_source():
         == EXAMPLE
     )
     assert spider.legistar_source({"Meeting Details": ""}) == DEFAULT
+
+
+def test_legistar_parse_events():
+    url = "https://cityscrapers.legistar.com/Calendar.aspx"
+    with open(os.path.join(FILES_DIR, "legistar_calendar.html"), "rb") as f:
+        response = HtmlResponse(url, body=f.read())
+    spider = LegistarSpider(name="city_scrapers", start_urls=[url])
+    events = spider._parse_legistar_events(response)
+    assert events == [
+        {
+            "Name": {
+                "label": "City Council",
+                "url": "https://cityscrapers.legistar.com/DepartmentDetail.aspx?ID=130&GUID=A",  # noqa
+            },
+            "Meeting Date": "1/13/2021",
+            "Meeting Time": "10:00 AM",
+            "Meeting Location": "Council Chambers",
+            "Agenda": {
+                "label": "Agenda",
+                "url": "https://cityscrapers.legistar.com/View.ashx?M=A&ID=1001&GUID=B",  # noqa
+            },
+            "iCalendar": {
+                "label": "Export",
+                "url": "https://cityscrapers.legistar.com/View.ashx?M=IC&ID=1001&GUID=B",  # noqa
+            },
+        },
+        {
+            "Name": {
+                "label": "Committee on Finance",
+                "url": "https://cityscrapers.legistar.com/DepartmentDetail.aspx?ID=131&GUID=C",  # noqa
+            },
+            "Meeting Date": "1/20/2021",
+            "Meeting Time": "1:00 PM",
+            "Meeting Location": "Room 201",
+            "Agenda": "Not\xa0available",
+            "iCalendar": {
+                "label": "Export",
+                "url": "https://cityscrapers.legistar.com/View.ashx?M=IC&ID=1002&GUID=D",  # noqa
+            },
+        },
+    ]
+    assert spider._parse_legistar_events(response) == []
+
+
+def test_legistar_parse_events_blank_header():
+    url = "https://cityscrapers.legistar.com/Calendar.aspx"
+    with open(os.path.join(FILES_DIR, "legistar_calendar.html"), "rb") as f:
+        body = f.read().replace(b'<img alt="iCalendar" src="/Images/ics.gif" />', b"")
+    spider = LegistarSpider(name="city_scrapers", start_urls=[url])
+    events = spider._parse_legistar_events(HtmlResponse(url, body=body))
+    assert [event["iCalendar"] for event in events] == [
+        {"url": "https://cityscrapers.legistar.com/View.ashx?M=IC&ID=1001&GUID=B"},
+        {"url": "https://cityscrapers.legistar.com/View.ashx?M=IC&ID=1002&GUID=D"},
+    ]
+
+
+def test_legistar_page_size_postback():
+    class PagedLegistarSpider(LegistarSpider):
+        def parse_legistar(self, events):
+            yield from events
+
+    url = "https://cityscrapers.legistar.com/Calendar.aspx"
+    with open(os.path.join(FILES_DIR, "legistar_calendar.html"), "rb") as f:
+        calendar_body = f.read()
+    spider = PagedLegistarSpider(name="city_scrapers", start_urls=[url])
+    spider.since_year = datetime.now().year
+    calendar = HtmlResponse(url, body=calendar_body)
+    request = next(spider.parse(calendar))
+    payload = parse_qs(request.body.decode("utf-8"))
+    combo_name = (
+        "ctl00$ContentPlaceHolder1$gridCalendar$ctl00$ctl03$ctl01$PageSizeComboBox"
+    )
+    assert payload[combo_name] == ["All"]
+    assert (
+        json.loads(payload[combo_name.replace("$", "_") + "_ClientState"][0])["value"]
+        == "All"
+    )
+
+    # Grid returned with the override is parsed as usual
+    results = list(
+        request.callback(HtmlResponse(url, body=calendar_body, request=request))
+    )
+    assert len([r for r in results if isinstance(r, dict)]) == 2
+
+    # Error pages and failed requests are retried without the override, paginating
+    error_response = HtmlResponse(url, body=b"<p>Error</p>", request=request)
+    fallback = next(request.callback(error_response))
+    assert combo_name not in parse_qs(fallback.body.decode("utf-8"))
+    assert fallback.errback is None
+    failure = Failure(Exception("Invalid postback"))
+    failure.request = request
+    assert next(request.errback(failure)).body == fallback.body
+    next_page = list(
+        fallback.callback(HtmlResponse(url, body=calendar_body, request=fallback))
+    )[-1]
+    assert (
+        "gridCalendar$ctl00$ctl03$ctl01$ctl05"
+        in parse_qs(next_page.body.decode("utf-8"))["__EVENTTARGET"][0]
+    )
+
+    spider.legistar_page_size = False
+    assert spider._parse_page_size_fields(calendar) == {}
+    spider.legistar_page_size = 100
+    assert list(spider._parse_page_size_fields(calendar).values())[0] == "100"
+
+
+def test_legistar_incremental_window():
+    url = "https://cityscrapers.legistar.com/Calendar.aspx"
+    with open(os.path.join(FILES_DIR, "legistar_calendar.html"), "rb") as f:
+        calendar = HtmlResponse(url, body=f.read())
+    now = datetime.now()
+    spider = LegistarSpider(name="city_scrapers", start_urls=[url])
+    spider.incremental = True
+    spider.incremental_months = 0
+    spider.clock = RunClock(now)
+    # Everything is requested without previous results covering earlier meetings
+    assert spider.legistar_window_start() == datetime(now.year - 1, 1, 1)
+    assert spider.incremental_start is None
+    assert len(list(spider.parse(calendar))) == 2
+
+    spider._previous_starts = {"old": f"{now.year - 1}-01-13T10:00:00-06:00"}
+    assert spider.legistar_window_start() == datetime(now.year, now.month, 1)
+    assert spider.incremental_start == datetime(now.year, now.month, 1).isoformat()
+    assert len(list(spider.parse(calendar))) == 1
+    spider.legistar_engine = "api"
+    api_url = list(spider.start_requests())[0].url
+    assert f"datetime'{now.year}-{now.month:02d}-01'" in unquote(api_url)
+
+
+def test_legistar_ical_skips_invalid_events(caplog):
+    spider = LegistarSpider(
+        name="city_scrapers",
+        start_urls=["https://cityscrapers.legistar.com/Calendar.aspx"],
+    )
+    spider.legistar_ical_url = "https://cityscrapers.legistar.com/Feed.ashx?M=ICal"
+    body = "\r\n".join(
+        [
+            "BEGIN:VCALENDAR",
+            "BEGIN:VEVENT",
+            "UID:invalid",
+            "DTSTART:2021011",
+            "END:VEVENT",
+            "BEGIN:VEVENT",
+            "UID:valid",
+            "DTSTART:20210113T1000",
+            "SUMMARY:City Council Café",
+            "END:VEVENT",
+            "END:VCALENDAR",
+        ]
+    )
+    # Lines are decoded with the response's encoding as they're parsed
+    response = TextResponse(
+        spider.legistar_ical_url, body=body.encode("latin-1"), encoding="latin-1"
+    )
+    [calendar_request] = spider._parse_legistar_ical(response)
+    [event] = calendar_request.cb_kwargs["events"]
+    assert spider.legistar_start(event) == datetime(2021, 1, 13, 10)
+    assert event["Name"]["label"] == "City Council Café"
+    assert "Skipping iCalendar event invalid" in caplog.text
+
+
+def test_legistar_ical_engine():
+    class ICalLegistarSpider(LegistarSpider):
+        name = "city_scrapers"
+        start_urls = ["https://cityscrapers.legistar.com/Calendar.aspx"]
+        legistar_engine = "ical"
+        legistar_ical_url = "https://cityscrapers.legistar.com/Feed.ashx?M=ICal"
+
+        def parse_legistar(self, events):
+            yield from events
+
+    spider = ICalLegistarSpider()
+    ical_request = next(spider.start_requests())
+    with open(os.path.join(FILES_DIR, "legistar_calendar.ics"), "rb") as f:
+        ical_response = TextResponse(
+            ical_request.url, body=f.read(), encoding="utf-8", request=ical_request
+        )
+    calendar_request = next(ical_request.callback(ical_response))
+    assert calendar_request.url == spider.start_urls[0]
+    with open(os.path.join(FILES_DIR, "legistar_calendar.html"), "rb") as f:
+        calendar_response = HtmlResponse(
+            calendar_request.url, body=f.read(), request=calendar_request
+        )
+    events = list(
+        calendar_request.callback(calendar_response, **calendar_request.cb_kwargs)
+    )
+    assert len(events) == 3
+    # Links are added from the matching calendar page rows
+    assert spider.legistar_links(events[0]) == [
+        {
+            "href": "https://cityscrapers.legistar.com/View.ashx?M=A&ID=1001&GUID=B",
+            "title": "Agenda",
+        }
+    ]
+    assert events[0]["Name"]["label"] == "City Council"
+    assert spider.legistar_start(events[0]) == datetime(2021, 1, 13, 10)
+    assert events[1]["Meeting Location"] == "Room 201, City Hall"
+    assert spider.legistar_start(events[1]) == datetime(2021, 1, 20, 13)
+    assert events[1]["iCalendar"]["url"] == (
+        "https://cityscrapers.legistar.com/View.ashx?M=IC&ID=1002&GUID=D"
+    )
+    assert events[2]["Meeting Time"] == ""
+    assert spider.legistar_start(events[2]) is None
+    assert spider.legistar_source(events[2]) == spider.start_urls[0]
+
+    # Events are still returned without links if the calendar page fails
+    spider = ICalLegistarSpider()
+    ical_request = next(spider.start_requests())
+    calendar_request = next(ical_request.callback(ical_response))
+    failure = Failure(Exception("Calendar page failed"))
+    failure.request = calendar_request
+    events = list(calendar_request.errback(failure))
+    assert len(events) == 3 and spider.legistar_links(events[0]) == []
+
+
+@pytest.fixture
+def legistar_api_server():
+    """Local stand-in for the Legistar Web API serving recorded events"""
+    with open(os.path.join(FILES_DIR, "legistar_api_events.json"), "r") as f:
+        api_events = json.load(f)
+    requests = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = {k: v[0] for k, v in parse_qs(url.query).items()}
+            requests.append((url.path, params))
+            since = re.search(r"datetime'([\d-]+)'", params["$filter"]).group(1)
+            skip, top = int(params["$skip"]), int(params["$top"])
+            events = [e for e in api_events if e["EventDate"] >= since]
+            body = json.dumps(events[skip : skip + top]).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/v1", requests
+    server.shutdown()
+    server.server_close()
+
+
+def _crawl(spider):
+    """Fetch requests and run callbacks until no requests are left"""
+    results = []
+    pending = list(spider.start_requests())
+    while pending:
+        request = pending.pop(0)
+        with urlopen(request.url) as res:
+            response = TextResponse(request.url, body=res.read(), request=request)
+        for result in request.callback(response, **request.cb_kwargs):
+            if isinstance(result, Request):
+                pending.append(result)
+            else:
+                results.append(result)
+    return results
+
+
+def test_legistar_api_engine(legistar_api_server):
+    api_url, requests = legistar_api_server
+
+    class ApiLegistarSpider(LegistarSpider):
+        name = "city_scrapers"
+        start_urls = ["https://cityscrapers.legistar.com/Calendar.aspx"]
+        legistar_engine = "api"
+        legistar_api_url = api_url
+        legistar_api_page_size = 2
+        legistar_api_concurrency = 2
+
+        def parse_legistar(self, events):
+            yield from events
+
+    spider = ApiLegistarSpider()
+    spider.since_year = 2021
+    events = _crawl(spider)
+    # Full pages at 0 and 2 request the pages after the ones already in progress
+    assert [params["$skip"] for _, params in requests] == ["0", "2", "4", "6"]
+    assert all(path == "/v1/cityscrapers/events" for path, _ in requests)
+    assert len(events) == 5
+    event = events[0]
+    assert spider.legistar_start(event) == datetime(2021, 1, 13, 10)
+    assert spider.legistar_links(event) == [
+        {
+            "href": "https://cityscrapers.legistar1.com/cityscrapers/meetings/2021/1001_A_Agenda.pdf",  # noqa
+            "title": "Agenda",
+        },
+        {
+            "href": "https://cityscrapers.legistar1.com/cityscrapers/meetings/2021/1001_M_Minutes.pdf",  # noqa
+            "title": "Minutes",
+        },
+        {
+            "href": "https://cityscrapers.granicus.com/MediaPlayer.php?view_id=2&clip_id=1001",  # noqa
+            "title": "Video",
+        },
+    ]
+    assert event["Name"]["label"] == "City Council"
+    assert event["Meeting Location"] == "Council Chambers, City Hall"
+    assert spider.legistar_source(event).startswith(
+        "https://cityscrapers.legistar.com/MeetingDetail.aspx?LEGID=1001"
+    )
+    assert event["iCalendar"]["url"] == (
+        "https://cityscrapers.legistar.com/View.ashx?M=IC&ID=1001"
+        "&GUID=000003E9-0000-4000-8000-0000000003E9"
+    )
+    assert spider.legistar_source(events[3]) == spider.start_urls[0]
+    assert spider.legistar_links(events[3]) == []
+    # Events already scraped aren't returned again
+    with open(os.path.join(FILES_DIR, "legistar_api_events.json"), "r") as f:
+        assert spider._parse_legistar_api_events(json.load(f)) == []